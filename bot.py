@@ -3,22 +3,38 @@ import asyncio
 import logging
 import sys
 import os
+import time
+from functools import partial
 
 from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import config
 from database import init_db
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    stream=sys.stdout
+from fsm_storage import build_fsm_storage
+import logging_setup
+from logging_setup import setup_logging, set_level, levels
+from metrics import registry, loop_lag, cache_metrics, metrics_view
+from middlewares import LogContextMiddleware, SingleFlightMiddleware
+from middlewares.metrics import HandlerMetricsMiddleware, TelegramMetricsMiddleware
+from middlewares.tracing import (
+    UpdateTracingMiddleware, TracedMiddleware, HandlerTracingMiddleware, TelegramTracingMiddleware
 )
+from tracing import tracer, traces_view
+from keyboards import MarkupCacheSession
+from rate_limiter import token_buckets
+from send_queue import outbox
+from broadcast import broadcaster
+from yookassa_client import yookassa
+from payment_events import payment_events
+from scheduler import scheduler
+from jobs import setup_jobs
+from update_engine import UpdateEngine, EngineRequestHandler, dispatcher_processor
+from cluster import WorkerPool, serve_worker
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
 WEBHOOK_HOST = os.getenv("RAILWAY_PUBLIC_DOMAIN", os.getenv("WEBHOOK_HOST", ""))
@@ -28,19 +44,86 @@ PORT = int(os.getenv("PORT", 8080))
 
 bot = Bot(
     token=config.BOT_TOKEN,
+    session=MarkupCacheSession(),
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
-dp = Dispatcher(storage=MemoryStorage())
+bot.session.middleware(TelegramMetricsMiddleware())
+bot.session.middleware(TelegramTracingMiddleware())
+outbox.bind(bot)
+dp = Dispatcher(storage=build_fsm_storage())
+single_flight = SingleFlightMiddleware()
 
 
 def setup_dp():
     from middlewares import RateLimitMiddleware
-    dp.message.middleware(RateLimitMiddleware())
-    dp.callback_query.middleware(RateLimitMiddleware())
+    dp.update.outer_middleware(LogContextMiddleware())
+    dp.update.outer_middleware(UpdateTracingMiddleware())
+    dp.message.middleware(TracedMiddleware(RateLimitMiddleware()))
+    dp.callback_query.middleware(TracedMiddleware(RateLimitMiddleware()))
+    dp.callback_query.middleware(TracedMiddleware(single_flight))
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    dp.message.middleware(HandlerTracingMiddleware())
+    dp.callback_query.middleware(HandlerTracingMiddleware())
     from handlers import setup_routers
     dp.include_router(setup_routers())
 
 
+def register_metrics(engine: UpdateEngine = None, pool: WorkerPool = None):
+    """Метрики компонентов, созданных здесь: очереди, FSM, single-flight"""
+    storage = dp.storage
+    if hasattr(storage, "hits"):
+        cache_metrics("fsm", lambda: (storage.hits, storage.misses))
+    cache_metrics("markups", lambda: (bot.session.hits, bot.session.misses))
+
+    # COUNT(*) по fsm_sessions — не чаще раза в минуту, сколько бы ни скрейпили
+    fsm_sessions = registry.gauge("bot_fsm_sessions", "Stored FSM sessions").labels()
+    counted = [0.0]
+
+    async def count_fsm_sessions():
+        if hasattr(storage, "count") and time.monotonic() - counted[0] > 60:
+            counted[0] = time.monotonic()
+            fsm_sessions.set(await storage.count())
+
+    registry.on_scrape(count_fsm_sessions)
+
+    def queue_depths():
+        depths = {"log": logging_setup.stats()["queued"]}
+        if engine is not None:
+            depths["updates"] = engine.pending
+        return depths
+
+    registry.callback("bot_queue_depth", "Items waiting in queue", "gauge", queue_depths, ("queue",))
+    registry.callback("bot_log_dropped_total", "Log records dropped on full queue", "counter",
+                      lambda: logging_setup.stats()["dropped"])
+    registry.callback("bot_rate_limit_buckets", "Live in-memory rate-limit buckets", "gauge",
+                      lambda: len(token_buckets))
+
+    registry.callback("bot_single_flight_in_flight", "Single-flight tasks running", "gauge",
+                      lambda: single_flight.stats()["in_flight"])
+    registry.callback("bot_single_flight_started_total", "Single-flight tasks started", "counter",
+                      lambda: single_flight.stats()["started"], ("name",))
+    registry.callback("bot_single_flight_suppressed_total", "Duplicate actions attached to a running task",
+                      "counter", lambda: single_flight.stats()["suppressed"], ("name",))
+
+    if engine is not None:
+        for field in ("processed", "failed", "rejected", "dropped"):
+            registry.callback(f"bot_updates_{field}_total", f"Updates {field}", "counter",
+                              lambda field=field: getattr(engine, field))
+        registry.callback("bot_update_active_chats", "Chats with queued updates", "gauge",
+                          lambda: engine.stats()["active_chats"])
+
+    if pool is not None:
+        registry.callback("bot_workers_alive", "Live worker processes", "gauge",
+                          lambda: pool.stats()["alive"])
+        registry.callback("bot_updates_routed_total", "Updates routed to workers", "counter",
+                          lambda: pool.routed)
+        registry.callback("bot_updates_rejected_total", "Updates rejected by the front", "counter",
+                          lambda: pool.rejected)
+        registry.callback("bot_worker_buffer_bytes", "Bytes waiting in worker socket", "gauge",
+                          lambda: pool.stats()["buffered"], ("worker",))
+
+
 async def set_webhook_with_retry():
     """Устанавливаем webhook с повторными попытками"""
     for attempt in range(5):
@@ -81,30 +164,60 @@ async def on_app_startup(app: web.Application):
     await init_db()
     logger.info("Database OK")
 
+    setup_jobs(scheduler, fsm_storage=dp.storage)
+    scheduler.start()
+    broadcaster.resume()
+    payment_events.start()
+    loop_lag.start()
+    tracer.start()
+    if "worker_pool" in app:
+        await app["worker_pool"].start()
+    else:
+        app["update_engine"].start()
+
     # Ставим webhook через 3 секунды (сервер уже слушает)
     asyncio.create_task(set_webhook_with_retry())
 
 
 async def on_app_shutdown(app: web.Application):
     logger.info("Shutting down...")
+    await broadcaster.stop()
+    await payment_events.stop()
+    await scheduler.stop()
+    await yookassa.close()
+    await loop_lag.stop()
+    await tracer.stop()
+    if "worker_pool" in app:
+        await app["worker_pool"].close(timeout=config.UPDATE_DRAIN_TIMEOUT + 5)
     try:
         await bot.delete_webhook()
         await bot.session.close()
+        await dp.storage.close()
     except Exception:
         pass
 
 
-def create_app() -> web.Application:
-    setup_dp()
+def _make_engine() -> UpdateEngine:
+    return UpdateEngine(
+        dispatcher_processor(dp, bot),
+        workers=config.UPDATE_WORKERS,
+        max_pending=config.UPDATE_QUEUE_LIMIT,
+        max_per_chat=config.UPDATE_CHAT_QUEUE_LIMIT
+    )
+
+
+def create_app(pool: WorkerPool = None) -> web.Application:
+    """pool — многопроцессный режим: апдейты обрабатывают воркеры, здесь только маршрутизация"""
     app = web.Application()
 
-    # Логируем ВСЕ запросы
+    # Лог запросов — одна DEBUG-строка, при уровне INFO не стоит ничего
     @web.middleware
     async def log_all(request, handler):
-        logger.info(f">>> {request.method} {request.path} [{request.content_type}] from {request.remote}")
+        started = time.monotonic()
         try:
             response = await handler(request)
-            logger.info(f"<<< {response.status}")
+            logger.debug("%s %s -> %s in %.1f ms", request.method, request.path,
+                         response.status, (time.monotonic() - started) * 1000)
             return response
         except Exception as e:
             logger.error(f"!!! Handler error: {e}", exc_info=True)
@@ -112,8 +225,19 @@ def create_app() -> web.Application:
 
     app.middlewares.append(log_all)
 
-    # ─── Telegram webhook ───
-    SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path=WEBHOOK_PATH)
+    # ─── Telegram webhook: сразу 200, обработка в пуле воркеров ───
+    if pool is not None:
+        app["worker_pool"] = pool
+        app.router.add_post(WEBHOOK_PATH, pool.webhook)
+        register_metrics(pool=pool)
+    else:
+        setup_dp()
+        engine = _make_engine()
+        app["update_engine"] = engine
+        EngineRequestHandler(
+            dispatcher=dp, bot=bot, engine=engine, drain_timeout=config.UPDATE_DRAIN_TIMEOUT
+        ).register(app, path=WEBHOOK_PATH)
+        register_metrics(engine=engine)
 
     # ─── Health ───
     async def health(request):
@@ -122,6 +246,22 @@ def create_app() -> web.Application:
     app.router.add_get("/", health)
     app.router.add_get("/health", health)
 
+    # ─── Служебные эндпоинты: только с X-Admin-Token, без токена — 404 ───
+    def admin_only(view):
+        async def guarded(request):
+            if not config.ADMIN_TOKEN or request.headers.get("X-Admin-Token") != config.ADMIN_TOKEN:
+                return web.Response(status=404)
+            return await view(request)
+        return guarded
+
+    # ─── Метрики Prometheus; в кластере метрики воркера — /metrics?worker=N ───
+    async def metrics(request):
+        if pool is not None and "worker" in request.query:
+            return await pool.proxy(request)
+        return await metrics_view(request)
+
+    app.router.add_get("/metrics", admin_only(metrics))
+
     # ─── Тест: GET /webhook ───
     async def test_wh(request):
         info = await bot.get_webhook_info()
@@ -153,20 +293,45 @@ def create_app() -> web.Application:
 
     app.router.add_get("/set", force_set_webhook)
 
-    # ─── ЮKassa ───
+    # ─── ЮKassa: событие записывается и сразу 200, применяется в фоне ───
     async def yukassa_handler(request):
         try:
-            from payment_service import payment_service
             data = await request.json()
-            result = await payment_service.process_webhook(data)
-            if result.get("status") == "succeeded" and result.get("telegram_id"):
-                await bot.send_message(result["telegram_id"], "🎉 Premium активирован!")
+        except ValueError:
+            return web.Response(status=400)
+        try:
+            if not await payment_events.ingest(data):
+                return web.Response(status=400)
         except Exception as e:
+            # Не записали — пусть ЮKassa повторит
             logger.error(f"YooKassa: {e}")
+            return web.Response(status=500)
         return web.Response(status=200)
 
     app.router.add_post("/payment/callback", yukassa_handler)
 
+    # ─── Админка: уровни логов на ходу ───
+    async def log_levels(request):
+        """GET — текущие уровни; POST ?logger=handlers.shopping&level=DEBUG — сменить"""
+        if request.method == "POST":
+            try:
+                set_level(request.query.get("logger", ""), request.query["level"])
+            except (KeyError, ValueError) as e:
+                return web.Response(status=400, text=f"Bad level: {e}")
+        return web.json_response(levels())
+
+    app.router.add_route("GET", "/admin/log-level", admin_only(log_levels))
+    app.router.add_route("POST", "/admin/log-level", admin_only(log_levels))
+
+    # ─── Админка: самые медленные трассы (в кластере — ?worker=N) ───
+    async def traces(request):
+        if pool is not None and "worker" in request.query:
+            return await pool.proxy(request)
+        return await traces_view(request)
+
+    app.router.add_get("/admin/traces", admin_only(traces))
+    app.router.add_get("/admin/traces/{trace_id}", admin_only(traces))
+
     # Lifecycle
     app.on_startup.append(on_app_startup)
     app.on_shutdown.append(on_app_shutdown)
@@ -177,9 +342,67 @@ def create_app() -> web.Application:
 async def run_polling():
     setup_dp()
     await init_db()
+    setup_jobs(scheduler, fsm_storage=dp.storage)
+    scheduler.start()
+    broadcaster.resume()
+    loop_lag.start()
+    tracer.start()
     await bot.delete_webhook(drop_pending_updates=True)
     logger.info("Polling mode...")
-    await dp.start_polling(bot, drop_pending_updates=True)
+    try:
+        await dp.start_polling(bot, drop_pending_updates=True)
+    finally:
+        await broadcaster.stop()
+        await loop_lag.stop()
+        await tracer.stop()
+        await scheduler.stop()
+        await yookassa.close()
+
+
+async def run_worker(sock, admin_path: str, workers: int = 1):
+    """Процесс-воркер кластера: обрабатывает апдейты своих чатов до закрытия сокета"""
+    # Общий темп отправки делится на воркеры и фронт (рассылки, платежи)
+    outbox.scale(workers + 1)
+    setup_dp()
+    engine = _make_engine()
+    engine.start()
+    register_metrics(engine=engine)
+    # Задачи по БД выполняет фронт, здесь — только чистка кэшей процесса
+    setup_jobs(scheduler, fsm_storage=dp.storage, shared=False)
+    scheduler.start()
+    loop_lag.start()
+    tracer.start()
+
+    # Метрики и трассы воркера — на unix-сокете, фронт проксирует их
+    admin_app = web.Application()
+    admin_app.router.add_get("/metrics", metrics_view)
+    admin_app.router.add_get("/admin/traces", traces_view)
+    admin_app.router.add_get("/admin/traces/{trace_id}", traces_view)
+    runner = web.AppRunner(admin_app, access_log=None)
+    await runner.setup()
+    await web.UnixSite(runner, admin_path).start()
+    try:
+        await serve_worker(sock, engine.submit)
+    finally:
+        await engine.stop(config.UPDATE_DRAIN_TIMEOUT)
+        await runner.cleanup()
+        if os.path.exists(admin_path):
+            os.remove(admin_path)
+        await loop_lag.stop()
+        await tracer.stop()
+        await scheduler.stop()
+        await yookassa.close()
+        await bot.session.close()
+        await dp.storage.close()
+
+
+def workers_arg() -> int:
+    for i, arg in enumerate(sys.argv):
+        if arg == "--workers" and i + 1 < len(sys.argv):
+            return int(sys.argv[i + 1])
+        if arg.startswith("--workers="):
+            return int(arg.split("=", 1)[1])
+    return config.WORKERS
 
 
 if __name__ == "__main__":
@@ -190,5 +413,13 @@ if __name__ == "__main__":
             logger.error("Set RAILWAY_PUBLIC_DOMAIN!")
             sys.exit(1)
         logger.info(f"URL: {WEBHOOK_URL} | Port: {PORT}")
-        app = create_app()
+        workers = workers_arg()
+        if workers > 1 and config.DATABASE_URL.startswith("sqlite"):
+            logger.warning("Several workers share a SQLite file — use PostgreSQL under load")
+        pool = None
+        if workers > 1:
+            # Фронт тоже отправляет — рассылки и уведомления о платежах
+            outbox.scale(workers + 1)
+            pool = WorkerPool(workers, partial(run_worker, workers=workers))
+        app = create_app(pool)
         web.run_app(app, host="0.0.0.0", port=PORT)
@@ -0,0 +1,182 @@
+# broadcast.py
+"""
+Рассылки: напоминание об окончании Premium и ежедневное «что приготовить».
+
+Кампания — одна рассылка одного вида за один день (ключ "вид:дата").
+Аудитория читается из БД пачками по keyset, пачка рендерится и целиком
+уходит в outbox с bulk=True: темп ограничен долей SEND_BULK_SHARE общего
+лимита, интерактивные ответы идут вперёд. После каждой пачки в campaigns
+пишется чекпоинт (last_user_id и счётчики), поэтому после рестарта
+кампания продолжается с места остановки — повторно может уйти только
+пачка, которая отправлялась в момент падения. Продолжаются только
+кампании за сегодня: вчерашнее «что приготовить» уже неактуально,
+такие кампании помечаются abandoned.
+
+Кто заблокировал бота (403), помечается users.is_blocked и в следующие
+пачки и кампании не попадает; флаг снимается, когда пользователь снова
+пишет боту.
+
+Время кампании предсказуемо: аудитория / (SEND_GLOBAL_RATE * SEND_BULK_SHARE).
+"""
+import asyncio
+import html
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, NamedTuple
+
+from aiogram.exceptions import TelegramForbiddenError
+from sqlalchemy import or_
+
+from config import config
+from database import UserDB, CampaignDB
+from keyboards import premium_keyboard
+from metrics import registry
+from models import User
+from send_queue import outbox
+
+logger = logging.getLogger(__name__)
+
+
+class CampaignKind(NamedTuple):
+    audience: Callable[[date], list]  # день → условия WHERE по users
+    render: Callable[..., str]  # (строка пачки, день) → текст
+    reply_markup: object = None
+
+
+def _premium_expiry_audience(day: date) -> list:
+    """Premium заканчивается ровно через 3 дня"""
+    start = datetime.combine(day + timedelta(days=3), datetime.min.time())
+    return [User.is_premium == True, User.premium_until >= start,
+            User.premium_until < start + timedelta(days=1)]
+
+
+def _premium_expiry_text(row, day: date) -> str:
+    name = html.escape(row.full_name or "")
+    greeting = f"{name}, в" if name else "В"
+    return (
+        f"⏳ {greeting}аш Premium закончится {row.premium_until:%d.%m}.\n\n"
+        f"Продлите подписку, чтобы и дальше получать рецепты без ограничений "
+        f"и меню на неделю."
+    )
+
+
+def _nudge_audience(day: date) -> list:
+    """Активные за последние NUDGE_ACTIVE_DAYS дней"""
+    since = day - timedelta(days=config.NUDGE_ACTIVE_DAYS)
+    return [or_(User.last_recipe_date >= since,
+                User.created_at >= datetime.combine(since, datetime.min.time()))]
+
+
+def _nudge_text(row, day: date) -> str:
+    return (
+        "🍳 Что приготовить сегодня?\n\n"
+        "Напишите, что есть в холодильнике, или пришлите фото — подберу рецепт."
+    )
+
+
+KINDS = {
+    "premium_expiry": CampaignKind(_premium_expiry_audience, _premium_expiry_text,
+                                   premium_keyboard()),
+    "daily_nudge": CampaignKind(_nudge_audience, _nudge_text),
+}
+
+
+class Broadcaster:
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._runs: dict[str, asyncio.Task] = {}
+        self.sent = 0
+        self.failed = 0
+
+    async def run(self, kind: str, day: date = None):
+        """Запуск (или ожидание уже идущей) кампании за день — годится как задача планировщика"""
+        day = day or datetime.utcnow().date()
+        await self._start(f"{kind}:{day.isoformat()}", kind, day)
+
+    def resume(self):
+        """Продолжить прерванные рестартом кампании — вызывается при старте"""
+        async def resume_all():
+            try:
+                today = datetime.utcnow().date()
+                abandoned = await CampaignDB.abandon_before(today)
+                if abandoned:
+                    logger.info(f"Abandoned {abandoned} unfinished campaigns from previous days")
+                for campaign in await CampaignDB.get_running():
+                    if campaign.kind in KINDS:
+                        logger.info(f"Resuming campaign {campaign.key} after user "
+                                    f"{campaign.last_user_id}")
+                        self._start(campaign.key, campaign.kind, campaign.day)
+            except Exception as e:
+                logger.error(f"Campaign resume failed: {e}", exc_info=True)
+
+        task = asyncio.create_task(resume_all(), name="campaign-resume")
+        self._runs["_resume"] = task
+        task.add_done_callback(lambda t: self._runs.pop("_resume", None))
+
+    def _start(self, key: str, kind: str, day: date) -> asyncio.Task:
+        task = self._runs.get(key)
+        if task is None:
+            task = self._runs[key] = asyncio.create_task(self._run(key, kind, day),
+                                                         name=f"campaign:{key}")
+            task.add_done_callback(lambda t: self._runs.pop(key, None))
+        return task
+
+    async def stop(self):
+        """Прервать идущие кампании — продолжатся со своего чекпоинта"""
+        tasks = list(self._runs.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, key: str, kind: str, day: date):
+        spec = KINDS[kind]
+        where = spec.audience(day)
+        campaign = await CampaignDB.start(key, kind, day, where)
+        if campaign.status != "running":
+            return
+
+        cursor, sent, failed = campaign.last_user_id, campaign.sent, campaign.failed
+        blocked_total = 0
+        kwargs = {"reply_markup": spec.reply_markup} if spec.reply_markup else {}
+        started = time.monotonic()
+        async for rows in UserDB.iter_batches(where, self.batch_size, after_id=cursor):
+            futures = [
+                outbox.enqueue(row.telegram_id, spec.render(row, day), bulk=True, **kwargs)
+                for row in rows
+            ]
+            # При отмене gather отменяет futures, и outbox не отправит то, что ещё не ушло
+            results = await asyncio.gather(*futures, return_exceptions=True)
+            errors = sum(isinstance(r, Exception) for r in results)
+            blocked = [row.telegram_id for row, r in zip(rows, results)
+                       if isinstance(r, TelegramForbiddenError)]
+            if blocked:
+                await UserDB.mark_blocked(blocked)
+                blocked_total += len(blocked)
+            if errors:
+                logger.debug(f"Campaign {key}: {errors} failed in batch, "
+                             f"{len(blocked)} blocked the bot")
+            sent += len(results) - errors
+            failed += errors
+            self.sent += len(results) - errors
+            self.failed += errors
+            cursor = rows[-1].id
+            await CampaignDB.checkpoint(key, cursor, sent, failed)
+            logger.debug(f"Campaign {key}: {sent + failed}/{campaign.total}")
+
+        await CampaignDB.checkpoint(key, cursor, sent, failed, done=True)
+        # Итог пишется и для продолжённых после рестарта кампаний, не только из планировщика
+        logger.info(f"Campaign {key}: sent={sent} failed={failed} blocked={blocked_total} "
+                    f"in {time.monotonic() - started:.0f}s")
+
+    def stats(self) -> dict:
+        return {"running": sum(1 for key in self._runs if key != "_resume"),
+                "sent": self.sent, "failed": self.failed}
+
+
+broadcaster = Broadcaster(batch_size=config.CAMPAIGN_BATCH_SIZE)
+
+registry.callback("bot_campaigns_running", "Broadcast campaigns in progress", "gauge",
+                  lambda: broadcaster.stats()["running"])
+registry.callback("bot_campaign_messages_total", "Broadcast messages by result", "counter",
+                  lambda: {"sent": broadcaster.sent, "failed": broadcaster.failed}, ("result",))
@@ -0,0 +1,180 @@
+# cluster.py
+"""
+Многопроцессный режим: python bot.py --workers N
+
+Фронт-процесс принимает webhook, отвечает Telegram и пересылает апдейт
+воркеру по хэшу chat_id через локальный сокет (кадр = 4 байта длины +
+JSON). Все апдейты одного чата попадают в один воркер, поэтому порядок
+и кэши в памяти воркера (FSM, рецепты, лимиты) остаются согласованными.
+Общее состояние (БД, Redis) разделяется через штатные бэкенды.
+Упавший воркер перезапускается.
+
+Метрики и трассы воркера отдаются через unix-сокет, фронт проксирует
+их: /metrics?worker=N, /admin/traces?worker=N.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import socket
+import struct
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiohttp import web, ClientSession, UnixConnector
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+# Сколько байт может скопиться в сокете воркера, прежде чем фронт ответит 503
+MAX_BUFFERED = 8 * 1024 * 1024
+
+# worker_main(sock, admin_path): сокет с апдейтами и путь unix-сокета для метрик/трасс
+WorkerMain = Callable[[socket.socket, str], Awaitable[None]]
+
+
+def chat_of(update: Dict[str, Any]) -> Optional[int]:
+    """chat_id апдейта — для сообщений и нажатий кнопок"""
+    for field in ("message", "edited_message", "business_message", "edited_business_message",
+                  "channel_post", "edited_channel_post"):
+        message = update.get(field)
+        if message:
+            return message["chat"]["id"]
+    callback = update.get("callback_query")
+    if callback:
+        message = callback.get("message")
+        return message["chat"]["id"] if message else callback["from"]["id"]
+    for field in ("inline_query", "pre_checkout_query", "shipping_query", "my_chat_member"):
+        event = update.get(field)
+        if event and event.get("from"):
+            return event["from"]["id"]
+    return None
+
+
+def _worker_entry(index: int, sock: socket.socket, admin_path: str, worker_main: WorkerMain):
+    # Воркер завершается по EOF из сокета, дорабатывая очередь, —
+    # сигналы остановки получает только фронт
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logger.info(f"Worker {index} started")
+    asyncio.run(worker_main(sock, admin_path))
+
+
+async def serve_worker(sock: socket.socket, submit: Callable[[Dict[str, Any]], bool]):
+    """Цикл воркера: читает кадры из сокета, пока фронт не закроет соединение"""
+    reader, writer = await asyncio.open_connection(sock=sock)
+    try:
+        while True:
+            try:
+                header = await reader.readexactly(_HEADER.size)
+                body = await reader.readexactly(_HEADER.unpack(header)[0])
+            except asyncio.IncompleteReadError:
+                return
+            update = json.loads(body)
+            if not submit(update):
+                logger.warning(f"Worker queue full, update {update.get('update_id')} dropped")
+    finally:
+        writer.close()
+
+
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.admin_path = os.path.join(tempfile.gettempdir(), f"bot-{os.getpid()}-worker-{index}.sock")
+        self.process: Optional[multiprocessing.Process] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+
+class WorkerPool:
+    def __init__(self, size: int, worker_main: WorkerMain):
+        self.worker_main = worker_main
+        self.workers = [_Worker(i) for i in range(size)]
+        # spawn: чистый процесс без унаследованного event loop и соединений
+        self._ctx = multiprocessing.get_context("spawn")
+        self._monitor: Optional[asyncio.Task] = None
+        self.routed = 0
+        self.rejected = 0
+
+    async def _spawn(self, worker: _Worker):
+        front, back = socket.socketpair()
+        worker.process = self._ctx.Process(
+            target=_worker_entry, args=(worker.index, back, worker.admin_path, self.worker_main),
+            name=f"bot-worker-{worker.index}", daemon=True
+        )
+        worker.process.start()
+        back.close()
+        _, worker.writer = await asyncio.open_connection(sock=front)
+
+    async def start(self):
+        for worker in self.workers:
+            await self._spawn(worker)
+        self._monitor = asyncio.create_task(self._watch())
+        logger.info(f"Cluster started: {len(self.workers)} workers")
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(5)
+            for worker in self.workers:
+                if not worker.process.is_alive():
+                    logger.error(f"Worker {worker.index} died "
+                                 f"(exit {worker.process.exitcode}), restarting")
+                    worker.writer.close()
+                    await self._spawn(worker)
+
+    def route(self, update: Dict[str, Any], body: bytes) -> bool:
+        chat_id = chat_of(update)
+        key = chat_id if chat_id is not None else update.get("update_id", 0)
+        worker = self.workers[hash(key) % len(self.workers)]
+        transport = worker.writer.transport
+        if transport.is_closing() or transport.get_write_buffer_size() > MAX_BUFFERED:
+            self.rejected += 1
+            return False
+        worker.writer.write(_HEADER.pack(len(body)) + body)
+        self.routed += 1
+        return True
+
+    async def webhook(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        if not self.route(json.loads(body), body):
+            return web.Response(status=503, text="Busy")
+        return web.json_response({})
+
+    async def proxy(self, request: web.Request) -> web.Response:
+        """Тот же GET-запрос к воркеру N (?worker=N) через его unix-сокет"""
+        try:
+            worker = self.workers[int(request.query["worker"])]
+        except (ValueError, IndexError):
+            return web.Response(status=404)
+        query = {k: v for k, v in request.query.items() if k != "worker"}
+        try:
+            async with ClientSession(connector=UnixConnector(path=worker.admin_path)) as session:
+                async with session.get(f"http://worker{request.path}", params=query) as response:
+                    return web.Response(status=response.status, body=await response.read(),
+                                        content_type=response.content_type)
+        except OSError as e:
+            return web.Response(status=503, text=f"Worker {worker.index} unavailable: {e}")
+
+    async def close(self, timeout: float):
+        if self._monitor:
+            self._monitor.cancel()
+        # EOF в сокете — воркер дорабатывает очередь и выходит
+        for worker in self.workers:
+            worker.writer.close()
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            await loop.run_in_executor(None, worker.process.join, timeout)
+            if worker.process.is_alive():
+                logger.warning(f"Worker {worker.index} did not stop in {timeout}s, killing")
+                worker.process.kill()
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.workers),
+            "alive": sum(w.process.is_alive() for w in self.workers if w.process),
+            "routed": self.routed,
+            "buffered": {w.index: w.writer.transport.get_write_buffer_size()
+                         for w in self.workers if w.writer},
+            "rejected": self.rejected,
+        }
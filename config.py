@@ -18,10 +18,57 @@ class Config:
 
     YUKASSA_SHOP_ID: str = os.getenv("YUKASSA_SHOP_ID", "")
     YUKASSA_SECRET_KEY: str = os.getenv("YUKASSA_SECRET_KEY", "")
+    YUKASSA_CLIENT: str = os.getenv("YUKASSA_CLIENT", "async")  # async | thread (SDK в потоках)
+    YUKASSA_TIMEOUT: float = float(os.getenv("YUKASSA_TIMEOUT", 10))
+    YUKASSA_RETRIES: int = int(os.getenv("YUKASSA_RETRIES", 3))
+    # Сверка pending-платежей старше N минут, параллельных запросов к ЮKassa
+    RECONCILE_AFTER_MINUTES: int = int(os.getenv("RECONCILE_AFTER_MINUTES", 5))
+    RECONCILE_CONCURRENCY: int = int(os.getenv("RECONCILE_CONCURRENCY", 5))
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///whattoeat.db")
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+    # ─── FSM: db (таблица fsm_sessions), redis или memory ───
+    FSM_STORAGE: str = os.getenv("FSM_STORAGE", "db")
+    FSM_SESSION_TTL: int = int(os.getenv("FSM_SESSION_TTL", 24 * 3600))  # сек простоя
+    FSM_CACHE_SIZE: int = int(os.getenv("FSM_CACHE_SIZE", 2000))
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | redis
+    RECIPE_CACHE_SIZE: int = int(os.getenv("RECIPE_CACHE_SIZE", 1000))
+    ENTITLEMENT_CACHE_SIZE: int = int(os.getenv("ENTITLEMENT_CACHE_SIZE", 10000))
+    ENTITLEMENT_TTL: float = float(os.getenv("ENTITLEMENT_TTL", 300))  # сек, строка users не перечитывается
+
+    # ─── Фоновая обработка апдейтов из webhook ───
+    UPDATE_WORKERS: int = int(os.getenv("UPDATE_WORKERS", 32))
+    UPDATE_QUEUE_LIMIT: int = int(os.getenv("UPDATE_QUEUE_LIMIT", 5000))
+    UPDATE_CHAT_QUEUE_LIMIT: int = int(os.getenv("UPDATE_CHAT_QUEUE_LIMIT", 20))
+    UPDATE_DRAIN_TIMEOUT: float = float(os.getenv("UPDATE_DRAIN_TIMEOUT", 25))
+    # ─── Исходящие сообщения: общий темп (сообщ./сек), темп и всплеск на чат ───
+    SEND_GLOBAL_RATE: float = float(os.getenv("SEND_GLOBAL_RATE", 25))
+    SEND_CHAT_RATE: float = float(os.getenv("SEND_CHAT_RATE", 1))
+    SEND_CHAT_BURST: float = float(os.getenv("SEND_CHAT_BURST", 3))
+    SEND_BULK_SHARE: float = float(os.getenv("SEND_BULK_SHARE", 0.7))  # доля для рассылок
+    # ─── Рассылки: пользователей на пачку; «что приготовить» — активным за N дней (0 — выкл.) ───
+    CAMPAIGN_BATCH_SIZE: int = int(os.getenv("CAMPAIGN_BATCH_SIZE", 200))
+    NUDGE_ACTIVE_DAYS: int = int(os.getenv("NUDGE_ACTIVE_DAYS", 14))
+
+    # ─── Логи: LOG_LEVELS / LOG_SAMPLING — "логгер=значение,..." ───
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")  # json | text
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "aiogram.event=WARNING,aiohttp.access=WARNING")
+    LOG_SAMPLING: str = os.getenv("LOG_SAMPLING", "")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    # ─── Трассировка: доля апдейтов, экспорт file | otlp | пусто ───
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", 0.05))
+    TRACE_KEEP_SLOWEST: int = int(os.getenv("TRACE_KEEP_SLOWEST", 50))
+    TRACE_EXPORT: str = os.getenv("TRACE_EXPORT", "")
+    TRACE_FILE: str = os.getenv("TRACE_FILE", "traces.jsonl")
+    TRACE_OTLP_URL: str = os.getenv("TRACE_OTLP_URL", "http://localhost:4318/v1/traces")
+    # Токен для /admin/* и /metrics (заголовок X-Admin-Token); пустой — они выключены
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+
+    # Процессов-воркеров (переопределяется --workers N); 1 — всё в одном процессе
+    WORKERS: int = int(os.getenv("WORKERS", 1))
 
     FREE_RECIPES_PER_DAY: int = 3
-    PREMIUM_PRICE_RUB: int = 490
     MAX_VOICE_DURATION: int = 60
     MAX_PHOTO_SIZE: int = 20
 
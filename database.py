@@ -1,20 +1,30 @@
 # database.py
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy import select, update
-from datetime import datetime, timedelta, date
-from typing import Optional
+import re
+from sqlalchemy import select, update, delete, and_, or_, text, func
+from datetime import datetime, timedelta, date, time
+from typing import Optional, NamedTuple
 
 from config import config
-from models import Base, User, SavedRecipe, MealPlan, Payment
+from models import (
+    Base, User, Recipe, SavedRecipe, MealPlan, Payment, PaymentEvent, DailyUsage, Campaign,
+    PantryItem, canonical_recipe, recipe_hash, insert_ignore, upsert
+)
+from migrations import run_migrations
+from metrics import instrument_db
+from tracing import trace_queries
 
 
 engine = create_async_engine(config.DATABASE_URL, echo=False)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+instrument_db(engine)
+trace_queries(engine)
 
 
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
 
 
 async def get_session() -> AsyncSession:
@@ -22,6 +32,15 @@ async def get_session() -> AsyncSession:
         yield session
 
 
+def _extend_premium(user: User, months: int):
+    now = datetime.utcnow()
+    if user.premium_until and user.premium_until > now:
+        user.premium_until += timedelta(days=30 * months)
+    else:
+        user.premium_until = now + timedelta(days=30 * months)
+    user.is_premium = True
+
+
 class UserDB:
     @staticmethod
     async def get_or_create(telegram_id: int, username: str = None,
@@ -46,6 +65,7 @@ class UserDB:
             else:
                 user.username = username
                 user.full_name = full_name
+                user.is_blocked = False
                 await session.commit()
 
             return user
@@ -85,51 +105,181 @@ class UserDB:
             )
             user = result.scalar_one_or_none()
             if user:
+                _extend_premium(user, months)
+                await session.commit()
+
+    @staticmethod
+    async def check_expired_premiums(batch_size: int = 500) -> int:
+        """Снимает истёкший Premium пачками, чтобы не держать длинную транзакцию"""
+        total = 0
+        while True:
+            async with async_session() as session:
                 now = datetime.utcnow()
-                if user.premium_until and user.premium_until > now:
-                    user.premium_until += timedelta(days=30 * months)
-                else:
-                    user.premium_until = now + timedelta(days=30 * months)
-                user.is_premium = True
+                result = await session.execute(
+                    select(User.id)
+                    .where(User.is_premium == True, User.premium_until < now)
+                    .limit(batch_size)
+                )
+                ids = result.scalars().all()
+                if not ids:
+                    return total
+                await session.execute(
+                    update(User).where(User.id.in_(ids)).values(is_premium=False)
+                )
                 await session.commit()
+            total += len(ids)
+            if len(ids) < batch_size:
+                return total
 
     @staticmethod
-    async def check_expired_premiums():
+    async def rollover_daily_usage(day: date, batch_size: int = 1000) -> DailyUsage:
+        """
+        Сводка за прошедший день в daily_usage + обнуление дневных счётчиков.
+        Повторный запуск за тот же день перезаписывает сводку.
+        """
+        async with async_session() as session:
+            active, recipes = (await session.execute(
+                select(func.count(User.id), func.coalesce(func.sum(User.recipes_today), 0))
+                .where(User.last_recipe_date == day)
+            )).one()
+            new_users = (await session.execute(
+                select(func.count(User.id))
+                .where(User.created_at >= datetime.combine(day, time.min),
+                       User.created_at < datetime.combine(day + timedelta(days=1), time.min))
+            )).scalar_one()
+            premium = (await session.execute(
+                select(func.count(User.id)).where(User.is_premium == True)
+            )).scalar_one()
+
+            stat = await session.get(DailyUsage, day) or DailyUsage(date=day)
+            stat.active_users = active
+            stat.recipes = recipes
+            stat.new_users = new_users
+            stat.premium_users = premium
+            session.add(stat)
+            await session.commit()
+
+        while True:
+            async with async_session() as session:
+                result = await session.execute(
+                    select(User.id)
+                    .where(User.last_recipe_date <= day, User.recipes_today > 0)
+                    .limit(batch_size)
+                )
+                ids = result.scalars().all()
+                if not ids:
+                    break
+                await session.execute(
+                    update(User).where(User.id.in_(ids)).values(recipes_today=0)
+                )
+                await session.commit()
+            if len(ids) < batch_size:
+                break
+
+        return stat
+
+    @staticmethod
+    async def count(where: list) -> int:
+        """Сколько пользователей из аудитории рассылки (без заблокировавших бота)"""
+        async with async_session() as session:
+            return (await session.execute(
+                select(func.count(User.id)).where(User.is_blocked == False, *where)
+            )).scalar_one()
+
+    @staticmethod
+    async def mark_blocked(telegram_ids: list[int]):
         async with async_session() as session:
-            now = datetime.utcnow()
             await session.execute(
-                update(User)
-                .where(User.is_premium == True, User.premium_until < now)
-                .values(is_premium=False)
+                update(User).where(User.telegram_id.in_(telegram_ids)).values(is_blocked=True)
             )
             await session.commit()
 
+    @staticmethod
+    async def iter_batches(where: list, batch_size: int = 500, after_id: int = 0):
+        """
+        Пользователи пачками по keyset (users.id > after_id): каждая пачка —
+        отдельный короткий запрос, без OFFSET и без загрузки всех сразу.
+        Заблокировавшие бота пропускаются.
+        """
+        while True:
+            async with async_session() as session:
+                result = await session.execute(
+                    select(User.id, User.telegram_id, User.full_name, User.premium_until)
+                    .where(User.id > after_id, User.is_blocked == False, *where)
+                    .order_by(User.id)
+                    .limit(batch_size)
+                )
+                rows = result.all()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1].id
+
+
+_WORD_RE = re.compile(r"[а-яёa-z0-9]+")
+_ENDINGS = "аеёиоуыэюяйь"
+
+
+def _search_terms(query: str) -> list[str]:
+    """
+    Слова запроса → префиксы для поиска.
+    Срезаем окончание, чтобы «курицу» нашла «курица», «куриный» и т.п.
+    """
+    terms = []
+    for word in _WORD_RE.findall(query.lower().replace("ё", "е")):
+        stem = word
+        while len(stem) > 3 and stem[-1] in _ENDINGS:
+            stem = stem[:-1]
+        terms.append(stem)
+    return terms[:8]
+
+
+class RecipePage(NamedTuple):
+    items: list[SavedRecipe]
+    has_older: bool
+    has_newer: bool
+
 
 class RecipeDB:
     @staticmethod
     async def save(user_telegram_id: int, recipe_data: dict) -> SavedRecipe:
+        """
+        Рецепт пишется в общую таблицу один раз (по хэшу общей части —
+        canonical_recipe), пользователю достаётся только ссылка. Повторное
+        сохранение — no-op, то же блюдо у другого пользователя — та же строка.
+        """
+        shared = canonical_recipe(recipe_data)
+        h = recipe_hash(shared)
+        dialect = engine.dialect.name
+
         async with async_session() as session:
             user_result = await session.execute(
-                select(User).where(User.telegram_id == user_telegram_id)
+                select(User.id).where(User.telegram_id == user_telegram_id)
             )
-            user = user_result.scalar_one()
+            user_id = user_result.scalar_one()
 
-            recipe = SavedRecipe(
-                user_id=user.id,
-                title=recipe_data.get("title", ""),
-                ingredients=recipe_data.get("ingredients", []),
-                instructions=recipe_data.get("instructions", ""),
-                calories=recipe_data.get("calories"),
-                proteins=recipe_data.get("proteins"),
-                fats=recipe_data.get("fats"),
-                carbs=recipe_data.get("carbs"),
-                estimated_cost=recipe_data.get("estimated_cost"),
-                cooking_time=recipe_data.get("cooking_time")
-            )
-            session.add(recipe)
+            await session.execute(
+                insert_ignore(dialect, Recipe.__table__).values(
+                    hash=h,
+                    **shared,
+                    data=recipe_data,
+                    created_at=datetime.utcnow()
+                )
+            )
+            await session.execute(
+                insert_ignore(dialect, SavedRecipe.__table__).values(
+                    user_id=user_id, recipe_hash=h, created_at=datetime.utcnow()
+                )
+            )
             await session.commit()
-            await session.refresh(recipe)
-            return recipe
+
+            result = await session.execute(
+                select(SavedRecipe)
+                .where(SavedRecipe.user_id == user_id, SavedRecipe.recipe_hash == h)
+            )
+            return result.scalar_one()
 
     @staticmethod
     async def get_user_recipes(telegram_id: int, limit: int = 20) -> list[SavedRecipe]:
@@ -143,6 +293,195 @@ class RecipeDB:
             )
             return result.scalars().all()
 
+    @staticmethod
+    async def get_user_recipes_page(telegram_id: int, limit: int = 10,
+                                    older_than: int = None,
+                                    newer_than: int = None) -> RecipePage:
+        """
+        Keyset-пагинация по (created_at, id): курсор — id крайнего рецепта
+        на текущей странице. Стоимость не зависит от номера страницы.
+        """
+        cursor_id = older_than or newer_than
+        newer = newer_than is not None
+
+        query = (
+            select(SavedRecipe)
+            .join(User)
+            .where(User.telegram_id == telegram_id)
+        )
+
+        if cursor_id is not None:
+            cursor_created = (
+                select(SavedRecipe.created_at)
+                .where(SavedRecipe.id == cursor_id)
+                .scalar_subquery()
+            )
+            if newer:
+                query = query.where(or_(
+                    SavedRecipe.created_at > cursor_created,
+                    and_(SavedRecipe.created_at == cursor_created,
+                         SavedRecipe.id > cursor_id)
+                ))
+            else:
+                query = query.where(or_(
+                    SavedRecipe.created_at < cursor_created,
+                    and_(SavedRecipe.created_at == cursor_created,
+                         SavedRecipe.id < cursor_id)
+                ))
+
+        if newer:
+            query = query.order_by(SavedRecipe.created_at.asc(), SavedRecipe.id.asc())
+        else:
+            query = query.order_by(SavedRecipe.created_at.desc(), SavedRecipe.id.desc())
+
+        async with async_session() as session:
+            result = await session.execute(query.limit(limit + 1))
+            rows = list(result.scalars().all())
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        if newer:
+            rows.reverse()
+            return RecipePage(rows, has_older=True, has_newer=has_more)
+        return RecipePage(rows, has_older=has_more, has_newer=cursor_id is not None)
+
+    @staticmethod
+    async def search(telegram_id: int, query: str, limit: int = 10) -> list[SavedRecipe]:
+        """Поиск по названию, шагам и ингредиентам — самые релевантные сверху"""
+        terms = _search_terms(query)
+        if not terms:
+            return []
+
+        dialect = engine.dialect.name
+        params = {"telegram_id": telegram_id, "limit": limit}
+        if dialect == "sqlite":
+            params["q"] = " ".join(f'"{t}"*' for t in terms)
+            sql = (
+                "SELECT s.id FROM recipes_fts f "
+                "JOIN saved_recipes s ON s.recipe_hash = f.hash "
+                "JOIN users u ON u.id = s.user_id "
+                "WHERE recipes_fts MATCH :q AND u.telegram_id = :telegram_id "
+                "ORDER BY f.rank LIMIT :limit"
+            )
+        elif dialect == "postgresql":
+            params["q"] = " & ".join(f"{t}:*" for t in terms)
+            vector = (
+                "to_tsvector('russian', coalesce(r.title, '') || ' ' || "
+                "coalesce(r.instructions, '') || ' ' || coalesce(r.ingredients::text, ''))"
+            )
+            sql = (
+                f"SELECT s.id FROM saved_recipes s "
+                f"JOIN recipes r ON r.hash = s.recipe_hash "
+                f"JOIN users u ON u.id = s.user_id "
+                f"WHERE u.telegram_id = :telegram_id "
+                f"AND {vector} @@ to_tsquery('russian', :q) "
+                f"ORDER BY ts_rank({vector}, to_tsquery('russian', :q)) DESC "
+                f"LIMIT :limit"
+            )
+        else:
+            return []
+
+        async with async_session() as session:
+            ids = [row[0] for row in await session.execute(text(sql), params)]
+            if not ids:
+                return []
+            result = await session.execute(
+                select(SavedRecipe).where(SavedRecipe.id.in_(ids))
+            )
+            by_id = {r.id: r for r in result.scalars().all()}
+            return [by_id[i] for i in ids if i in by_id]
+
+    @staticmethod
+    async def get_user_recipe(telegram_id: int, recipe_id: int) -> Optional[SavedRecipe]:
+        async with async_session() as session:
+            result = await session.execute(
+                select(SavedRecipe)
+                .join(User)
+                .where(User.telegram_id == telegram_id, SavedRecipe.id == recipe_id)
+            )
+            return result.scalar_one_or_none()
+
+
+class MealPlanDB:
+    @staticmethod
+    async def save(user_telegram_id: int, week_start: date, plan_data: dict,
+                   shopping_list: list[dict]):
+        """
+        Один план на неделю: повторное сохранение заменяет план этой недели.
+        Upsert по (user_id, week_start) — двойное нажатие не создаёт вторую строку.
+        """
+        total_cost = sum(i.get("estimated_price", 0) for i in shopping_list) or None
+        async with async_session() as session:
+            user_result = await session.execute(
+                select(User.id).where(User.telegram_id == user_telegram_id)
+            )
+            user_id = user_result.scalar_one()
+            await session.execute(upsert(
+                engine.dialect.name, MealPlan.__table__, ["user_id", "week_start"],
+                {"user_id": user_id, "week_start": week_start, "plan_data": plan_data,
+                 "total_calories": _int_or_none(plan_data.get("total_weekly_calories")),
+                 "total_cost": total_cost, "shopping_list": shopping_list,
+                 "created_at": datetime.utcnow()},
+                ["plan_data", "total_calories", "total_cost", "shopping_list", "created_at"]
+            ))
+            await session.commit()
+
+
+def _int_or_none(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PantryDB:
+    @staticmethod
+    async def get(user_id: int, now: datetime, limit: int) -> list[PantryItem]:
+        """Непросроченные запасы, свежие первыми"""
+        async with async_session() as session:
+            result = await session.execute(
+                select(PantryItem)
+                .where(PantryItem.user_id == user_id,
+                       or_(PantryItem.expires_at.is_(None), PantryItem.expires_at > now))
+                .order_by(PantryItem.updated_at.desc(), PantryItem.id.desc())
+                .limit(limit)
+            )
+            return list(result.scalars().all())
+
+    @staticmethod
+    async def add(user_id: int, items: list[dict]):
+        """items: key, name, expires_at — повторное добавление продлевает срок"""
+        now = datetime.utcnow()
+        async with async_session() as session:
+            for item in items:
+                await session.execute(upsert(
+                    engine.dialect.name, PantryItem.__table__, ["user_id", "key"],
+                    {"user_id": user_id, "added_at": now, "updated_at": now, **item},
+                    ["name", "updated_at", "expires_at"]
+                ))
+            await session.commit()
+
+    @staticmethod
+    async def remove(user_id: int, keys: list[str] = None) -> int:
+        """keys=None — очистить всё"""
+        stmt = delete(PantryItem).where(PantryItem.user_id == user_id)
+        if keys is not None:
+            stmt = stmt.where(PantryItem.key.in_(keys))
+        async with async_session() as session:
+            result = await session.execute(stmt)
+            await session.commit()
+        return result.rowcount or 0
+
+    @staticmethod
+    async def purge_expired(now: datetime) -> int:
+        async with async_session() as session:
+            result = await session.execute(
+                delete(PantryItem).where(PantryItem.expires_at <= now)
+            )
+            await session.commit()
+        return result.rowcount or 0
+
 
 class PaymentDB:
     @staticmethod
@@ -179,10 +518,161 @@ class PaymentDB:
             )
             await session.commit()
 
+    @staticmethod
+    async def apply_status(yukassa_payment_id: str, status: str, telegram_id: int = 0,
+                           months: int = 1, event_id: int = None) -> bool:
+        """
+        Переход статуса платежа, начисление Premium и отметка события —
+        одной транзакцией. Финальный статус применяется один раз: переход
+        — условный UPDATE (compare-and-set), и Premium продлевает только
+        тот, чей UPDATE изменил строку. На SQLite SELECT ... FOR UPDATE не
+        блокирует, поэтому на нём не полагаемся.
+        True — Premium начислен именно сейчас.
+
+        Событие отмечается done, только если переход применён или платёж уже
+        в финальном статусе. Если локальной строки платежа нет (create упал
+        после создания платежа в ЮKassa) — LookupError: транзакция
+        откатывается, событие остаётся для повтора, а после MAX_ATTEMPTS —
+        failed с payload для ручного восстановления.
+        """
+        async with async_session.begin() as session:
+            values = {"status": status}
+            if status == "succeeded":
+                values["confirmed_at"] = datetime.utcnow()
+            result = await session.execute(
+                update(Payment)
+                .where(Payment.yukassa_payment_id == yukassa_payment_id,
+                       Payment.status.not_in(("succeeded", "canceled")))
+                .values(**values)
+            )
+            if result.rowcount != 1:
+                exists = (await session.execute(
+                    select(Payment.id).where(Payment.yukassa_payment_id == yukassa_payment_id)
+                )).scalar_one_or_none()
+                if exists is None:
+                    raise LookupError(f"Payment {yukassa_payment_id} not found locally")
+            if event_id is not None:
+                await session.execute(
+                    update(PaymentEvent).where(PaymentEvent.id == event_id)
+                    .values(status="done", processed_at=datetime.utcnow())
+                )
+
+            if result.rowcount != 1 or status != "succeeded" or not telegram_id:
+                return False
+            user = (await session.execute(
+                select(User).where(User.telegram_id == telegram_id).with_for_update()
+            )).scalar_one_or_none()
+            if user is None:
+                return False
+            _extend_premium(user, months)
+            return True
+
+    @staticmethod
+    async def get_pending(created_before: datetime, created_after: datetime,
+                          after_id: int = 0, limit: int = 50) -> list[Payment]:
+        """Зависшие pending-платежи, keyset по id"""
+        async with async_session() as session:
+            result = await session.execute(
+                select(Payment)
+                .where(Payment.status == "pending", Payment.id > after_id,
+                       Payment.created_at < created_before, Payment.created_at >= created_after)
+                .order_by(Payment.id)
+                .limit(limit)
+            )
+            return result.scalars().all()
+
     @staticmethod
     async def get_by_yukassa_id(yukassa_payment_id: str) -> Optional[Payment]:
         async with async_session() as session:
             result = await session.execute(
                 select(Payment).where(Payment.yukassa_payment_id == yukassa_payment_id)
             )
-            return result.scalar_one_or_none()
\ No newline at end of file
+            return result.scalar_one_or_none()
+
+
+class CampaignDB:
+    @staticmethod
+    async def start(key: str, kind: str, day: date, where: list) -> Campaign:
+        """Существующая кампания (для продолжения) или новая"""
+        async with async_session() as session:
+            campaign = await session.get(Campaign, key)
+            if campaign is not None:
+                return campaign
+        total = await UserDB.count(where)
+        async with async_session() as session:
+            now = datetime.utcnow()
+            await session.execute(
+                insert_ignore(engine.dialect.name, Campaign.__table__).values(
+                    key=key, kind=kind, day=day, status="running", total=total,
+                    last_user_id=0, sent=0, failed=0, started_at=now, updated_at=now
+                )
+            )
+            await session.commit()
+            return await session.get(Campaign, key)
+
+    @staticmethod
+    async def checkpoint(key: str, last_user_id: int, sent: int, failed: int,
+                         done: bool = False):
+        values = {"last_user_id": last_user_id, "sent": sent, "failed": failed,
+                  "updated_at": datetime.utcnow()}
+        if done:
+            values["status"] = "done"
+            values["finished_at"] = values["updated_at"]
+        async with async_session() as session:
+            await session.execute(update(Campaign).where(Campaign.key == key).values(**values))
+            await session.commit()
+
+    @staticmethod
+    async def get_running() -> list[Campaign]:
+        async with async_session() as session:
+            result = await session.execute(select(Campaign).where(Campaign.status == "running"))
+            return result.scalars().all()
+
+    @staticmethod
+    async def abandon_before(day: date) -> int:
+        """Незавершённые кампании за прошлые дни → abandoned; сколько помечено"""
+        async with async_session() as session:
+            result = await session.execute(
+                update(Campaign)
+                .where(Campaign.status == "running", Campaign.day < day)
+                .values(status="abandoned", updated_at=datetime.utcnow())
+            )
+            await session.commit()
+            return result.rowcount
+
+
+class PaymentEventDB:
+    @staticmethod
+    async def add(event_key: str, event: str, payment_id: str, payload: dict) -> bool:
+        """False — такое событие уже записано"""
+        async with async_session() as session:
+            result = await session.execute(
+                insert_ignore(engine.dialect.name, PaymentEvent.__table__).values(
+                    event_key=event_key, event=event, payment_id=payment_id, payload=payload,
+                    status="new", attempts=0, received_at=datetime.utcnow()
+                )
+            )
+            await session.commit()
+            return result.rowcount > 0
+
+    @staticmethod
+    async def get_new(limit: int = 50) -> list[PaymentEvent]:
+        async with async_session() as session:
+            result = await session.execute(
+                select(PaymentEvent)
+                .where(PaymentEvent.status == "new")
+                .order_by(PaymentEvent.id)
+                .limit(limit)
+            )
+            return result.scalars().all()
+
+    @staticmethod
+    async def mark_failed(event_id: int, error: str, give_up: bool):
+        async with async_session() as session:
+            values = {"attempts": PaymentEvent.attempts + 1, "error": error[:500]}
+            if give_up:
+                values["status"] = "failed"
+            await session.execute(
+                update(PaymentEvent).where(PaymentEvent.id == event_id).values(**values)
+            )
+            await session.commit()
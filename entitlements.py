@@ -0,0 +1,165 @@
+# entitlements.py
+"""
+Что пользователю доступно: Premium, дневной лимит рецептов, тарифы.
+
+Решения принимаются по компактной записи в памяти (telegram_id →
+id пользователя, срок Premium и счётчик рецептов за день), без
+обращения к БД:
+
+  - RateLimitMiddleware берёт запись из кэша (fresh) и грузит строку
+    users только при промахе или истёкшем TTL — тогда же запись
+    обновляется из неё (observe); хэндлеры с флагом "profile" получают
+    строку целиком, остальные — CachedUser с id и telegram_id;
+  - генерация рецепта сразу увеличивает счётчик в записи (record_recipe);
+  - начисление Premium сбрасывает запись (invalidate);
+  - истечение Premium и смена дня проверяются по самой записи.
+
+В многопроцессном режиме платёж применяет фронт, а чат обслуживает
+воркер — его запись устаревает не дольше TTL или до проверки оплаты
+пользователем.
+"""
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Optional
+
+from config import config
+from database import UserDB
+from metrics import cache_metrics
+from models import User
+
+# Тарифы Premium: месяцев → цена, ₽
+PLANS = {1: 490, 3: 1290, 12: 3990}
+
+# Функции только для Premium; "recipe" — дневной лимит для бесплатных
+PREMIUM_FEATURES = frozenset({"premium", "meal_plan", "unlimited_recipes"})
+
+
+def price_text(rub: int) -> str:
+    """1290 → «1 290»"""
+    return f"{rub:,}".replace(",", " ")
+
+
+class Entitlement:
+    __slots__ = ("user_id", "premium_until", "is_premium", "recipes_today", "usage_day",
+                 "loaded_at")
+
+    def __init__(self, user_id: int, is_premium: bool, premium_until: Optional[datetime],
+                 recipes_today: int, usage_day: Optional[date]):
+        self.user_id = user_id
+        self.is_premium = is_premium
+        self.premium_until = premium_until
+        self.recipes_today = recipes_today or 0
+        self.usage_day = usage_day
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def from_user(cls, user: User) -> "Entitlement":
+        return cls(user.id, bool(user.is_premium), user.premium_until, user.recipes_today,
+                   user.last_recipe_date)
+
+    @property
+    def has_premium(self) -> bool:
+        if not self.is_premium:
+            return False
+        return self.premium_until is None or self.premium_until >= datetime.utcnow()
+
+    @property
+    def used_today(self) -> int:
+        return self.recipes_today if self.usage_day == date.today() else 0
+
+
+class CachedUser:
+    """db_user без профиля: хватает для проверок доступа и запросов по id"""
+    __slots__ = ("id", "telegram_id", "entitlement")
+
+    def __init__(self, telegram_id: int, entitlement: Entitlement):
+        self.id = entitlement.user_id
+        self.telegram_id = telegram_id
+        self.entitlement = entitlement
+
+
+class EntitlementService:
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._cache: OrderedDict[int, Entitlement] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _put(self, telegram_id: int, entitlement: Entitlement) -> Entitlement:
+        self._cache[telegram_id] = entitlement
+        self._cache.move_to_end(telegram_id)
+        if len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+        return entitlement
+
+    def observe(self, user: User) -> Entitlement:
+        """Свежая строка users (уже загруженная) → запись кэша"""
+        return self._put(user.telegram_id, Entitlement.from_user(user))
+
+    def _lookup(self, user: User) -> Entitlement:
+        entitlement = self._cache.get(user.telegram_id)
+        if entitlement is None:
+            if isinstance(user, CachedUser):  # запись вытеснена посреди апдейта
+                return user.entitlement
+            return self.observe(user)
+        return entitlement
+
+    def fresh(self, telegram_id: int) -> Optional[Entitlement]:
+        """Запись моложе TTL или None — тогда строку users нужно перечитать"""
+        entitlement = self._cache.get(telegram_id)
+        if entitlement is not None and time.monotonic() - entitlement.loaded_at < self.ttl:
+            self.hits += 1
+            self._cache.move_to_end(telegram_id)
+            return entitlement
+        self.misses += 1
+        return None
+
+    async def get(self, telegram_id: int) -> Optional[Entitlement]:
+        """Для кода без объекта User: из кэша, а при промахе или по TTL — из БД"""
+        entitlement = self.fresh(telegram_id)
+        if entitlement is not None:
+            return entitlement
+        user = await UserDB.get_by_telegram_id(telegram_id)
+        return self.observe(user) if user else None
+
+    def can(self, user: User, feature: str) -> bool:
+        entitlement = self._lookup(user)
+        if entitlement.has_premium:
+            return True
+        if feature == "recipe":
+            return entitlement.used_today < config.FREE_RECIPES_PER_DAY
+        return feature not in PREMIUM_FEATURES
+
+    def has_premium(self, user: User) -> bool:
+        return self._lookup(user).has_premium
+
+    def recipes_left(self, user: User) -> Optional[int]:
+        """Сколько бесплатных рецептов осталось сегодня; None — безлимит"""
+        entitlement = self._lookup(user)
+        if entitlement.has_premium:
+            return None
+        return max(0, config.FREE_RECIPES_PER_DAY - entitlement.used_today)
+
+    def record_recipe(self, telegram_id: int):
+        """Счётчик в записи — вместе с UserDB.increment_recipe"""
+        entitlement = self._cache.get(telegram_id)
+        if entitlement is None:
+            return
+        today = date.today()
+        if entitlement.usage_day != today:
+            entitlement.usage_day = today
+            entitlement.recipes_today = 0
+        entitlement.recipes_today += 1
+
+    def invalidate(self, telegram_id: int):
+        self._cache.pop(telegram_id, None)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+entitlements = EntitlementService(size=config.ENTITLEMENT_CACHE_SIZE, ttl=config.ENTITLEMENT_TTL)
+
+cache_metrics("entitlements", lambda: (entitlements.hits, entitlements.misses))
@@ -0,0 +1,405 @@
+# food_lexicon.py
+"""
+Каноничные названия продуктов: «куриная грудка», «куриное филе», «кура»
+и «курица» — один и тот же продукт.
+
+Слово приводится к основе стеммером Портера для русского (Snowball),
+затем основы ищутся в словаре синонимов: сначала фраза до MAX_PHRASE
+слов, потом отдельное слово. Найденное заменяется каноничным именем
+продукта, незнакомое слово остаётся основой.
+
+Синонимы — только варианты одного продукта. Группы («зелень» — укроп,
+петрушка, базилик) лежат отдельно в CATEGORIES и доступны через
+categories(): по ним сравнивают нестрого, но никогда не склеивают.
+
+Словарь (SYNONYMS) компилируется в food_lexicon.bin — отсортированная
+таблица «основы → понятие», которая читается через mmap двоичным
+поиском. Файл собирается при сборке (python food_lexicon.py), а если
+его нет или он устарел — при первом обращении. Результаты по словам и
+названиям кэшируются, так что разбор на каждый токен почти бесплатен.
+"""
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Union
+
+LEXICON_PATH = Path(__file__).with_name("food_lexicon.bin")
+
+MAX_PHRASE = 3
+
+# Продукт → варианты его названия: написания, формы слов, которые стеммер
+# не сводит сам, и части того же продукта («куриное филе» — это курица).
+# Разные продукты одной группы (укроп и петрушка) сюда не попадают — они
+# в CATEGORIES: канонические имена, дубли и ключи запасов строятся только
+# по этому словарю.
+SYNONYMS: dict[str, tuple[str, ...]] = {
+    "курица": ("кура", "куриный", "курятина", "цыпленок", "цыплята", "бройлер", "куриная грудка",
+               "куриное филе", "куриные бедра", "куриные крылья", "куриные окорочка",
+               "окорочок", "голень куриная"),
+    "индейка": ("индюшатина", "филе индейки", "индюшка"),
+    "говядина": ("говяжий", "вырезка говяжья"),
+    "телятина": ("телячий",),
+    "свинина": ("свиной", "свиная шея", "корейка"),
+    "баранина": ("бараний", "ягнятина"),
+    "фарш": ("фарш мясной", "мясной фарш", "фарш домашний"),
+    "фарш говяжий": ("говяжий фарш",),
+    "фарш свиной": ("свиной фарш",),
+    "фарш куриный": ("куриный фарш",),
+    "колбаса": ("колбаска",),
+    "сосиски": ("сосиска",),
+    "сардельки": ("сарделька",),
+    "салями": (),
+    "ветчина": ("окорок",),
+    "бекон": (),
+    "грудинка": ("грудинка копченая",),
+    "рыба": ("рыбный", "филе рыбы", "рыбное филе"),
+    "лосось": ("семга", "филе лосося"),
+    "форель": (),
+    "горбуша": (),
+    "кета": (),
+    "креветки": ("креветка", "королевские креветки", "тигровые креветки"),
+    "яйцо": ("яичко", "яичный", "куриное яйцо", "яйца куриные"),
+    "молоко": ("молочко", "молоко коровье"),
+    "кефир": (),
+    "ряженка": (),
+    "сметана": ("сметанка",),
+    "сливки": ("сливки питьевые",),
+    "творог": ("творожок", "творожный", "зернистый творог"),
+    "сыр": ("сыр твердый",),
+    "плавленый сыр": ("сыр плавленый", "плавленый сырок"),
+    "пармезан": ("сыр пармезан",),
+    "моцарелла": ("сыр моцарелла",),
+    "гауда": ("сыр гауда",),
+    "чеддер": ("сыр чеддер",),
+    "брынза": (),
+    "фета": ("сыр фета",),
+    "йогурт": ("йогурт натуральный", "греческий йогурт"),
+    "сливочное масло": ("масло сливочное",),
+    "маргарин": ("спред",),
+    "растительное масло": ("масло растительное",),
+    "подсолнечное масло": ("масло подсолнечное",),
+    "оливковое масло": ("масло оливковое",),
+    "картофель": ("картошка", "картофелина", "клубни картофеля", "молодой картофель"),
+    "морковь": ("морковка", "морковный"),
+    "лук": ("луковица", "репчатый лук", "лук репчатый", "лучок"),
+    "зеленый лук": ("лук зеленый", "перья лука"),
+    "чеснок": ("чесночок", "зубчик чеснока", "чесночный"),
+    "помидор": ("томат", "томаты", "помидорка"),
+    "помидоры черри": ("черри", "томаты черри"),
+    "томатная паста": ("паста томатная",),
+    "кетчуп": (),
+    "огурец": ("огурцы", "огурчик", "огуречный"),
+    "капуста": ("капуста белокочанная", "белокочанная капуста", "капустный"),
+    "брокколи": ("капуста брокколи",),
+    "цветная капуста": ("капуста цветная",),
+    "перец болгарский": ("болгарский перец", "сладкий перец", "паприка свежая"),
+    "кабачок": ("цукини", "кабачки"),
+    "баклажан": ("баклажаны", "синенькие"),
+    "тыква": ("тыквенный",),
+    "свекла": ("свеклы", "буряк", "свекольный"),
+    "грибы": ("гриб", "грибной"),
+    "шампиньоны": ("шампиньон",),
+    "вешенки": ("вешенка",),
+    "опята": ("опенок",),
+    "лисички": ("лисичка",),
+    "зелень": ("зелень свежая", "свежая зелень"),
+    "укроп": (),
+    "петрушка": (),
+    "кинза": ("кориандр свежий",),
+    "базилик": (),
+    "салат": ("листья салата", "салат листовой"),
+    "айсберг": ("салат айсберг",),
+    "руккола": (),
+    "яблоко": ("яблочко", "яблочный"),
+    "банан": ("бананчик", "банановый"),
+    "лимон": ("лимонный",),
+    "лимонный сок": ("сок лимона",),
+    "рис": ("рисовый", "крупа рисовая", "рисовая крупа"),
+    "гречка": ("гречневая крупа", "крупа гречневая", "гречневый"),
+    "овсянка": ("овсяные хлопья", "хлопья овсяные", "геркулес", "овсяный"),
+    "макароны": ("паста", "макаронные изделия"),
+    "спагетти": (),
+    "вермишель": (),
+    "лапша": (),
+    "рожки": (),
+    "пенне": (),
+    "фузилли": (),
+    "мука": ("мука пшеничная", "пшеничная мука", "мучной"),
+    "хлеб": ("хлебушек", "буханка"),
+    "батон": (),
+    "багет": (),
+    "лаваш": (),
+    "фасоль": ("фасолевый",),
+    "бобы": (),
+    "горох": ("гороховый", "колотый горох"),
+    "зеленый горошек": ("горошек", "горошка"),
+    "нут": (),
+    "кукуруза": ("кукурузный", "консервированная кукуруза"),
+    "мед": ("медовый",),
+    "орехи": ("орех",),
+    "грецкий орех": ("грецкие орехи",),
+    "фундук": (),
+    "миндаль": (),
+    "кешью": (),
+    "арахис": (),
+    "майонез": ("майонезный",),
+    "соевый соус": ("соус соевый",),
+}
+
+# Группа → продукты из SYNONYMS. Только для нестрогого сравнения: в рецепте
+# «зелень», а у пользователя укроп; цена и срок хранения — по группе.
+# Продукты одной группы друг друга не заменяют.
+CATEGORIES: dict[str, tuple[str, ...]] = {
+    "колбаса": ("сосиски", "сардельки", "салями"),
+    "фарш": ("фарш говяжий", "фарш свиной", "фарш куриный"),
+    "говядина": ("телятина",),
+    "рыба": ("лосось", "форель", "горбуша", "кета"),
+    "сыр": ("плавленый сыр", "пармезан", "моцарелла", "гауда", "чеддер", "брынза", "фета"),
+    "растительное масло": ("подсолнечное масло", "оливковое масло"),
+    "помидор": ("помидоры черри",),
+    "грибы": ("шампиньоны", "вешенки", "опята", "лисички"),
+    "зелень": ("укроп", "петрушка", "кинза", "базилик"),
+    "салат": ("айсберг", "руккола"),
+    "макароны": ("спагетти", "вермишель", "лапша", "рожки", "пенне", "фузилли"),
+    "хлеб": ("батон", "багет", "лаваш"),
+    "орехи": ("грецкий орех", "фундук", "миндаль", "кешью", "арахис"),
+}
+
+
+# ═══════════════════════════════════════
+# СТЕММЕР (Snowball, русский)
+# ═══════════════════════════════════════
+
+_VOWELS = "аеиоуыэюя"
+
+_PERFECTIVE_GERUND = re.compile(r"(?:ив|ивши|ившись|ыв|ывши|ывшись|(?<=[ая])(?:в|вши|вшись))$")
+_REFLEXIVE = re.compile(r"(?:ся|сь)$")
+_ADJECTIVE = re.compile(r"(?:ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|"
+                        r"ую|юю|ая|яя|ою|ею)$")
+_PARTICIPLE = re.compile(r"(?:ивш|ывш|ующ|(?<=[ая])(?:ем|нн|вш|ющ|щ))$")
+_VERB = re.compile(r"(?:ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|"
+                   r"ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю|"
+                   r"(?<=[ая])(?:ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно))$")
+_NOUN = re.compile(r"(?:а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|"
+                   r"о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$")
+_DERIVATIONAL = re.compile(r"ость?$")
+_SUPERLATIVE = re.compile(r"(?:ейше|ейш)$")
+_WORD_RE = re.compile(r"[а-яёa-z]+")
+
+
+def _region(word: str, start: int) -> int:
+    """Начало R1/R2: после первой согласной, идущей за гласной"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return i + 1
+    return len(word)
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """Основа слова: «куриная» → «курин», «помидоры» → «помидор»"""
+    word = word.lower().replace("ё", "е")
+    rv = next((i + 1 for i, ch in enumerate(word) if ch in _VOWELS), len(word))
+    r2 = _region(word, _region(word, 0))
+    head, tail = word[:rv], word[rv:]
+
+    cut = _PERFECTIVE_GERUND.sub("", tail, count=1)
+    if cut == tail:
+        tail = _REFLEXIVE.sub("", tail, count=1)
+        cut = _ADJECTIVE.sub("", tail, count=1)
+        if cut != tail:
+            cut = _PARTICIPLE.sub("", cut, count=1)
+        else:
+            cut = _VERB.sub("", tail, count=1)
+            if cut == tail:
+                cut = _NOUN.sub("", tail, count=1)
+    tail = cut
+
+    if tail.endswith("и"):
+        tail = tail[:-1]
+    match = _DERIVATIONAL.search(tail)
+    if match and rv + match.start() >= r2:
+        tail = tail[:match.start()]
+
+    if tail.endswith("нн"):
+        tail = tail[:-1]
+    else:
+        cut = _SUPERLATIVE.sub("", tail, count=1)
+        if cut != tail:
+            tail = cut[:-1] if cut.endswith("нн") else cut
+        elif tail.endswith("ь"):
+            tail = tail[:-1]
+    return head + tail
+
+
+def stems(text: str) -> list[str]:
+    return [stem(w) for w in _WORD_RE.findall(text.lower())]
+
+
+# ═══════════════════════════════════════
+# СКОМПИЛИРОВАННЫЙ СЛОВАРЬ
+# ═══════════════════════════════════════
+
+# magic, число записей, дайджест исходника; запись — смещения и длины ключа и значения
+_HEADER = struct.Struct("<4sI16s")
+_ENTRY = struct.Struct("<IHIH")
+_MAGIC = b"FLX1"
+
+
+def _digest() -> bytes:
+    source = repr(sorted(SYNONYMS.items())) + _NOUN.pattern + _ADJECTIVE.pattern
+    return hashlib.md5(source.encode()).digest()
+
+
+def compile_lexicon() -> bytes:
+    """SYNONYMS → двоичная таблица, отсортированная по ключу (основы через пробел)"""
+    table: dict[bytes, bytes] = {}
+    for concept, variants in SYNONYMS.items():
+        for name in (concept, *variants):
+            key = " ".join(stems(name)).encode()
+            if key:
+                table.setdefault(key, concept.encode())
+
+    keys = sorted(table)
+    index_end = _HEADER.size + _ENTRY.size * len(keys)
+    index, blob = [], bytearray()
+    for key in keys:
+        value = table[key]
+        index.append(_ENTRY.pack(index_end + len(blob), len(key),
+                                 index_end + len(blob) + len(key), len(value)))
+        blob += key + value
+    return _HEADER.pack(_MAGIC, len(keys), _digest()) + b"".join(index) + bytes(blob)
+
+
+def build(path: Path = LEXICON_PATH) -> int:
+    data = compile_lexicon()
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return _HEADER.unpack_from(data)[1]
+
+
+class _Lexicon:
+    def __init__(self, path: Path):
+        self.path = path
+        self._buf: Optional[Union[mmap.mmap, bytes]] = None
+        self._count = 0
+
+    def _map(self) -> Optional[mmap.mmap]:
+        try:
+            with open(self.path, "rb") as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        magic, _, digest = _HEADER.unpack_from(buf)
+        if magic == _MAGIC and digest == _digest():
+            return buf
+        buf.close()
+        return None
+
+    def _load(self):
+        buf = self._map()
+        if buf is None:
+            # Нет файла или словарь поменялся — пересобираем; без записи на диск — в памяти
+            try:
+                build(self.path)
+                buf = self._map()
+            except OSError:
+                pass
+        self._buf = buf if buf is not None else compile_lexicon()
+        self._count = _HEADER.unpack_from(self._buf)[1]
+
+    def _entry(self, i: int) -> tuple[int, int, int, int]:
+        return _ENTRY.unpack_from(self._buf, _HEADER.size + _ENTRY.size * i)
+
+    def get(self, key: str) -> Optional[str]:
+        if self._buf is None:
+            self._load()
+        target = key.encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_off, key_len, val_off, val_len = self._entry(mid)
+            probe = self._buf[key_off:key_off + key_len]
+            if probe == target:
+                return self._buf[val_off:val_off + val_len].decode()
+            if probe < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def __len__(self) -> int:
+        if self._buf is None:
+            self._load()
+        return self._count
+
+
+lexicon = _Lexicon(LEXICON_PATH)
+
+
+@lru_cache(maxsize=16384)
+def _analyze(name: str) -> tuple[tuple[str, ...], frozenset]:
+    words = stems(name)
+    terms, concepts = [], set()
+    i = 0
+    while i < len(words):
+        for size in range(min(MAX_PHRASE, len(words) - i), 0, -1):
+            concept = lexicon.get(" ".join(words[i:i + size]))
+            if concept is not None:
+                terms.append(concept)
+                concepts.add(concept)
+                i += size
+                break
+        else:
+            terms.append(words[i])
+            i += 1
+    return tuple(terms), frozenset(concepts)
+
+
+def canonical(name: str) -> str:
+    """«Куриные грудки» → «курица», «томаты» → «помидор»; «укроп» остаётся укропом"""
+    return " ".join(_analyze(name)[0])
+
+
+def concepts(name: str) -> frozenset:
+    """Продукты словаря (каноничные имена), найденные в названии"""
+    return _analyze(name)[1]
+
+
+def _categories_of() -> dict[str, frozenset]:
+    """Продукт → группы, в которые он входит"""
+    result: dict[str, set] = {}
+    for group, members in CATEGORIES.items():
+        for member in members:
+            result.setdefault(member, set()).add(group)
+    return {member: frozenset(groups) for member, groups in result.items()}
+
+
+_CATEGORIES_OF = _categories_of()
+
+
+def categories(name: str) -> frozenset:
+    """Группы продуктов из названия: «моцарелла» → {«сыр»}"""
+    return frozenset().union(*(_CATEGORIES_OF.get(c, ()) for c in concepts(name)))
+
+
+def unique_products(names: list[str]) -> list[str]:
+    """Без повторов по каноничному имени; порядок и первое написание сохраняются"""
+    seen, result = set(), []
+    for name in names:
+        key = canonical(name) or name
+        if key not in seen:
+            seen.add(key)
+            result.append(name)
+    return result
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else LEXICON_PATH
+    print(f"{path}: {build(path)} entries")
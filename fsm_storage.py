@@ -0,0 +1,205 @@
+# fsm_storage.py
+"""
+Персистентное хранилище FSM вместо MemoryStorage.
+
+DBStorage — таблица fsm_sessions в основной базе (SQLite по умолчанию),
+Redis — штатный RedisStorage aiogram (подходит любой сервер с протоколом
+Redis). Поверх любого из них — CachedStorage: небольшой LRU-кэш в
+процессе с записью насквозь. Неактивные сессии удаляются по TTL.
+"""
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import select, delete, func
+
+from config import config
+from database import async_session, engine
+from models import FsmSession, upsert
+from serialization import pack, unpack, dumps_json
+
+logger = logging.getLogger(__name__)
+
+_key_builder = DefaultKeyBuilder(
+    prefix="fsm", with_bot_id=True, with_business_connection_id=True, with_destiny=True
+)
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class DBStorage(BaseStorage):
+    """FSM в таблице fsm_sessions: state + сжатый data одной строкой на чат"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    async def _write(self, key: StorageKey, **values):
+        values["updated_at"] = datetime.utcnow()
+        async with async_session() as session:
+            await session.execute(upsert(
+                engine.dialect.name, FsmSession.__table__, ["key"],
+                {"key": _key_builder.build(key), **values}, list(values)
+            ))
+            await session.commit()
+
+    async def _read(self, key: StorageKey) -> Optional[FsmSession]:
+        async with async_session() as session:
+            return await session.get(FsmSession, _key_builder.build(key))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._write(key, state=_state_name(state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._read(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._write(key, data=pack(data) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._read(key)
+        return (unpack(record.data) or {}) if record else {}
+
+    async def get_record(self, key: StorageKey) -> tuple[Optional[str], Dict[str, Any]]:
+        """state и data одним запросом — для CachedStorage"""
+        record = await self._read(key)
+        if not record:
+            return None, {}
+        return record.state, unpack(record.data) or {}
+
+    async def purge_expired(self) -> int:
+        """Удаляет сессии, не менявшиеся дольше TTL"""
+        threshold = datetime.utcnow() - timedelta(seconds=self.ttl)
+        async with async_session() as session:
+            result = await session.execute(
+                delete(FsmSession).where(FsmSession.updated_at < threshold)
+            )
+            await session.commit()
+            return result.rowcount or 0
+
+    async def count(self) -> int:
+        async with async_session() as session:
+            return (await session.execute(select(func.count(FsmSession.key)))).scalar_one()
+
+    async def close(self) -> None:
+        pass
+
+
+class CachedStorage(BaseStorage):
+    """
+    LRU-кэш поверх другого хранилища: чтение из памяти, запись насквозь.
+    Корректен, пока апдейты одного чата обрабатывает один процесс.
+    """
+
+    def __init__(self, inner: BaseStorage, max_size: int, ttl: int):
+        self.inner = inner
+        self.max_size = max_size
+        self.ttl = ttl
+        # key → [state, data, last_access]
+        self._cache: OrderedDict[StorageKey, list] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def _entry(self, key: StorageKey) -> list:
+        entry = self._cache.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+        else:
+            self.misses += 1
+            if isinstance(self.inner, DBStorage):
+                state, data = await self.inner.get_record(key)
+            else:
+                state = await self.inner.get_state(key)
+                data = await self.inner.get_data(key)
+            entry = self._put(key, state, data)
+        entry[2] = time.monotonic()
+        return entry
+
+    def _put(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]) -> list:
+        entry = [state, data, time.monotonic()]
+        self._cache[key] = entry
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.inner.set_state(key, state)
+        entry = self._cache.get(key)
+        if entry is None:
+            # Записанное не перечитываем — из хранилища нужна только вторая половина
+            self._put(key, _state_name(state), await self.inner.get_data(key))
+            return
+        self._cache.move_to_end(key)
+        entry[0] = _state_name(state)
+        entry[2] = time.monotonic()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.inner.set_data(key, data)
+        entry = self._cache.get(key)
+        if entry is None:
+            self._put(key, await self.inner.get_state(key), data.copy())
+            return
+        self._cache.move_to_end(key)
+        entry[1] = data.copy()
+        entry[2] = time.monotonic()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._entry(key))[1].copy()
+
+    def compact(self) -> int:
+        """Выкидывает из кэша записи, к которым не обращались дольше TTL"""
+        threshold = time.monotonic() - self.ttl
+        stale = [key for key, entry in self._cache.items() if entry[2] < threshold]
+        for key in stale:
+            del self._cache[key]
+        return len(stale)
+
+    async def purge_expired(self) -> int:
+        self.compact()
+        if hasattr(self.inner, "purge_expired"):
+            return await self.inner.purge_expired()
+        return 0
+
+    async def count(self) -> int:
+        if hasattr(self.inner, "count"):
+            return await self.inner.count()
+        return len(self._cache)
+
+    async def close(self) -> None:
+        self._cache.clear()
+        await self.inner.close()
+
+
+def build_fsm_storage() -> BaseStorage:
+    """Хранилище FSM по FSM_STORAGE: db (по умолчанию), redis, memory"""
+    backend = config.FSM_STORAGE
+    ttl = config.FSM_SESSION_TTL
+
+    if backend == "memory":
+        return MemoryStorage()
+
+    if backend == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            logger.error("FSM_STORAGE=redis, but redis is not installed — using db")
+        else:
+            inner = RedisStorage.from_url(
+                config.REDIS_URL, state_ttl=ttl, data_ttl=ttl, json_dumps=dumps_json
+            )
+            logger.info("FSM storage: redis")
+            return CachedStorage(inner, max_size=config.FSM_CACHE_SIZE, ttl=ttl)
+
+    logger.info("FSM storage: db")
+    return CachedStorage(DBStorage(ttl=ttl), max_size=config.FSM_CACHE_SIZE, ttl=ttl)
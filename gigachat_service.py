@@ -8,6 +8,9 @@ import httpx
 from typing import Optional
 
 from config import config
+from food_lexicon import unique_products
+from metrics import track
+from tracing import TracingTransport, traced
 
 logger = logging.getLogger(__name__)
 
@@ -124,13 +127,14 @@ MEAL_PLAN_PROMPT = """Ты — профессиональный диетолог
 - Исключить: {excluded}
 
 Для каждого дня — 3 приёма пищи (завтрак, обед, ужин).
+Ингредиенты — в формате «продукт — количество» на 1 порцию: «курица — 200 г», «молоко — 250 мл», «яйца — 2 шт».
 
 Верни JSON:
 {{
   "monday": {{
-    "breakfast": {{"title": "...", "calories": число, "ingredients": ["..."], "instructions": "..."}},
-    "lunch": {{"title": "...", "calories": число, "ingredients": ["..."], "instructions": "..."}},
-    "dinner": {{"title": "...", "calories": число, "ingredients": ["..."], "instructions": "..."}}
+    "breakfast": {{"title": "...", "calories": число, "ingredients": ["продукт — количество", ...], "instructions": "..."}},
+    "lunch": {{"title": "...", "calories": число, "ingredients": ["продукт — количество", ...], "instructions": "..."}},
+    "dinner": {{"title": "...", "calories": число, "ingredients": ["продукт — количество", ...], "instructions": "..."}}
   }},
   "tuesday": {{...}},
   "wednesday": {{...}},
@@ -162,13 +166,14 @@ class GigaChatService:
         ctx.verify_mode = ssl.CERT_NONE
         return ctx
 
+    @track("gigachat", "token")
     async def _get_token(self) -> str:
         if self.access_token and time.time() < self.token_expires:
             return self.access_token
 
         logger.info("Getting GigaChat token...")
 
-        async with httpx.AsyncClient(verify=self._ssl(), timeout=15.0) as client:
+        async with httpx.AsyncClient(transport=TracingTransport(verify=self._ssl()), timeout=15.0) as client:
             response = await client.post(
                 self.AUTH_URL,
                 headers={
@@ -194,7 +199,7 @@ class GigaChatService:
                        max_tokens: int = 4000) -> str:
         token = await self._get_token()
 
-        async with httpx.AsyncClient(verify=self._ssl(), timeout=120.0) as client:
+        async with httpx.AsyncClient(transport=TracingTransport(verify=self._ssl()), timeout=120.0) as client:
             response = await client.post(
                 f"{self.API_URL}/chat/completions",
                 headers={
@@ -219,6 +224,7 @@ class GigaChatService:
             logger.info(f"GigaChat response length: {len(content)}")
             return content
 
+    @traced("gigachat.extract_json")
     def _extract_json(self, text: str):
         text = text.strip()
 
@@ -252,6 +258,7 @@ class GigaChatService:
     # ОСНОВНЫЕ МЕТОДЫ
     # ═══════════════════════════════════════
 
+    @track("gigachat", "products")
     async def recognize_products(self, user_text: str) -> list[str]:
         messages = [
             {"role": "system", "content": PRODUCT_RECOGNITION_PROMPT},
@@ -260,24 +267,26 @@ class GigaChatService:
         response = await self._request(messages, temperature=0.3)
         products = self._extract_json(response)
         if isinstance(products, list):
-            return [str(p).strip().lower() for p in products if p]
+            return unique_products([str(p).strip().lower() for p in products if p])
         return []
 
+    @track("gigachat", "voice_products")
     async def recognize_products_from_voice(self, recognized_text: str) -> list[str]:
         prompt = VOICE_PRODUCTS_PROMPT.format(text=recognized_text)
         messages = [{"role": "user", "content": prompt}]
         response = await self._request(messages, temperature=0.3)
         products = self._extract_json(response)
         if isinstance(products, list):
-            return [str(p).strip().lower() for p in products if p]
+            return unique_products([str(p).strip().lower() for p in products if p])
         return []
 
+    @track("gigachat", "photo_products")
     async def recognize_products_from_photo(self, image_data: bytes,
                                               mime_type: str = "image/jpeg") -> list[str]:
         try:
             # Загружаем файл
             token = await self._get_token()
-            async with httpx.AsyncClient(verify=self._ssl(), timeout=30.0) as client:
+            async with httpx.AsyncClient(transport=TracingTransport(verify=self._ssl()), timeout=30.0) as client:
                 resp = await client.post(
                     f"{self.API_URL}/files",
                     headers={"Authorization": f"Bearer {token}"},
@@ -295,7 +304,7 @@ class GigaChatService:
             response = await self._request(messages, temperature=0.3, model="GigaChat-Pro")
             products = self._extract_json(response)
             if isinstance(products, list):
-                return [str(p).strip().lower() for p in products if p]
+                return unique_products([str(p).strip().lower() for p in products if p])
             return []
         except Exception as e:
             logger.warning(f"Photo recognition failed: {e}")
@@ -307,6 +316,7 @@ class GigaChatService:
         products = await self.recognize_products_from_photo(image_data, mime_type)
         return products, len(products) >= 2
 
+    @track("gigachat", "recipes")
     async def get_recipes(self, products: list[str], count: int = 3,
                           diet_type: str = None, allergies: list[str] = None,
                           excluded: list[str] = None) -> list[dict]:
@@ -331,6 +341,7 @@ class GigaChatService:
             recipes = [recipes]
         return recipes if isinstance(recipes, list) else []
 
+    @track("gigachat", "shopping_list")
     async def get_shopping_list(self, recipe_title: str, all_ingredients: list[dict],
                                 available_products: list[str]) -> list[dict]:
         """Генерация списка покупок"""
@@ -359,6 +370,7 @@ class GigaChatService:
             return result
         return []
 
+    @track("gigachat", "meal_plan")
     async def generate_meal_plan(self, calories_goal: int = 2000,
                                   diet_type: str = None,
                                   allergies: list[str] = None,
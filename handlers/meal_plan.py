@@ -1,11 +1,20 @@
+import asyncio
 import logging
+from datetime import date, timedelta
+from typing import Optional
 
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
+from aiogram.fsm.context import FSMContext
 
+from database import MealPlanDB
+from entitlements import PLANS, entitlements
 from gigachat_service import gigachat
 from keyboards import meal_plan_keyboard, premium_keyboard
 from models import User
+from recipe_store import recipe_store
+from send_queue import outbox
+from shopping_list import aggregate, format_pages
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -19,17 +28,42 @@ DAYS_RU = {
 MEALS_RU = {"breakfast": "🌅 Завтрак", "lunch": "🌞 Обед", "dinner": "🌙 Ужин"}
 
 
-@router.message(F.text == "🗓 План на неделю")
-async def meal_plan_start(message: Message, db_user: User):
-    if not db_user.has_active_premium:
-        await message.answer(
-            "⭐️ <b>План питания — Premium функция</b>\n\n"
-            "490 ₽/мес — безлимит + план + диеты",
-            parse_mode="HTML",
-            reply_markup=premium_keyboard()
-        )
+async def _premium_required(message: Message, db_user: User) -> bool:
+    if entitlements.can(db_user, "meal_plan"):
+        return False
+    await message.answer(
+        "⭐️ <b>План питания — Premium функция</b>\n\n"
+        f"{PLANS[1]} ₽/мес — безлимит + план + диеты",
+        parse_mode="HTML",
+        reply_markup=premium_keyboard()
+    )
+    return True
+
+
+async def _current_plan(state: FSMContext) -> Optional[dict]:
+    """План из FSM: там только id, сам план — в recipe_store"""
+    data = await state.get_data()
+    plan_id = data.get("meal_plan_id")
+    return await recipe_store.get(plan_id) if plan_id else None
+
+
+@router.message(F.text == "🗓 План на неделю", flags={"profile": True})
+async def meal_plan_start(message: Message, state: FSMContext, db_user: User):
+    if await _premium_required(message, db_user):
+        return
+    await _send_plan(message, state, db_user)
+
+
+@router.callback_query(F.data == "regenerate_plan",
+                       flags={"single_flight": "meal_plan", "profile": True})
+async def regenerate_plan(callback: CallbackQuery, state: FSMContext, db_user: User):
+    await callback.answer()
+    if await _premium_required(callback.message, db_user):
         return
+    await _send_plan(callback.message, state, db_user)
+
 
+async def _send_plan(message: Message, state: FSMContext, db_user: User):
     processing = await message.answer("🗓 Генерирую план на неделю... ⏳ 30-60 сек")
 
     try:
@@ -44,6 +78,12 @@ async def meal_plan_start(message: Message, db_user: User):
         await processing.edit_text("❌ Ошибка. Попробуй ещё раз.")
         return
 
+    plan_id, = await recipe_store.put_many([plan])
+    await state.update_data(meal_plan_id=plan_id)
+
+    # Дни уходят через очередь отправки: идут в темпе лимитов Telegram
+    # и склеиваются в одно-два сообщения вместо восьми
+    sends = []
     for day_key, day_name in DAYS_RU.items():
         day_data = plan.get(day_key)
         if not day_data:
@@ -60,23 +100,53 @@ async def meal_plan_start(message: Message, db_user: User):
             text += f"{meal_name}: <b>{title}</b> ({cal} ккал)\n"
 
         text += f"\n📊 Итого: {day_calories} ккал"
-        await message.answer(text, parse_mode="HTML")
+        sends.append(outbox.enqueue(message.chat.id, text, parse_mode="HTML"))
 
     total_cal = plan.get("total_weekly_calories", "?")
     total_cost = plan.get("total_weekly_cost", "?")
 
-    await message.answer(
+    sends.append(outbox.enqueue(
+        message.chat.id,
         f"📊 <b>Итого за неделю:</b>\n"
         f"🔥 {total_cal} ккал | 💰 ~{total_cost} ₽",
         parse_mode="HTML",
         reply_markup=meal_plan_keyboard()
-    )
+    ))
+    await asyncio.gather(*sends)
 
 
-@router.callback_query(F.data == "show_weekly_shopping")
-async def show_weekly_shopping(callback: CallbackQuery, db_user: User):
-    await callback.message.answer(
-        "🛒 Сводный список покупок — скоро!",
-        parse_mode="HTML"
-    )
+@router.callback_query(F.data == "show_weekly_shopping", flags={"single_flight": "weekly_shopping"})
+async def show_weekly_shopping(callback: CallbackQuery, state: FSMContext, db_user: User):
+    plan = await _current_plan(state)
+    if not plan:
+        await callback.answer("❌ План устарел — сгенерируй новый", show_alert=True)
+        return
+
+    # Считается на месте из ингредиентов плана — без запроса к GigaChat
+    items = aggregate(plan)
+    if not items:
+        await callback.answer("🤷 В плане нет ингредиентов", show_alert=True)
+        return
+
     await callback.answer()
+    await asyncio.gather(*(
+        outbox.enqueue(callback.message.chat.id, page, parse_mode="HTML")
+        for page in format_pages(items)
+    ))
+
+
+@router.callback_query(F.data == "save_meal_plan")
+async def save_meal_plan(callback: CallbackQuery, state: FSMContext, db_user: User):
+    plan = await _current_plan(state)
+    if not plan:
+        await callback.answer("❌ План устарел — сгенерируй новый", show_alert=True)
+        return
+
+    today = date.today()
+    await MealPlanDB.save(
+        db_user.telegram_id,
+        week_start=today - timedelta(days=today.weekday()),
+        plan_data=plan,
+        shopping_list=aggregate(plan)
+    )
+    await callback.answer("💾 План сохранён!")
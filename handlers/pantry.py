@@ -0,0 +1,126 @@
+# handlers/pantry.py
+import logging
+from io import BytesIO
+
+from aiogram import Router, F, Bot
+from aiogram.types import Message, CallbackQuery
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+
+from config import config
+from entitlements import entitlements
+from gigachat_service import gigachat
+from handlers.recipe import RecipeStates
+from keyboards import pantry_keyboard, premium_keyboard, recipe_count_keyboard
+from models import User
+from pantry import pantry, pantry_preview
+from speech_service import salute_speech
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+
+class PantryStates(StatesGroup):
+    removing = State()
+
+
+@router.callback_query(F.data == "use_pantry")
+async def use_pantry(callback: CallbackQuery, state: FSMContext, db_user: User):
+    """Одно нажатие — и сразу выбор числа рецептов, без распознавания"""
+    if not entitlements.can(db_user, "recipe"):
+        await callback.message.edit_text(
+            f"⚠️ Лимит {config.FREE_RECIPES_PER_DAY} рецепта/день исчерпан!",
+            reply_markup=premium_keyboard()
+        )
+        await callback.answer()
+        return
+
+    products = await pantry.products(db_user.id)
+    if not products:
+        await callback.answer("🧺 Запасы пусты — отправь продукты 📝🎤📸", show_alert=True)
+        return
+
+    await state.update_data(products=products, input_method="pantry")
+    await state.set_state(RecipeStates.choosing_recipe_count)
+    await callback.message.edit_text(
+        f"🧺 <b>Из запасов:</b> {pantry_preview(products)}\n\n🔢 Сколько рецептов?",
+        parse_mode="HTML",
+        reply_markup=recipe_count_keyboard()
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data == "pantry_remove")
+async def pantry_remove(callback: CallbackQuery, state: FSMContext, db_user: User):
+    await state.set_state(PantryStates.removing)
+    await callback.message.answer(
+        "➖ Что закончилось? Напиши 📝, надиктуй 🎤: «молоко, яйца» или пришли фото упаковок 📸"
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data == "pantry_clear")
+async def pantry_clear(callback: CallbackQuery, state: FSMContext, db_user: User):
+    await pantry.clear(db_user.id)
+    await state.set_state(RecipeStates.waiting_for_products)
+    await callback.message.edit_text("🗑 Запасы очищены. Отправь продукты 📝🎤📸")
+    await callback.answer()
+
+
+async def _remove(message: Message, state: FSMContext, db_user: User, text: str):
+    # Названия сверяются с запасами локально — GigaChat не нужен
+    removed = await pantry.remove_mentioned(db_user.id, text)
+    products = await pantry.products(db_user.id)
+    await state.set_state(RecipeStates.waiting_for_products)
+
+    result = f"➖ Убрано: {removed}" if removed else "🤔 Таких продуктов в запасах нет"
+    if products:
+        await message.answer(
+            f"{result}\n\n🧺 <b>В запасах:</b> {pantry_preview(products)}",
+            parse_mode="HTML",
+            reply_markup=pantry_keyboard(len(products))
+        )
+    else:
+        await message.answer(f"{result}\n\n🧺 Запасы пусты — отправь продукты 📝🎤📸")
+
+
+@router.message(PantryStates.removing, F.text)
+async def remove_text(message: Message, state: FSMContext, db_user: User):
+    await _remove(message, state, db_user, message.text)
+
+
+@router.message(PantryStates.removing, F.voice)
+async def remove_voice(message: Message, state: FSMContext, db_user: User, bot: Bot):
+    try:
+        file = await bot.get_file(message.voice.file_id)
+        buf = BytesIO()
+        await bot.download_file(file.file_path, buf)
+        recognized = await salute_speech.recognize_from_telegram_voice(buf.getvalue())
+    except Exception as e:
+        logger.error(f"Pantry voice error: {e}")
+        await message.answer("❌ Ошибка. Напиши текстом.")
+        return
+    if not recognized:
+        await message.answer("😕 Не распознано. Напиши текстом.")
+        return
+    await _remove(message, state, db_user, recognized)
+
+
+@router.message(PantryStates.removing, F.photo)
+async def remove_photo(message: Message, state: FSMContext, db_user: User, bot: Bot):
+    # Распознавание то же, что при вводе продуктов; найденное сверяется с запасами
+    msg = await message.answer("📸 Анализирую фото... ⏳")
+    try:
+        file = await bot.get_file(message.photo[-1].file_id)
+        buf = BytesIO()
+        await bot.download_file(file.file_path, buf)
+        products, _ = await gigachat.recognize_products_from_photo_fallback(buf.getvalue())
+    except Exception as e:
+        logger.error(f"Pantry photo error: {e}")
+        await msg.edit_text("❌ Ошибка. Напиши текстом.")
+        return
+    if not products:
+        await msg.edit_text("📸 Не распознано 😕 Напиши текстом.")
+        return
+    await msg.delete()
+    await _remove(message, state, db_user, ", ".join(products))
@@ -7,16 +7,17 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from config import config
 from keyboards import premium_keyboard, main_menu_keyboard
 from payment_service import payment_service
-from database import UserDB
+from database import UserDB, PaymentDB
+from entitlements import PLANS, entitlements, price_text
 from models import User
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 
-@router.message(F.text == "⭐️ Premium")
+@router.message(F.text == "⭐️ Premium", flags={"profile": True})
 async def premium_info(message: Message, db_user: User):
-    if db_user.has_active_premium:
+    if entitlements.has_premium(db_user):
         until = db_user.premium_until.strftime('%d.%m.%Y') if db_user.premium_until else "?"
         await message.answer(
             f"⭐️ <b>Premium активен до {until}</b>\n\nСпасибо за поддержку! ❤️",
@@ -32,9 +33,7 @@ async def premium_info(message: Message, db_user: User):
         "✅ 🗓 План на неделю\n"
         "✅ 🥗 Учёт диет/аллергий\n"
         "✅ 📊 Подробный БЖУ\n\n"
-        "💰 1 мес — 490 ₽\n"
-        "💰 3 мес — 1 290 ₽\n"
-        "💰 12 мес — 3 990 ₽",
+        + "\n".join(f"💰 {months} мес — {price_text(price)} ₽" for months, price in PLANS.items()),
         parse_mode="HTML",
         reply_markup=premium_keyboard()
     )
@@ -43,8 +42,10 @@ async def premium_info(message: Message, db_user: User):
 @router.callback_query(F.data.startswith("buy_premium_"))
 async def buy_premium(callback: CallbackQuery, db_user: User):
     months = int(callback.data.split("_")[-1])
-    prices = {1: 490, 3: 1290, 12: 3990}
-    amount = prices.get(months, 490)
+    if months not in PLANS:
+        await callback.answer()
+        return
+    amount = PLANS[months]
 
     await callback.message.edit_text("💳 Создаю платёж...")
 
@@ -80,13 +81,26 @@ async def buy_premium(callback: CallbackQuery, db_user: User):
 async def check_payment(callback: CallbackQuery, db_user: User):
     payment_id = callback.data.replace("check_payment_", "")
 
-    try:
-        status = await payment_service.check_payment_status(payment_id)
-    except Exception:
-        await callback.answer("❌ Ошибка проверки", show_alert=True)
+    # Статус из БД: его обновляют вебхук и фоновая сверка (reconcile_payments);
+    # pending дополнительно сверяется с ЮKassa
+    payment = await PaymentDB.get_by_yukassa_id(payment_id)
+    if payment is None or payment.user_id != db_user.id:
+        await callback.answer("❌ Платёж не найден", show_alert=True)
         return
+    status = payment.status
+
+    if status == "pending":
+        # Вебхук мог задержаться — один раз спрашиваем ЮKassa напрямую
+        try:
+            result = await payment_service.sync_payment(payment_id)
+        except Exception as e:
+            logger.warning(f"Payment check {payment_id} failed: {e}")
+            result = {}
+        status = result.get("status", status)
 
     if status == "succeeded":
+        # Платёж мог применить другой процесс — запись доступа перечитается из БД
+        entitlements.invalidate(db_user.telegram_id)
         await callback.message.edit_text(
             "🎉 <b>Оплата прошла!</b>\n⭐️ Premium активирован!",
             parse_mode="HTML"
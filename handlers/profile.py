@@ -2,10 +2,10 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from database import UserDB
-from keyboards import diet_keyboard, allergies_keyboard, calories_keyboard
+from entitlements import entitlements
+from keyboards import diet_keyboard, allergies_keyboard, calories_keyboard, profile_keyboard
 from models import User
 
 router = Router()
@@ -16,7 +16,7 @@ class ProfileStates(StatesGroup):
     entering_excluded = State()
 
 
-@router.message(F.text == "👤 Профиль")
+@router.message(F.text == "👤 Профиль", flags={"profile": True})
 async def show_profile(message: Message, db_user: User):
     diet_names = {
         "normal": "🥩 Обычная", "vegetarian": "🥬 Вегетарианская",
@@ -28,18 +28,11 @@ async def show_profile(message: Message, db_user: User):
     allergies = ", ".join(db_user.allergies) if db_user.allergies else "Нет"
     excluded = ", ".join(db_user.excluded_products) if db_user.excluded_products else "Нет"
     calories = db_user.calories_goal or "Не указана"
-    premium_status = "⭐️ Активен" if db_user.has_active_premium else "❌ Не активен"
+    premium_status = "⭐️ Активен" if entitlements.has_premium(db_user) else "❌ Не активен"
     premium_until = ""
     if db_user.premium_until:
         premium_until = f" (до {db_user.premium_until.strftime('%d.%m.%Y')})"
 
-    builder = InlineKeyboardBuilder()
-    builder.button(text="🍽 Диета", callback_data="change_diet")
-    builder.button(text="⚠️ Аллергии", callback_data="change_allergies")
-    builder.button(text="🔥 Калории", callback_data="change_calories")
-    builder.button(text="🚫 Исключить", callback_data="change_excluded")
-    builder.adjust(2)
-
     await message.answer(
         f"👤 <b>Профиль</b>\n\n"
         f"🍽 Диета: {diet}\n"
@@ -50,7 +43,7 @@ async def show_profile(message: Message, db_user: User):
         f"📊 Рецептов всего: {db_user.total_recipes}\n"
         f"📊 Сегодня: {db_user.recipes_today}",
         parse_mode="HTML",
-        reply_markup=builder.as_markup()
+        reply_markup=profile_keyboard()
     )
 
 
@@ -76,7 +69,7 @@ async def set_diet(callback: CallbackQuery, db_user: User):
     await callback.answer()
 
 
-@router.callback_query(F.data == "change_allergies")
+@router.callback_query(F.data == "change_allergies", flags={"profile": True})
 async def change_allergies(callback: CallbackQuery, db_user: User):
     await callback.message.edit_text(
         "⚠️ Отметь аллергии:",
@@ -85,7 +78,8 @@ async def change_allergies(callback: CallbackQuery, db_user: User):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("allergy_") & ~F.data.endswith("done"))
+@router.callback_query(F.data.startswith("allergy_") & ~F.data.endswith("done"),
+                       flags={"profile": True})
 async def toggle_allergy(callback: CallbackQuery, db_user: User):
     allergen = callback.data.replace("allergy_", "")
     current = list(db_user.allergies or [])
@@ -102,7 +96,7 @@ async def toggle_allergy(callback: CallbackQuery, db_user: User):
     await callback.answer(f"{'✅' if allergen in current else '❌'} {allergen}")
 
 
-@router.callback_query(F.data == "allergy_done")
+@router.callback_query(F.data == "allergy_done", flags={"profile": True})
 async def allergies_done(callback: CallbackQuery, db_user: User):
     text = ", ".join(db_user.allergies) if db_user.allergies else "нет"
     await callback.message.edit_text(
@@ -147,7 +141,7 @@ async def save_custom_calories(message: Message, state: FSMContext, db_user: Use
     await message.answer(f"✅ Норма: <b>{calories} ккал/день</b>", parse_mode="HTML")
 
 
-@router.callback_query(F.data == "change_excluded")
+@router.callback_query(F.data == "change_excluded", flags={"profile": True})
 async def change_excluded(callback: CallbackQuery, state: FSMContext, db_user: User):
     current = ", ".join(db_user.excluded_products) if db_user.excluded_products else "нет"
     await callback.message.edit_text(
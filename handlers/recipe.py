@@ -9,10 +9,15 @@ from aiogram.fsm.state import State, StatesGroup
 
 from config import config
 from database import UserDB, RecipeDB
+from entitlements import PLANS, entitlements
+from food_lexicon import unique_products
 from gigachat_service import gigachat
+from pantry import pantry, pantry_preview
+from recipe_store import recipe_store
+from recipe_render import renderer
 from speech_service import salute_speech
 from keyboards import (
-    confirm_products_keyboard, recipe_actions_keyboard,
+    confirm_products_keyboard, recipe_actions_keyboard, pantry_keyboard,
     recipe_count_keyboard, premium_keyboard
 )
 from models import User
@@ -29,98 +34,23 @@ class RecipeStates(StatesGroup):
     viewing_recipes = State()
 
 
-def format_recipe(recipe: dict, index: int) -> str:
-    """Подробное форматирование рецепта"""
-    title = recipe.get("title", "Без названия")
-    desc = recipe.get("description", "")
-    cooking_time = recipe.get("cooking_time", "?")
-    difficulty = recipe.get("difficulty", "средне")
-    portions = recipe.get("portions", 1)
-    calories = recipe.get("calories", "?")
-    proteins = recipe.get("proteins", "?")
-    fats = recipe.get("fats", "?")
-    carbs = recipe.get("carbs", "?")
-    cost = recipe.get("estimated_cost", "?")
-    tips = recipe.get("tips", "")
-
-    # Заголовок
-    text = (
-        f"{'═' * 30}\n"
-        f"🍽 <b>Рецепт #{index + 1}: {title}</b>\n"
-        f"{'═' * 30}\n"
-    )
-
-    if desc:
-        text += f"\n📖 <i>{desc}</i>\n"
-
-    # Инфо
-    diff_emoji = {"легко": "🟢", "средне": "🟡", "сложно": "🔴"}.get(difficulty, "🟡")
-    text += (
-        f"\n⏱ <b>Время:</b> {cooking_time} мин\n"
-        f"{diff_emoji} <b>Сложность:</b> {difficulty}\n"
-        f"🍽 <b>Порций:</b> {portions}\n"
-        f"💰 <b>Стоимость:</b> ~{cost} ₽\n"
-    )
-
-    # БЖУ
-    text += (
-        f"\n📊 <b>Пищевая ценность (1 порция):</b>\n"
-        f"  🔥 Калории: {calories} ккал\n"
-        f"  🥩 Белки: {proteins} г\n"
-        f"  🧈 Жиры: {fats} г\n"
-        f"  🍞 Углеводы: {carbs} г\n"
+async def _show_recipe(message, recipe_ids: list[str], index: int, page: int = 0,
+                       recipe: dict = None, prefix: str = ""):
+    """Страница рецепта одним edit_text; страницы берутся из кэша отрисовки"""
+    recipe_id = recipe_ids[index]
+    pages = renderer.cached(recipe_id, index)
+    if pages is None:
+        recipe = recipe or await recipe_store.get(recipe_id)
+        if recipe is None:
+            return False
+        pages = renderer.pages(recipe, index, recipe_id)
+    page = min(page, len(pages) - 1)
+    await message.edit_text(
+        prefix + pages[page],
+        parse_mode="HTML",
+        reply_markup=recipe_actions_keyboard(index, page, len(pages))
     )
-
-    # Ингредиенты
-    ingredients = recipe.get("ingredients", [])
-    text += f"\n📝 <b>Ингредиенты:</b>\n"
-
-    have_list = []
-    need_list = []
-    for ing in ingredients:
-        name = ing.get("name", "")
-        amount = ing.get("amount", "")
-        have = ing.get("have", True)
-        substitute = ing.get("substitute", "")
-
-        line = f"{name} — {amount}"
-        if substitute and not have:
-            line += f" (замена: {substitute})"
-
-        if have:
-            have_list.append(f"  ✅ {line}")
-        else:
-            need_list.append(f"  ❌ {line}")
-
-    for line in have_list:
-        text += line + "\n"
-    for line in need_list:
-        text += line + "\n"
-
-    if need_list:
-        text += f"\n🛒 <b>Нужно докупить: {len(need_list)} продукт(ов)</b>\n"
-
-    # Пошаговое приготовление
-    steps = recipe.get("steps", [])
-    if steps:
-        text += f"\n👨‍🍳 <b>Приготовление:</b>\n\n"
-        for s in steps:
-            step_num = s.get("step", "")
-            step_text = s.get("text", "")
-            step_time = s.get("time", "")
-            time_str = f" ⏱ {step_time}" if step_time else ""
-            text += f"<b>{step_num}.</b> {step_text}{time_str}\n\n"
-    else:
-        # Фоллбэк на старый формат
-        instructions = recipe.get("instructions", "")
-        if instructions:
-            text += f"\n👨‍🍳 <b>Приготовление:</b>\n{instructions}\n"
-
-    # Советы
-    if tips:
-        text += f"💡 <b>Совет:</b> {tips}\n"
-
-    return text
+    return True
 
 
 async def _show_products(msg, products, recognized_text=None):
@@ -146,27 +76,30 @@ async def _show_products(msg, products, recognized_text=None):
 
 @router.message(F.text == "🍳 Что приготовить?")
 async def start_recipe(message: Message, state: FSMContext, db_user: User):
-    if not db_user.can_get_recipe(config.FREE_RECIPES_PER_DAY):
+    if not entitlements.can(db_user, "recipe"):
         await message.answer(
             f"⚠️ Лимит {config.FREE_RECIPES_PER_DAY} рецепта/день исчерпан!\n\n"
-            f"⭐️ Premium — 490 ₽/мес — безлимит!",
+            f"⭐️ Premium — {PLANS[1]} ₽/мес — безлимит!",
             parse_mode="HTML",
             reply_markup=premium_keyboard()
         )
         return
 
-    used = db_user.recipes_today if db_user.last_recipe_date else 0
-    remaining = config.FREE_RECIPES_PER_DAY - used
+    remaining = entitlements.recipes_left(db_user)
     limit = f"📊 Осталось: {remaining}/{config.FREE_RECIPES_PER_DAY}" \
-        if not db_user.has_active_premium else "⭐️ Безлимит"
+        if remaining is not None else "⭐️ Безлимит"
+
+    stock = await pantry.products(db_user.id)
+    stock_text = f"\n\n🧺 <b>В запасах:</b> {pantry_preview(stock)}" if stock else ""
 
     await message.answer(
         f"🧊 <b>Что в холодильнике?</b>\n\n"
         f"📝 Напиши текстом\n"
         f"🎤 Отправь голосовое\n"
         f"📸 Сфоткай продукты\n\n"
-        f"{limit}",
-        parse_mode="HTML"
+        f"{limit}{stock_text}",
+        parse_mode="HTML",
+        reply_markup=pantry_keyboard(len(stock)) if stock else None
     )
     await state.set_state(RecipeStates.waiting_for_products)
 
@@ -372,7 +305,7 @@ async def add_text(message: Message, state: FSMContext, db_user: User):
     except Exception:
         await message.answer("❌ Ошибка.")
         return
-    all_p = list(set(existing + new))
+    all_p = unique_products(existing + new)
     await state.update_data(products=all_p)
     await state.set_state(RecipeStates.waiting_for_products)
     await _show_products(message, all_p)
@@ -392,7 +325,7 @@ async def add_voice(message: Message, state: FSMContext, db_user: User, bot: Bot
             await msg.edit_text("😕 Не распознано.")
             return
         new = await gigachat.recognize_products_from_voice(recognized)
-        all_p = list(set(existing + new))
+        all_p = unique_products(existing + new)
         await state.update_data(products=all_p)
         await state.set_state(RecipeStates.waiting_for_products)
         await _show_products(msg, all_p, recognized)
@@ -412,7 +345,7 @@ async def add_photo(message: Message, state: FSMContext, db_user: User, bot: Bot
         buf = BytesIO()
         await bot.download_file(file.file_path, buf)
         new, _ = await gigachat.recognize_products_from_photo_fallback(buf.getvalue())
-        all_p = list(set(existing + new))
+        all_p = unique_products(existing + new)
         await state.update_data(products=all_p)
         await state.set_state(RecipeStates.waiting_for_products)
         if new:
@@ -430,6 +363,12 @@ async def add_photo(message: Message, state: FSMContext, db_user: User, bot: Bot
 
 @router.callback_query(F.data == "confirm_products")
 async def confirm(callback: CallbackQuery, state: FSMContext, db_user: User):
+    # Подтверждённое пополняет запасы — в следующий раз распознавать не придётся
+    data = await state.get_data()
+    try:
+        await pantry.add(db_user.id, data.get("products", []))
+    except Exception as e:
+        logger.error(f"Pantry update error: {e}")
     await callback.message.edit_text("🔢 Сколько рецептов?", reply_markup=recipe_count_keyboard())
     await state.set_state(RecipeStates.choosing_recipe_count)
     await callback.answer()
@@ -443,11 +382,12 @@ async def restart(callback: CallbackQuery, state: FSMContext, db_user: User):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("recipes_count_"))
+@router.callback_query(F.data.startswith("recipes_count_"),
+                       flags={"single_flight": "recipes", "profile": True})
 async def generate(callback: CallbackQuery, state: FSMContext, db_user: User):
     count = int(callback.data.split("_")[-1])
 
-    if not db_user.can_get_recipe(config.FREE_RECIPES_PER_DAY):
+    if not entitlements.can(db_user, "recipe"):
         await callback.message.edit_text("⚠️ Лимит!", reply_markup=premium_keyboard())
         await callback.answer()
         return
@@ -475,38 +415,18 @@ async def generate(callback: CallbackQuery, state: FSMContext, db_user: User):
         await callback.answer()
         return
 
-    await state.update_data(recipes=recipes, current_recipe=0)
+    # В FSM — только id и курсор, сами рецепты в recipe_store
+    recipe_ids = await recipe_store.put_many(recipes)
+    await state.update_data(recipe_ids=recipe_ids, current_recipe=0)
     await state.set_state(RecipeStates.viewing_recipes)
     await UserDB.increment_recipe(db_user.telegram_id)
+    entitlements.record_recipe(db_user.telegram_id)
 
-    # Показываем первый рецепт
-    recipe_text = format_recipe(recipes[0], 0)
-
-    # Telegram лимит 4096 символов — разбиваем если нужно
-    if len(recipe_text) > 4000:
-        # Отправляем в 2 сообщения
-        mid = len(recipe_text) // 2
-        # Ищем ближайший перенос строки
-        split_pos = recipe_text.rfind("\n", 0, mid + 500)
-        if split_pos == -1:
-            split_pos = mid
-
-        await callback.message.edit_text(
-            f"🎉 <b>Найдено {len(recipes)} рецепт(ов)!</b>\n\n" + recipe_text[:split_pos],
-            parse_mode="HTML"
-        )
-        await callback.message.answer(
-            recipe_text[split_pos:],
-            parse_mode="HTML",
-            reply_markup=recipe_actions_keyboard(0)
-        )
-    else:
-        await callback.message.edit_text(
-            f"🎉 <b>Найдено {len(recipes)}!</b>\n\n{recipe_text}",
-            parse_mode="HTML",
-            reply_markup=recipe_actions_keyboard(0)
-        )
-
+    # Отрисовываем все сразу — листание дальше только из кэша
+    for i, (recipe_id, recipe) in enumerate(zip(recipe_ids, recipes)):
+        renderer.pages(recipe, i, recipe_id)
+    await _show_recipe(callback.message, recipe_ids, 0,
+                       prefix=f"🎉 <b>Найдено {len(recipes)}!</b>\n\n")
     await callback.answer()
 
 
@@ -517,53 +437,42 @@ async def generate(callback: CallbackQuery, state: FSMContext, db_user: User):
 @router.callback_query(F.data == "next_recipe")
 async def next_recipe(callback: CallbackQuery, state: FSMContext, db_user: User):
     data = await state.get_data()
-    recipes = data.get("recipes", [])
+    recipe_ids = data.get("recipe_ids", [])
+    if not recipe_ids:
+        await callback.answer("⌛ Рецепты устарели. Нажми «🍳 Что приготовить?»", show_alert=True)
+        return
     current = data.get("current_recipe", 0)
-    next_idx = (current + 1) % len(recipes)
+    next_idx = (current + 1) % len(recipe_ids)
+
+    if not await _show_recipe(callback.message, recipe_ids, next_idx):
+        await callback.answer("⌛ Рецепты устарели. Нажми «🍳 Что приготовить?»", show_alert=True)
+        return
     await state.update_data(current_recipe=next_idx)
+    await callback.answer()
 
-    recipe_text = format_recipe(recipes[next_idx], next_idx)
 
-    if len(recipe_text) > 4000:
-        split_pos = recipe_text.rfind("\n", 0, 2000)
-        if split_pos == -1:
-            split_pos = 2000
-        await callback.message.edit_text(recipe_text[:split_pos], parse_mode="HTML")
-        await callback.message.answer(
-            recipe_text[split_pos:],
-            parse_mode="HTML",
-            reply_markup=recipe_actions_keyboard(next_idx)
-        )
-    else:
-        await callback.message.edit_text(
-            recipe_text, parse_mode="HTML",
-            reply_markup=recipe_actions_keyboard(next_idx)
-        )
+@router.callback_query(F.data.startswith("recipe_page_"))
+async def recipe_page(callback: CallbackQuery, state: FSMContext, db_user: User):
+    index, page = map(int, callback.data.split("_")[-2:])
+    recipe_ids = (await state.get_data()).get("recipe_ids", [])
+    if index >= len(recipe_ids) or not await _show_recipe(callback.message, recipe_ids,
+                                                           index, page):
+        await callback.answer("⌛ Рецепты устарели. Нажми «🍳 Что приготовить?»", show_alert=True)
+        return
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("save_recipe_"))
 async def save_recipe(callback: CallbackQuery, state: FSMContext, db_user: User):
     data = await state.get_data()
-    recipes = data.get("recipes", [])
     idx = int(callback.data.split("_")[-1])
-    if idx < len(recipes):
+    recipe = await recipe_store.get_at(data.get("recipe_ids", []), idx)
+    if recipe:
         try:
-            await RecipeDB.save(db_user.telegram_id, recipes[idx])
+            await RecipeDB.save(db_user.telegram_id, recipe)
             await callback.answer("✅ Сохранено!", show_alert=True)
         except Exception:
             await callback.answer("❌ Ошибка", show_alert=True)
     else:
         await callback.answer("❌ Не найден", show_alert=True)
 
-
-@router.message(F.text == "📋 Мои рецепты")
-async def my_recipes(message: Message, db_user: User):
-    recipes = await RecipeDB.get_user_recipes(db_user.telegram_id, limit=10)
-    if not recipes:
-        await message.answer("📋 Пусто. Нажми «🍳 Что приготовить?»")
-        return
-    text = "📋 <b>Сохранённые рецепты:</b>\n\n"
-    for i, r in enumerate(recipes, 1):
-        text += f"{i}. <b>{r.title}</b> — 🔥{r.calories or '?'} ккал, 💰~{r.estimated_cost or '?'}₽\n"
-    await message.answer(text, parse_mode="HTML")
@@ -0,0 +1,144 @@
+# handlers/saved_recipes.py
+import logging
+from html import escape
+
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+
+from database import RecipeDB
+from keyboards import my_recipes_keyboard, back_to_menu_keyboard
+from models import User
+from recipe_render import renderer
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 10
+
+
+class SavedRecipeStates(StatesGroup):
+    waiting_for_query = State()
+
+
+def _page_text(recipes, header: str = "📋 <b>Сохранённые рецепты:</b>") -> str:
+    text = f"{header}\n\n"
+    for r in recipes:
+        text += f"• <b>{r.recipe.title}</b> — 🔥{r.recipe.calories or '?'} ккал, 💰~{r.recipe.estimated_cost or '?'}₽\n"
+    return text + "\nНажми на рецепт, чтобы открыть 👇"
+
+
+@router.message(F.text == "📋 Мои рецепты")
+async def my_recipes(message: Message, db_user: User):
+    page = await RecipeDB.get_user_recipes_page(db_user.telegram_id, limit=PAGE_SIZE)
+    if not page.items:
+        await message.answer("📋 Пусто. Нажми «🍳 Что приготовить?»")
+        return
+    await message.answer(
+        _page_text(page.items),
+        parse_mode="HTML",
+        reply_markup=my_recipes_keyboard(page.items, page.has_older, page.has_newer)
+    )
+
+
+@router.callback_query(F.data.startswith("my_recipes_"))
+async def my_recipes_page(callback: CallbackQuery, db_user: User):
+    _, _, direction, cursor = callback.data.split("_")
+    cursor = int(cursor)
+
+    if direction == "older":
+        page = await RecipeDB.get_user_recipes_page(
+            db_user.telegram_id, limit=PAGE_SIZE, older_than=cursor
+        )
+    else:
+        page = await RecipeDB.get_user_recipes_page(
+            db_user.telegram_id, limit=PAGE_SIZE, newer_than=cursor
+        )
+
+    if not page.items:
+        await callback.answer("📋 Больше рецептов нет")
+        return
+
+    await callback.message.edit_text(
+        _page_text(page.items),
+        parse_mode="HTML",
+        reply_markup=my_recipes_keyboard(page.items, page.has_older, page.has_newer)
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("open_recipe_"))
+async def open_recipe(callback: CallbackQuery, db_user: User):
+    recipe_id = int(callback.data.split("_")[-1])
+    saved = await RecipeDB.get_user_recipe(db_user.telegram_id, recipe_id)
+    if not saved:
+        await callback.answer("❌ Рецепт не найден", show_alert=True)
+        return
+
+    pages = renderer.pages(saved.as_dict(), 0, saved.recipe_hash)
+    await callback.message.answer(
+        pages[0], parse_mode="HTML",
+        reply_markup=back_to_menu_keyboard(f"saved_page_{recipe_id}_", 0, len(pages))
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("saved_page_"))
+async def saved_recipe_page(callback: CallbackQuery, db_user: User):
+    recipe_id, page = map(int, callback.data.split("_")[-2:])
+    saved = await RecipeDB.get_user_recipe(db_user.telegram_id, recipe_id)
+    if not saved:
+        await callback.answer("❌ Рецепт не найден", show_alert=True)
+        return
+    pages = renderer.pages(saved.as_dict(), 0, saved.recipe_hash)
+    page = min(page, len(pages) - 1)
+    await callback.message.edit_text(
+        pages[page], parse_mode="HTML",
+        reply_markup=back_to_menu_keyboard(f"saved_page_{recipe_id}_", page, len(pages))
+    )
+    await callback.answer()
+
+
+# ═══════════════════════════════════════
+# ПОИСК
+# ═══════════════════════════════════════
+
+async def _send_search_results(message: Message, db_user: User, query: str):
+    recipes = await RecipeDB.search(db_user.telegram_id, query, limit=PAGE_SIZE)
+    if not recipes:
+        await message.answer(
+            f"🔎 По запросу «{escape(query)}» ничего не нашёл.\n"
+            f"Попробуй другое слово или нажми «🍳 Что приготовить?»"
+        )
+        return
+    await message.answer(
+        _page_text(recipes, header=f"🔎 <b>Найдено по «{escape(query)}»:</b>"),
+        parse_mode="HTML",
+        reply_markup=my_recipes_keyboard(recipes, has_older=False, has_newer=False)
+    )
+
+
+@router.message(Command("find"))
+async def cmd_find(message: Message, command: CommandObject, state: FSMContext,
+                   db_user: User):
+    if command.args:
+        await state.clear()
+        await _send_search_results(message, db_user, command.args.strip())
+        return
+    await message.answer("🔎 Что ищем? Напиши название или продукт, например «курица»")
+    await state.set_state(SavedRecipeStates.waiting_for_query)
+
+
+@router.callback_query(F.data == "search_recipes")
+async def search_recipes(callback: CallbackQuery, state: FSMContext, db_user: User):
+    await callback.message.answer("🔎 Что ищем? Напиши название или продукт, например «курица»")
+    await state.set_state(SavedRecipeStates.waiting_for_query)
+    await callback.answer()
+
+
+@router.message(SavedRecipeStates.waiting_for_query, F.text)
+async def search_query(message: Message, state: FSMContext, db_user: User):
+    await state.clear()
+    await _send_search_results(message, db_user, message.text.strip())
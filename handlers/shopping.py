@@ -6,122 +6,41 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 
 from gigachat_service import gigachat
+from product_matcher import matcher_for
+from recipe_store import recipe_store
 from models import User
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 
-def _normalize(text: str) -> str:
-    """Нормализация названия продукта для сравнения"""
-    import re
-    text = text.lower().strip()
-    # Убираем всё кроме букв и пробелов
-    text = re.sub(r'[^а-яёa-z\s]', '', text)
-    # Убираем лишние пробелы
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
-
-def _product_matches(ingredient_name: str, user_products: list[str]) -> bool:
-    """
-    Проверяет есть ли ингредиент в списке продуктов пользователя.
-    Умное сравнение: 'куриная грудка' найдётся если у пользователя 'курица'
-    """
-    ing = _normalize(ingredient_name)
-
-    if not ing:
-        return False
-
-    for product in user_products:
-        prod = _normalize(product)
-        if not prod:
-            continue
-
-        # Точное совпадение
-        if ing == prod:
-            return True
-
-        # Один содержит другой
-        if ing in prod or prod in ing:
-            return True
-
-        # Совпадение по корню (первые 4+ букв)
-        ing_words = ing.split()
-        prod_words = prod.split()
-
-        for iw in ing_words:
-            for pw in prod_words:
-                # Берём минимум 4 символа для корня
-                min_len = min(len(iw), len(pw))
-                if min_len >= 4:
-                    root_len = max(4, min_len - 2)
-                    if iw[:root_len] == pw[:root_len]:
-                        return True
-
-    return False
-
-
 def _find_missing_ingredients(recipe: dict, user_products: list[str]) -> list[dict]:
     """
     Определяем недостающие ингредиенты САМОСТОЯТЕЛЬНО,
     не доверяя полю have от GigaChat.
     """
-    # Базовые продукты которые есть у всех
-    basic_products = {
-        "соль", "перец", "вода", "сахар", "масло растительное",
-        "масло подсолнечное", "масло оливковое", "чёрный перец",
-        "перец чёрный молотый", "лавровый лист", "уксус",
-        "растительное масло", "подсолнечное масло"
-    }
-
     ingredients = recipe.get("ingredients", [])
-    missing = []
-
-    logger.info(f"User products: {user_products}")
-    logger.info(f"Recipe ingredients: {[i.get('name', '') for i in ingredients]}")
-
-    for ing in ingredients:
-        name = ing.get("name", "")
-        amount = ing.get("amount", "")
-
-        if not name:
-            continue
+    missing = matcher_for(user_products).missing(ingredients)
 
-        normalized = _normalize(name)
-
-        # Пропускаем базовые
-        if normalized in basic_products:
-            continue
-
-        # Проверяем есть ли у пользователя
-        has_it = _product_matches(name, user_products)
-
-        logger.info(f"  '{name}' -> {'ЕСТЬ' if has_it else 'НЕТ'}")
-
-        if not has_it:
-            missing.append({
-                "name": name,
-                "amount": amount,
-                "substitute": ing.get("substitute", "")
-            })
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("User products: %s", user_products)
+        logger.debug("Recipe ingredients: %s", [i.get("name", "") for i in ingredients])
+        logger.debug("Missing: %s", [m["name"] for m in missing])
 
     return missing
 
 
-@router.callback_query(F.data.startswith("shopping_"))
+@router.callback_query(F.data.startswith("shopping_"), flags={"single_flight": "shopping"})
 async def shopping_list(callback: CallbackQuery, state: FSMContext, db_user: User):
     data = await state.get_data()
-    recipes = data.get("recipes", [])
     products = data.get("products", [])  # Продукты пользователя
     idx = int(callback.data.split("_")[-1])
 
-    if idx >= len(recipes):
+    recipe = await recipe_store.get_at(data.get("recipe_ids", []), idx)
+    if not recipe:
         await callback.answer("❌ Рецепт не найден", show_alert=True)
         return
 
-    recipe = recipes[idx]
-
     # Сами определяем что нужно докупить
     missing = _find_missing_ingredients(recipe, products)
 
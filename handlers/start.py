@@ -42,6 +42,7 @@ HELP_TEXT = """
 /start — Перезапуск бота
 /help — Эта справка
 /profile — Настройки профиля
+/find — Поиск по сохранённым рецептам
 /premium — Информация о подписке
 
 <b>Как отправить продукты:</b>
@@ -54,7 +55,7 @@ HELP_TEXT = """
 """
 
 
-@router.message(CommandStart())
+@router.message(CommandStart(), flags={"profile": True})
 async def cmd_start(message: Message, db_user: User):
     await message.answer(
         WELCOME_TEXT,
@@ -0,0 +1,108 @@
+# jobs.py
+"""Периодическое обслуживание — выполняется планировщиком вне обработки апдейтов"""
+import logging
+from datetime import date, timedelta
+from functools import partial
+
+from aiogram.fsm.storage.base import BaseStorage
+
+from broadcast import broadcaster
+from config import config
+from database import UserDB
+from pantry import pantry
+from payment_service import payment_service
+from recipe_store import recipe_store
+from rate_limiter import token_buckets
+from send_queue import outbox
+from scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+
+async def expire_premiums():
+    expired = await UserDB.check_expired_premiums(batch_size=500)
+    if expired:
+        return f"premium expired for {expired} users"
+
+
+async def reconcile_payments():
+    changed = await payment_service.reconcile_pending(
+        older_than=timedelta(minutes=config.RECONCILE_AFTER_MINUTES),
+        concurrency=config.RECONCILE_CONCURRENCY
+    )
+    for result in changed:
+        if result["activated"]:
+            outbox.enqueue(result["telegram_id"], "🎉 Premium активирован!")
+    if changed:
+        return f"reconciled {len(changed)} pending payments"
+
+
+async def daily_usage_rollover():
+    day = date.today() - timedelta(days=1)
+    stat = await UserDB.rollover_daily_usage(day)
+    return (
+        f"{day}: active={stat.active_users} recipes={stat.recipes} "
+        f"new={stat.new_users} premium={stat.premium_users}"
+    )
+
+
+async def purge_fsm_sessions(storage: BaseStorage):
+    purged = await storage.purge_expired()
+    if purged:
+        return f"purged {purged} idle FSM sessions"
+
+
+async def purge_recipe_blobs():
+    purged = await recipe_store.purge_expired()
+    if purged:
+        return f"purged {purged} expired recipe blobs"
+
+
+async def expire_pantry():
+    purged = await pantry.purge_expired()
+    if purged:
+        return f"expired {purged} perishable pantry items"
+
+
+async def compact_fsm_cache(storage: BaseStorage):
+    evicted = storage.compact()
+    if evicted:
+        return f"evicted {evicted} idle FSM cache entries"
+
+
+async def evict_idle_rate_buckets():
+    evicted = token_buckets.evict_idle()
+    if evicted:
+        return f"evicted {evicted} idle rate-limit buckets"
+
+
+async def evict_idle_send_lanes():
+    evicted = outbox.evict_idle()
+    if evicted:
+        return f"evicted {evicted} idle send lanes"
+
+
+def setup_jobs(scheduler: Scheduler, fsm_storage: BaseStorage = None, shared: bool = True):
+    """shared=False — только кэши своего процесса (воркеры кластера), без задач по БД"""
+    scheduler.every("evict_idle_rate_buckets", 5 * 60, evict_idle_rate_buckets, jitter=30)
+    scheduler.every("evict_idle_send_lanes", 5 * 60, evict_idle_send_lanes, jitter=30)
+    if not shared:
+        if hasattr(fsm_storage, "compact"):
+            scheduler.every("compact_fsm_cache", 15 * 60, partial(compact_fsm_cache, fsm_storage),
+                            jitter=60)
+        return
+
+    scheduler.every("expire_premiums", 10 * 60, expire_premiums, jitter=30)
+    scheduler.every("reconcile_payments", 2 * 60, reconcile_payments, jitter=15)
+    scheduler.every("purge_recipe_blobs", 30 * 60, purge_recipe_blobs, jitter=60)
+    scheduler.every("expire_pantry", 60 * 60, expire_pantry, jitter=120)
+    if hasattr(fsm_storage, "purge_expired"):
+        scheduler.every("purge_fsm_sessions", 15 * 60, partial(purge_fsm_sessions, fsm_storage),
+                        jitter=60)
+    scheduler.cron("daily_usage_rollover", daily_usage_rollover, minute="5", hour="0", jitter=60)
+    # 10:00 и 17:00 по Москве
+    scheduler.cron("premium_expiry_reminders", partial(broadcaster.run, "premium_expiry"),
+                   minute="0", hour="7")
+    if config.NUDGE_ACTIVE_DAYS:
+        scheduler.cron("daily_nudge", partial(broadcaster.run, "daily_nudge"),
+                       minute="0", hour="14")
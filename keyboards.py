@@ -1,11 +1,41 @@
 # keyboards.py
+"""
+Клавиатуры.
+
+Разметка aiogram неизменяема (frozen pydantic), поэтому одну и ту же
+клавиатуру можно отдавать всем: статические строятся один раз при
+импорте, параметризованные кэшируются (аллергии — все 64 варианта
+по битовой маске сразу). MarkupCacheSession сериализует каждую такую
+клавиатуру в JSON один раз, а не на каждый запрос к Bot API.
+"""
+from collections import OrderedDict
+from functools import lru_cache, wraps
+from typing import Any
+
+from aiohttp import FormData
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import TelegramMethod
 from aiogram.types import (
     ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardMarkup, InlineKeyboardButton
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 
+from entitlements import PLANS
+
+
+def _once(build):
+    """Статическая клавиатура: строится при импорте, дальше отдаётся готовая"""
+    markup = build()
+
+    @wraps(build)
+    def get():
+        return markup
+    return get
+
 
+@_once
 def main_menu_keyboard() -> ReplyKeyboardMarkup:
     """Главное меню"""
     builder = ReplyKeyboardBuilder()
@@ -24,6 +54,7 @@ def main_menu_keyboard() -> ReplyKeyboardMarkup:
     return builder.as_markup(resize_keyboard=True)
 
 
+@_once
 def diet_keyboard() -> InlineKeyboardMarkup:
     """Выбор типа диеты"""
     builder = InlineKeyboardBuilder()
@@ -41,48 +72,79 @@ def diet_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def allergies_keyboard(selected: list[str] = None) -> InlineKeyboardMarkup:
-    """Выбор аллергий"""
-    selected = selected or []
+ALLERGIES = [
+    ("Глютен", "глютен"),
+    ("Лактоза", "лактоза"),
+    ("Орехи", "орехи"),
+    ("Яйца", "яйца"),
+    ("Морепродукты", "морепродукты"),
+    ("Соя", "соя"),
+]
+
+
+def _build_allergies_keyboard(mask: int) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
-    allergies = [
-        ("Глютен", "allergy_глютен"),
-        ("Лактоза", "allergy_лактоза"),
-        ("Орехи", "allergy_орехи"),
-        ("Яйца", "allergy_яйца"),
-        ("Морепродукты", "allergy_морепродукты"),
-        ("Соя", "allergy_соя"),
-    ]
-    for text, callback in allergies:
-        allergen = callback.replace("allergy_", "")
-        mark = "✅ " if allergen in selected else ""
-        builder.button(text=f"{mark}{text}", callback_data=callback)
+    for bit, (text, allergen) in enumerate(ALLERGIES):
+        mark = "✅ " if mask & (1 << bit) else ""
+        builder.button(text=f"{mark}{text}", callback_data=f"allergy_{allergen}")
 
     builder.button(text="✔️ Готово", callback_data="allergy_done")
     builder.adjust(2)
     return builder.as_markup()
 
 
-def recipe_actions_keyboard(recipe_index: int) -> InlineKeyboardMarkup:
+# Все сочетания отметок — 2^6 клавиатур, индекс — битовая маска
+_ALLERGY_KEYBOARDS = tuple(_build_allergies_keyboard(mask) for mask in range(1 << len(ALLERGIES)))
+
+
+def allergies_keyboard(selected: list[str] = None) -> InlineKeyboardMarkup:
+    """Выбор аллергий"""
+    selected = selected or []
+    mask = 0
+    for bit, (_, allergen) in enumerate(ALLERGIES):
+        if allergen in selected:
+            mask |= 1 << bit
+    return _ALLERGY_KEYBOARDS[mask]
+
+
+def page_buttons(prefix: str, page: int, pages: int) -> list[InlineKeyboardButton]:
+    """Листание страниц длинного текста: callback_data = {prefix}{страница}"""
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text=f"⬅️ {page}/{pages}",
+                                            callback_data=f"{prefix}{page - 1}"))
+    if page + 1 < pages:
+        buttons.append(InlineKeyboardButton(text=f"{page + 2}/{pages} ➡️",
+                                            callback_data=f"{prefix}{page + 1}"))
+    return buttons
+
+
+@lru_cache(maxsize=256)
+def recipe_actions_keyboard(recipe_index: int, page: int = 0,
+                            pages: int = 1) -> InlineKeyboardMarkup:
     """Действия с рецептом"""
     builder = InlineKeyboardBuilder()
     builder.button(text="💾 Сохранить", callback_data=f"save_recipe_{recipe_index}")
     builder.button(text="🛒 Список покупок", callback_data=f"shopping_{recipe_index}")
     builder.button(text="➡️ Другой рецепт", callback_data="next_recipe")
     builder.adjust(2)
+    if pages > 1:
+        builder.row(*page_buttons(f"recipe_page_{recipe_index}_", page, pages))
     return builder.as_markup()
 
 
+@_once
 def premium_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура покупки Premium"""
     builder = InlineKeyboardBuilder()
-    builder.button(text="��� Подписка — 1 мес (490 ₽)", callback_data="buy_premium_1")
-    builder.button(text="💳 Подписка — 3 мес (1290 ₽)", callback_data="buy_premium_3")
-    builder.button(text="💳 Подписка — 12 мес (3990 ₽)", callback_data="buy_premium_12")
+    for months, price in PLANS.items():
+        builder.button(text=f"💳 Подписка — {months} мес ({price} ₽)",
+                       callback_data=f"buy_premium_{months}")
     builder.adjust(1)
     return builder.as_markup()
 
 
+@_once
 def confirm_products_keyboard() -> InlineKeyboardMarkup:
     """Подтверждение списка продуктов"""
     builder = InlineKeyboardBuilder()
@@ -93,6 +155,7 @@ def confirm_products_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@_once
 def recipe_count_keyboard() -> InlineKeyboardMarkup:
     """Сколько рецептов предложить"""
     builder = InlineKeyboardBuilder()
@@ -103,12 +166,28 @@ def recipe_count_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def back_to_menu_keyboard() -> InlineKeyboardMarkup:
+@lru_cache(maxsize=64)
+def pantry_keyboard(count: int) -> InlineKeyboardMarkup:
+    """Старт из запасов в одно нажатие"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text=f"🧺 Из моих продуктов ({count})", callback_data="use_pantry")
+    builder.button(text="➖ Что-то закончилось", callback_data="pantry_remove")
+    builder.button(text="🗑 Очистить запасы", callback_data="pantry_clear")
+    builder.adjust(1, 2)
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=1024)
+def back_to_menu_keyboard(page_prefix: str = None, page: int = 0,
+                          pages: int = 1) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
-    builder.button(text="🏠 В меню", callback_data="back_to_menu")
+    if pages > 1:
+        builder.row(*page_buttons(page_prefix, page, pages))
+    builder.row(InlineKeyboardButton(text="🏠 В меню", callback_data="back_to_menu"))
     return builder.as_markup()
 
 
+@_once
 def meal_plan_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="📋 Показать список покупок", callback_data="show_weekly_shopping")
@@ -118,6 +197,7 @@ def meal_plan_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@_once
 def calories_keyboard() -> InlineKeyboardMarkup:
     """Выбор дневной нормы калорий"""
     builder = InlineKeyboardBuilder()
@@ -134,6 +214,7 @@ def calories_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@_once
 def input_method_keyboard() -> InlineKeyboardMarkup:
     """Выбор способа ввода продуктов"""
     builder = InlineKeyboardBuilder()
@@ -141,4 +222,88 @@ def input_method_keyboard() -> InlineKeyboardMarkup:
     builder.button(text="🎤 Голосовое сообщение", callback_data="input_voice")
     builder.button(text="📸 Отправить фото", callback_data="input_photo")
     builder.adjust(1)
-    return builder.as_markup()    
\ No newline at end of file
+    return builder.as_markup()
+
+
+def my_recipes_keyboard(recipes: list, has_older: bool,
+                        has_newer: bool) -> InlineKeyboardMarkup:
+    """Страница сохранённых рецептов: открыть рецепт + листание"""
+    builder = InlineKeyboardBuilder()
+    for r in recipes:
+        builder.button(text=f"🍽 {r.recipe.title[:40]}", callback_data=f"open_recipe_{r.id}")
+
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton(
+            text="⬅️ Новее", callback_data=f"my_recipes_newer_{recipes[0].id}"
+        ))
+    if has_older:
+        nav.append(InlineKeyboardButton(
+            text="Старее ➡️", callback_data=f"my_recipes_older_{recipes[-1].id}"
+        ))
+    builder.adjust(1)
+    if nav:
+        builder.row(*nav)
+    builder.row(InlineKeyboardButton(text="🔎 Поиск", callback_data="search_recipes"))
+    return builder.as_markup()
+
+
+@_once
+def profile_keyboard() -> InlineKeyboardMarkup:
+    """Настройки профиля"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🍽 Диета", callback_data="change_diet")
+    builder.button(text="⚠️ Аллергии", callback_data="change_allergies")
+    builder.button(text="🔥 Калории", callback_data="change_calories")
+    builder.button(text="🚫 Исключить", callback_data="change_excluded")
+    builder.adjust(2)
+    return builder.as_markup()
+
+
+class MarkupCacheSession(AiohttpSession):
+    """
+    Сессия Bot API, которая помнит JSON уже отправленных клавиатур.
+    Ключ — сам объект (по id, с проверкой на тот же объект): кэшированные
+    клавиатуры выше переиспользуются, одноразовые со временем вытесняются.
+
+    Клавиатура берётся из метода до model_dump — после него это уже
+    словарь, и узнать в нём тот же объект нельзя.
+    """
+
+    def __init__(self, cache_size: int = 512, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.cache_size = cache_size
+        self._markups: OrderedDict[int, tuple[Any, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _markup_json(self, markup: Any, bot: Bot, files: dict) -> str:
+        key = id(markup)
+        cached = self._markups.get(key)
+        if cached is not None and cached[0] is markup:
+            self._markups.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        prepared = self.prepare_value(markup.model_dump(warnings=False), bot=bot, files=files)
+        self._markups[key] = (markup, prepared)
+        if len(self._markups) > self.cache_size:
+            self._markups.popitem(last=False)
+        return prepared
+
+    def build_form_data(self, bot: Bot, method: TelegramMethod) -> FormData:
+        markup = getattr(method, "reply_markup", None)
+        if not isinstance(markup, (InlineKeyboardMarkup, ReplyKeyboardMarkup)):
+            return super().build_form_data(bot, method)
+
+        form = FormData(quote_fields=False)
+        files: dict = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if not value:
+                continue
+            form.add_field(key, value)
+        form.add_field("reply_markup", self._markup_json(markup, bot, files))
+        for key, value in files.items():
+            form.add_field(key, value.read(bot), filename=value.filename or key)
+        return form
@@ -0,0 +1,188 @@
+# logging_setup.py
+"""
+Логирование без затрат event loop.
+
+Хэндлер на корневом логгере только кладёт запись в очередь, форматирование
+и запись в stdout делает фоновый поток QueueListener. Записи — JSON
+с update_id/chat_id текущего апдейта (contextvars). Шумные DEBUG/INFO
+строки отдельных логгеров сэмплируются, уровни можно менять на ходу.
+
+Переменные окружения:
+    LOG_LEVEL=INFO
+    LOG_FORMAT=json | text
+    LOG_LEVELS=aiogram.event=WARNING,handlers.shopping=DEBUG
+    LOG_SAMPLING=handlers.shopping=0.05,speech_service=0.2
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from config import config
+
+update_id_var: ContextVar[Optional[int]] = ContextVar("update_id", default=None)
+chat_id_var: ContextVar[Optional[int]] = ContextVar("chat_id", default=None)
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["AsyncQueueHandler"] = None
+
+
+def _parse_pairs(raw: str) -> dict[str, str]:
+    pairs = {}
+    for item in raw.split(","):
+        name, sep, value = item.strip().partition("=")
+        if sep and name:
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.update_id is not None:
+            entry["update_id"] = record.update_id
+        if record.chat_id is not None:
+            entry["chat_id"] = record.chat_id
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextTextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        if record.update_id is not None:
+            line += f" [update={record.update_id} chat={record.chat_id}]"
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rate записей ниже WARNING для указанных логгеров (и их детей)"""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            prefix = name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    Ставит запись в очередь, не форматируя её в потоке event loop.
+    Контекст апдейта снимается здесь — в фоновом потоке его уже нет.
+    Переполненная очередь не блокирует: запись отбрасывается и считается.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.update_id = update_id_var.get()
+        record.chat_id = chat_id_var.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging():
+    """Настраивает корневой логгер; вызывается один раз при старте процесса"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if config.LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(ContextTextFormatter(TEXT_FORMAT))
+
+    _handler = AsyncQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+    rates = {name: float(rate) for name, rate in _parse_pairs(config.LOG_SAMPLING).items()}
+    if rates:
+        _handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(_handler)
+    root.setLevel(config.LOG_LEVEL.upper())
+    for name, level in _parse_pairs(config.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = QueueListener(_handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает очередь и останавливает фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def set_level(name: str, level: str):
+    """Меняет уровень логгера на ходу; name="" — корневой"""
+    logging.getLogger(name or None).setLevel(level.upper())
+
+
+def levels() -> dict[str, str]:
+    """Явно заданные уровни логгеров"""
+    result = {"": logging.getLevelName(logging.getLogger().level)}
+    for name, item in sorted(logging.root.manager.loggerDict.items()):
+        if isinstance(item, logging.Logger) and item.level != logging.NOTSET:
+            result[name] = logging.getLevelName(item.level)
+    return result
+
+
+def stats() -> dict:
+    return {
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "dropped": _handler.dropped if _handler else 0,
+    }
+
+
+def bind_update(update_id: Optional[int], chat_id: Optional[int]):
+    """Привязывает последующие записи к апдейту; возвращает токены для reset_update"""
+    return update_id_var.set(update_id), chat_id_var.set(chat_id)
+
+
+def reset_update(tokens):
+    update_id_var.reset(tokens[0])
+    chat_id_var.reset(tokens[1])
+
@@ -0,0 +1,311 @@
+# metrics.py
+"""
+Метрики в формате Prometheus — GET /metrics.
+
+Счётчики и гистограммы — простые объекты со слотами: наблюдение меняет
+готовые ячейки, без блокировок (всё в одном потоке event loop) и без
+новых объектов. Дочерняя метрика с метками создаётся один раз
+при первом обращении, дальше берётся из словаря.
+Значения, которые уже считают сами компоненты (кэши, очереди,
+планировщик), снимаются колбэками в момент scrape.
+В многопроцессном режиме каждый процесс считает своё.
+"""
+import asyncio
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Any, Callable, Iterable, Optional
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Границы по умолчанию — секунды, от быстрых запросов к БД до генерации в GigaChat
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя ячейка — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_since(self, started: float):
+        """started — значение time.perf_counter() до начала операции"""
+        self.observe(time.perf_counter() - started)
+
+
+class Family:
+    """Метрика с набором меток: family.labels("a", "b") -> Counter/Gauge/Histogram"""
+
+    def __init__(self, name: str, help_text: str, kind: str, labelnames: tuple,
+                 factory: Callable[[], Any]):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = labelnames
+        self._factory = factory
+        self._children: dict[tuple, Any] = {}
+
+    def labels(self, *values) -> Any:
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._factory()
+        return child
+
+    def samples(self) -> Iterable[tuple[str, tuple, float]]:
+        for values, child in self._children.items():
+            if self.kind == "histogram":
+                cumulative = 0
+                bounds = [_fmt(b) for b in child.bounds] + ["+Inf"]
+                for bound, count in zip(bounds, child.counts):
+                    cumulative += count
+                    yield "_bucket", values + (bound,), cumulative
+                yield "_sum", values, child.sum
+                yield "_count", values, child.count
+            else:
+                yield "", values, child.value
+
+
+class Registry:
+    def __init__(self):
+        self.families: dict[str, Family] = {}
+        self._callbacks: dict[str, tuple[str, str, tuple, list[Callable]]] = {}
+        self._on_scrape: list[Callable] = []
+
+    def _family(self, name, help_text, kind, labelnames, factory) -> Family:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = Family(name, help_text, kind, tuple(labelnames), factory)
+        return family
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Family:
+        return self._family(name, help_text, "counter", labelnames, Counter)
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = ()) -> Family:
+        return self._family(name, help_text, "gauge", labelnames, Gauge)
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Family:
+        return self._family(name, help_text, "histogram", labelnames, lambda: Histogram(buckets))
+
+    def callback(self, name: str, help_text: str, kind: str, func: Callable[[], Any],
+                 labelnames: tuple = ()):
+        """
+        Значение снимается при scrape: func() возвращает число
+        или {кортеж меток: число}. Несколько колбэков одного имени
+        выводятся одной метрикой.
+        """
+        entry = self._callbacks.setdefault(name, (help_text, kind, tuple(labelnames), []))
+        entry[3].append(func)
+
+    def on_scrape(self, func: Callable):
+        """Вызывается перед выводом (может быть async) — для значений, которые нужно посчитать"""
+        self._on_scrape.append(func)
+
+    async def render(self) -> str:
+        for func in self._on_scrape:
+            try:
+                result = func()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"Metrics collector {func} failed: {e}")
+
+        lines = []
+        for family in self.families.values():
+            bucket_names = family.labelnames + ("le",)
+            _header(lines, family.name, family.help, family.kind)
+            for suffix, values, value in family.samples():
+                names = bucket_names if suffix == "_bucket" else family.labelnames
+                lines.append(f"{family.name}{suffix}{_labels(names, values)} {_fmt(value)}")
+
+        for name, (help_text, kind, labelnames, funcs) in self._callbacks.items():
+            _header(lines, name, help_text, kind)
+            for func in funcs:
+                try:
+                    value = func()
+                except Exception as e:
+                    logger.warning(f"Metric {name} failed: {e}")
+                    continue
+                if isinstance(value, dict):
+                    for values, item in value.items():
+                        values = values if isinstance(values, tuple) else (values,)
+                        lines.append(f"{name}{_labels(labelnames, values)} {_fmt(item)}")
+                elif value is not None:
+                    lines.append(f"{name} {_fmt(value)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+def _header(lines: list, name: str, help_text: str, kind: str):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _fmt(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+registry = Registry()
+
+# ─── Общие метрики ───
+handler_seconds = registry.histogram(
+    "bot_handler_seconds", "Handler latency", ("handler",))
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Handler exceptions", ("handler",))
+upstream_seconds = registry.histogram(
+    "bot_upstream_seconds", "Upstream call latency", ("service", "op"))
+upstream_errors = registry.counter(
+    "bot_upstream_errors_total", "Failed upstream calls", ("service", "op"))
+db_query_seconds = registry.histogram(
+    "bot_db_query_seconds", "Database query latency", ("op",))
+loop_lag_seconds = registry.histogram(
+    "bot_event_loop_lag_seconds", "Event loop scheduling delay", buckets=LAG_BUCKETS).labels()
+
+
+def track(service: str, op: str):
+    """Декоратор async-функции: латентность, ошибки и span вызова внешнего сервиса"""
+    latency = upstream_seconds.labels(service, op)
+    errors = upstream_errors.labels(service, op)
+    name = f"{service}.{op}"
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with span(name):
+                    return await func(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                latency.observe_since(started)
+        return wrapper
+    return decorator
+
+
+def instrument_db(engine):
+    """Счётчики и длительность запросов через события SQLAlchemy"""
+    from sqlalchemy import event
+
+    ops = {}
+    for op in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+        ops[op] = db_query_seconds.labels(op)
+    other = db_query_seconds.labels("OTHER")
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        ops.get(statement.lstrip()[:6].upper(), other).observe_since(started)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def on_error(exception_context):
+        # after_cursor_execute при ошибке не вызывается — снимаем отметку здесь
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+class LoopLagMonitor:
+    """Раз в interval секунд замеряет, насколько позже заказанного проснулся loop"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, loop.time() - expected)
+            loop_lag_seconds.observe(self.last)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+loop_lag = LoopLagMonitor()
+registry.callback("bot_event_loop_lag_last_seconds", "Last measured event loop delay", "gauge",
+                  lambda: loop_lag.last)
+
+
+def cache_metrics(name: str, stats: Callable[[], tuple[int, int]]):
+    """Попадания/промахи кэша: stats() -> (hits, misses)"""
+    registry.callback("bot_cache_hits_total", "Cache hits", "counter",
+                      lambda: {name: stats()[0]}, ("cache",))
+    registry.callback("bot_cache_misses_total", "Cache misses", "counter",
+                      lambda: {name: stats()[1]}, ("cache",))
+
+    def ratio():
+        hits, misses = stats()
+        return {name: hits / (hits + misses) if hits + misses else 0.0}
+
+    registry.callback("bot_cache_hit_ratio", "Cache hit ratio", "gauge", ratio, ("cache",))
+
+
+async def metrics_view(request) -> "web.Response":
+    from aiohttp import web
+    return web.Response(text=await registry.render(), content_type="text/plain",
+                        headers={"X-Content-Type-Options": "nosniff"})
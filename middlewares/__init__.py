@@ -1,3 +1,5 @@
+from .log_context import LogContextMiddleware
 from .rate_limit import RateLimitMiddleware
+from .single_flight import SingleFlightMiddleware
 
-__all__ = ["RateLimitMiddleware"]
+__all__ = ["LogContextMiddleware", "RateLimitMiddleware", "SingleFlightMiddleware"]
@@ -0,0 +1,26 @@
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from logging_setup import bind_update, reset_update
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на update: все записи логов, сделанные при обработке
+    апдейта, получают его update_id и chat_id.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        chat = data.get("event_chat")
+        tokens = bind_update(event.update_id, chat.id if chat else None)
+        try:
+            return await handler(event, data)
+        finally:
+            reset_update(tokens)
@@ -0,0 +1,46 @@
+import time
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+from metrics import handler_seconds, handler_errors, upstream_seconds, upstream_errors
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner-middleware: латентность и ошибки каждого хэндлера (по имени функции).
+    Регистрируется последней, чтобы мерить сам хэндлер, а не лимиты.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.labels(name).inc()
+            raise
+        finally:
+            handler_seconds.labels(name).observe_since(started)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Латентность запросов к Bot API по методу (sendMessage, editMessageText, ...)"""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            upstream_errors.labels("telegram", name).inc()
+            raise
+        finally:
+            upstream_seconds.labels("telegram", name).observe_since(started)
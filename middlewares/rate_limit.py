@@ -1,13 +1,74 @@
+import time
 from typing import Callable, Dict, Any, Awaitable
 
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
 from aiogram.types import Message, CallbackQuery, TelegramObject
 
 from database import UserDB
+from entitlements import CachedUser, entitlements
+from rate_limiter import token_buckets
+
+# Класс действия → (ёмкость ведра, пополнение токенов/сек)
+RATE_LIMITS = {
+    "ui": (20, 2.0),            # кнопки меню, профиль, листание
+    "text": (5, 1 / 6),         # распознавание продуктов из текста — 10/мин
+    "media": (3, 1 / 20),       # голос/аудио/фото — 3/мин
+    "generate": (3, 1 / 30),    # генерация рецептов, плана, цен — 2/мин
+}
+
+GENERATE_CALLBACKS = ("recipes_count_", "shopping_", "regenerate_plan")
+GENERATE_TEXTS = {"🗓 План на неделю"}
+MENU_TEXTS = {"🍳 Что приготовить?", "📋 Мои рецепты", "🛒 Список покупок",
+              "👤 Профиль", "⭐️ Premium"}
+
+# Не чаще одного предупреждения на ведро за это время
+NOTICE_INTERVAL = 10.0
+
+
+def classify(event: TelegramObject) -> str:
+    if isinstance(event, CallbackQuery):
+        if event.data and event.data.startswith(GENERATE_CALLBACKS):
+            return "generate"
+        return "ui"
+    if isinstance(event, Message):
+        if event.voice or event.audio or event.photo or event.video_note:
+            return "media"
+        text = event.text or ""
+        if text in GENERATE_TEXTS:
+            return "generate"
+        if text.startswith("/") or text in MENU_TEXTS:
+            return "ui"
+        return "text"
+    return "ui"
 
 
 class RateLimitMiddleware(BaseMiddleware):
-    """Middleware — загружает пользователя из БД и передаёт в хэндлеры"""
+    """
+    Middleware — ограничивает частоту действий пользователя (token bucket
+    на каждый класс действий), затем передаёт пользователя в хэндлеры.
+    Строка users читается только при промахе кэша entitlements или для
+    хэндлеров с флагом "profile"; остальным хватает CachedUser.
+    """
+
+    def __init__(self, buckets=token_buckets):
+        self.buckets = buckets
+        self._last_notice: Dict[tuple, float] = {}
+
+    async def _throttled(self, event: TelegramObject, key: tuple, wait: float):
+        seconds = max(1, round(wait))
+        if isinstance(event, CallbackQuery):
+            await event.answer(f"⏳ Не так быстро! Подожди {seconds} сек.")
+            return
+
+        now = time.monotonic()
+        if now - self._last_notice.get(key, 0.0) < NOTICE_INTERVAL:
+            return
+        if len(self._last_notice) > 10000:
+            self._last_notice.clear()
+        self._last_notice[key] = now
+        if isinstance(event, Message):
+            await event.answer(f"⏳ Слишком много запросов. Подожди {seconds} сек. и попробуй снова 🙏")
 
     async def __call__(
         self,
@@ -23,11 +84,28 @@ class RateLimitMiddleware(BaseMiddleware):
             user = event.from_user
 
         if user:
-            db_user = await UserDB.get_or_create(
-                telegram_id=user.id,
-                username=user.username,
-                full_name=user.full_name
-            )
+            action = classify(event)
+            capacity, rate = RATE_LIMITS[action]
+            key = (user.id, action)
+            wait = await self.buckets.consume(key, capacity, rate)
+            if wait:
+                await self._throttled(event, key, wait)
+                return None
+
+            entitlement = entitlements.fresh(user.id)
+            db_user = None
+            if entitlement is not None:
+                if get_flag(data, "profile"):
+                    db_user = await UserDB.get_by_telegram_id(user.id)
+                else:
+                    db_user = CachedUser(user.id, entitlement)
+            if db_user is None:
+                db_user = await UserDB.get_or_create(
+                    telegram_id=user.id,
+                    username=user.username,
+                    full_name=user.full_name
+                )
+                entitlements.observe(db_user)
             data["db_user"] = db_user
 
         return await handler(event, data)
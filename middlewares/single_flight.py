@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+BUSY_TEXT = "⏳ Уже готовлю…"
+
+
+def _chat_id(event: TelegramObject):
+    if isinstance(event, CallbackQuery):
+        return event.message.chat.id if event.message else event.from_user.id
+    return None
+
+
+class SingleFlightMiddleware(BaseMiddleware):
+    """
+    Не даёт запустить тяжёлый хэндлер второй раз, пока идёт первый.
+    Хэндлер помечается флагом: flags={"single_flight": "recipes"}.
+    Повторное нажатие той же кнопки (тот же callback.data) в том же чате
+    получает «уже готовлю…» и ждёт уже запущенную задачу вместо нового
+    запроса к GigaChat.
+
+    Работает только для нажатий кнопок: их UpdateEngine (и воркеры
+    cluster) обрабатывают параллельно. Сообщения одного чата идут строго
+    по порядку, дубль сообщения начнётся только после оригинала — там
+    флаг ничего бы не защищал, поэтому на сообщения middleware не ставится.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self.started: Counter = Counter()
+        self.suppressed: Counter = Counter()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        name = get_flag(data, "single_flight")
+        chat_id = _chat_id(event)
+        if not name or chat_id is None:
+            return await handler(event, data)
+
+        key = (chat_id, name, event.data)
+        running = self._inflight.get(key)
+        if running is not None and not running.done():
+            self.suppressed[name] += 1
+            logger.info(f"Single-flight {name}: duplicate in chat {chat_id} attached")
+            await event.answer(BUSY_TEXT)
+            try:
+                # shield: отмена дубля не должна отменять исходную задачу
+                return await asyncio.shield(running)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Ошибку уже обработает и залогирует исходный апдейт
+                return None
+
+        self.started[name] += 1
+        task = asyncio.create_task(handler(event, data))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._release(key, t))
+        # Отмена исходного апдейта отменяет и задачу — запись снимется в _release
+        return await task
+
+    def _release(self, key: tuple, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "started": dict(self.started),
+            "suppressed": dict(self.suppressed),
+        }
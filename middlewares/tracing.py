@@ -0,0 +1,60 @@
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+from tracing import tracer, span
+
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """Outer-middleware на update: корневой span апдейта (если попал в выборку)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        chat = data.get("event_chat")
+        with tracer.start_trace(f"update {event.event_type}", update_id=event.update_id,
+                                chat_id=chat.id if chat else 0):
+            return await handler(event, data)
+
+
+class TracedMiddleware(BaseMiddleware):
+    """Обёртка: span на время работы вложенной middleware (вместе с тем, что она вызывает)"""
+
+    def __init__(self, inner: BaseMiddleware):
+        self.inner = inner
+        self.name = "middleware " + type(inner).__name__
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        with span(self.name):
+            return await self.inner(handler, event, data)
+
+
+class HandlerTracingMiddleware(BaseMiddleware):
+    """Inner-middleware, последняя в цепочке: span самого хэндлера"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        with span("handler " + data["handler"].callback.__name__):
+            return await handler(event, data)
+
+
+class TelegramTracingMiddleware(BaseRequestMiddleware):
+    """Span на каждый вызов Bot API"""
+
+    async def __call__(self, make_request, bot, method):
+        with span("telegram " + method.__api_method__):
+            return await make_request(bot, method)
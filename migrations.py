@@ -0,0 +1,422 @@
+# migrations.py
+"""
+Лёгкие миграции схемы.
+
+create_all создаёт только отсутствующие таблицы — новые индексы, триггеры
+и перестройки существующих таблиц делаются здесь. Каждая миграция
+выполняется один раз, номер записывается в schema_migrations.
+Миграции пишутся идемпотентно: на свежей базе create_all уже мог
+создать часть объектов.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import text, inspect, JSON, DateTime
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from models import PantryItem, Recipe, canonical_recipe, recipe_hash, insert_ignore
+
+logger = logging.getLogger(__name__)
+
+
+async def _columns(conn: AsyncConnection, table: str) -> set[str]:
+    return await conn.run_sync(
+        lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns(table)}
+    )
+
+
+async def _m001_indexes(conn: AsyncConnection):
+    """Индексы по горячим внешним ключам"""
+    statements = [
+        "CREATE INDEX IF NOT EXISTS ix_saved_recipes_user_created "
+        "ON saved_recipes (user_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_meal_plans_user_week "
+        "ON meal_plans (user_id, week_start)",
+        "CREATE INDEX IF NOT EXISTS ix_payments_user_created "
+        "ON payments (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_payments_status_created "
+        "ON payments (status, created_at)",
+    ]
+    for sql in statements:
+        await conn.execute(text(sql))
+
+
+def _fts_text(expr: str) -> str:
+    """ё → е: unicode61 не складывает её в е"""
+    return f"replace(replace(coalesce({expr}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _fts_ingredients(ref: str) -> str:
+    """Плоский список названий ингредиентов из JSON"""
+    return _fts_text(
+        "(SELECT group_concat(CASE type WHEN 'object' "
+        "THEN json_extract(value, '$.name') ELSE value END, ' ') "
+        f"FROM json_each({ref}.ingredients))"
+    )
+
+
+async def _m002_saved_recipes_fts(conn: AsyncConnection):
+    """Полнотекстовый поиск по сохранённым рецептам"""
+    # С 003 текст рецептов живёт в recipes — на свежей базе делать нечего
+    if "title" not in await _columns(conn, "saved_recipes"):
+        return
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_saved_recipes_search ON saved_recipes "
+            "USING GIN (to_tsvector('russian', coalesce(title, '') || ' ' || "
+            "coalesce(instructions, '') || ' ' || coalesce(ingredients::text, '')))"
+        ))
+        return
+    if conn.dialect.name != "sqlite":
+        return
+
+    await conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS saved_recipes_fts USING fts5("
+        "title, instructions, ingredients, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='3 4')"
+    ))
+
+    row = "SELECT {ref}.id, {title}, {instructions}, {ingredients}"
+    insert = (
+        "INSERT INTO saved_recipes_fts (rowid, title, instructions, ingredients) "
+        + row.format(ref="new", title=_fts_text("new.title"),
+                     instructions=_fts_text("new.instructions"),
+                     ingredients=_fts_ingredients("new")) + ";"
+    )
+    delete = "DELETE FROM saved_recipes_fts WHERE rowid = old.id;"
+    triggers = [
+        f"CREATE TRIGGER IF NOT EXISTS saved_recipes_fts_ai AFTER INSERT ON saved_recipes "
+        f"BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS saved_recipes_fts_ad AFTER DELETE ON saved_recipes "
+        f"BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS saved_recipes_fts_au AFTER UPDATE ON saved_recipes "
+        f"BEGIN {delete} {insert} END",
+    ]
+    for sql in triggers:
+        await conn.execute(text(sql))
+
+    # Бэкфилл уже сохранённых рецептов
+    await conn.execute(text("DELETE FROM saved_recipes_fts"))
+    await conn.execute(text(
+        "INSERT INTO saved_recipes_fts (rowid, title, instructions, ingredients) "
+        + row.format(ref="s", title=_fts_text("s.title"),
+                     instructions=_fts_text("s.instructions"),
+                     ingredients=_fts_ingredients("s"))
+        + " FROM saved_recipes s"
+    ))
+
+
+async def _m003_shared_recipes(conn: AsyncConnection):
+    """
+    saved_recipes → тонкие ссылки (user_id, recipe_hash) на общую таблицу
+    recipes. Одинаковые рецепты схлопываются в одну строку.
+    """
+    dialect = conn.dialect.name
+
+    if "title" in await _columns(conn, "saved_recipes"):
+        legacy = await conn.execute(
+            text(
+                "SELECT id, user_id, title, ingredients, instructions, calories, "
+                "proteins, fats, carbs, estimated_cost, cooking_time, created_at "
+                "FROM saved_recipes ORDER BY id"
+            ).columns(ingredients=JSON, created_at=DateTime)
+        )
+        recipes = {}
+        kept = {}
+        updates = []
+        duplicates = []
+        for row in legacy.mappings():
+            # Та же проекция, что и в RecipeDB.save, — иначе повторное
+            # сохранение старого рецепта дало бы вторую строку
+            data = canonical_recipe({
+                "title": row["title"],
+                "ingredients": row["ingredients"] or [],
+                "instructions": row["instructions"] or "",
+                "calories": row["calories"],
+                "proteins": row["proteins"],
+                "fats": row["fats"],
+                "carbs": row["carbs"],
+                "estimated_cost": row["estimated_cost"],
+                "cooking_time": row["cooking_time"],
+            })
+            h = recipe_hash(data)
+            recipes.setdefault(h, {"hash": h, "created_at": row["created_at"], **data})
+            # Повторные сохранения того же рецепта — оставляем самое раннее
+            key = (row["user_id"], h)
+            if key in kept:
+                duplicates.append({"id": row["id"]})
+            else:
+                kept[key] = row["id"]
+                updates.append({"id": row["id"], "recipe_hash": h})
+
+        if recipes:
+            await conn.execute(insert_ignore(dialect, Recipe.__table__), list(recipes.values()))
+
+        # Старые триггеры и индексы ссылаются на удаляемые колонки
+        if dialect == "sqlite":
+            for suffix in ("ai", "ad", "au"):
+                await conn.execute(text(f"DROP TRIGGER IF EXISTS saved_recipes_fts_{suffix}"))
+            await conn.execute(text("DROP TABLE IF EXISTS saved_recipes_fts"))
+        await conn.execute(text("DROP INDEX IF EXISTS ix_saved_recipes_search"))
+
+        await conn.execute(text(
+            "ALTER TABLE saved_recipes "
+            "ADD COLUMN recipe_hash VARCHAR(64) REFERENCES recipes (hash)"
+        ))
+        if updates:
+            await conn.execute(
+                text("UPDATE saved_recipes SET recipe_hash = :recipe_hash WHERE id = :id"),
+                updates
+            )
+        if duplicates:
+            await conn.execute(text("DELETE FROM saved_recipes WHERE id = :id"), duplicates)
+
+        for name in ("title", "ingredients", "instructions", "calories", "proteins",
+                     "fats", "carbs", "estimated_cost", "cooking_time"):
+            await conn.execute(text(f"ALTER TABLE saved_recipes DROP COLUMN {name}"))
+        if dialect == "postgresql":
+            await conn.execute(text(
+                "ALTER TABLE saved_recipes ALTER COLUMN recipe_hash SET NOT NULL"
+            ))
+        await conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_saved_recipes_user_recipe "
+            "ON saved_recipes (user_id, recipe_hash)"
+        ))
+        logger.info(
+            f"Deduplicated {len(updates) + len(duplicates)} saved recipes "
+            f"into {len(recipes)} shared rows"
+        )
+
+    # Поиск теперь по общей таблице
+    if dialect == "postgresql":
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_recipes_search ON recipes "
+            "USING GIN (to_tsvector('russian', coalesce(title, '') || ' ' || "
+            "coalesce(instructions, '') || ' ' || coalesce(ingredients::text, '')))"
+        ))
+        return
+    if dialect != "sqlite":
+        return
+
+    await conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5("
+        "title, instructions, ingredients, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='3 4')"
+    ))
+    row = "SELECT {ref}.rowid, {title}, {instructions}, {ingredients}"
+    insert = (
+        "INSERT INTO recipes_fts (rowid, title, instructions, ingredients) "
+        + row.format(ref="new", title=_fts_text("new.title"),
+                     instructions=_fts_text("new.instructions"),
+                     ingredients=_fts_ingredients("new")) + ";"
+    )
+    delete = "DELETE FROM recipes_fts WHERE rowid = old.rowid;"
+    triggers = [
+        f"CREATE TRIGGER IF NOT EXISTS recipes_fts_ai AFTER INSERT ON recipes "
+        f"BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS recipes_fts_ad AFTER DELETE ON recipes "
+        f"BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS recipes_fts_au AFTER UPDATE ON recipes "
+        f"BEGIN {delete} {insert} END",
+    ]
+    for sql in triggers:
+        await conn.execute(text(sql))
+
+    await conn.execute(text("DELETE FROM recipes_fts"))
+    await conn.execute(text(
+        "INSERT INTO recipes_fts (rowid, title, instructions, ingredients) "
+        + row.format(ref="r", title=_fts_text("r.title"),
+                     instructions=_fts_text("r.instructions"),
+                     ingredients=_fts_ingredients("r"))
+        + " FROM recipes r"
+    ))
+
+
+async def _m004_premium_index(conn: AsyncConnection):
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_users_premium_until "
+        "ON users (is_premium, premium_until)"
+    ))
+
+
+async def _m005_recipes_fts_hash(conn: AsyncConnection):
+    """
+    recipes_fts по hash, а не по rowid: у recipes текстовый первичный ключ,
+    неявный rowid такой таблицы может поменяться после VACUUM
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    for suffix in ("ai", "ad", "au"):
+        await conn.execute(text(f"DROP TRIGGER IF EXISTS recipes_fts_{suffix}"))
+    await conn.execute(text("DROP TABLE IF EXISTS recipes_fts"))
+    await conn.execute(text(
+        "CREATE VIRTUAL TABLE recipes_fts USING fts5("
+        "hash UNINDEXED, title, instructions, ingredients, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='3 4')"
+    ))
+    row = "SELECT {ref}.hash, {title}, {instructions}, {ingredients}"
+    insert = (
+        "INSERT INTO recipes_fts (hash, title, instructions, ingredients) "
+        + row.format(ref="new", title=_fts_text("new.title"),
+                     instructions=_fts_text("new.instructions"),
+                     ingredients=_fts_ingredients("new")) + ";"
+    )
+    delete = "DELETE FROM recipes_fts WHERE hash = old.hash;"
+    triggers = [
+        f"CREATE TRIGGER recipes_fts_ai AFTER INSERT ON recipes BEGIN {insert} END",
+        f"CREATE TRIGGER recipes_fts_ad AFTER DELETE ON recipes BEGIN {delete} END",
+        f"CREATE TRIGGER recipes_fts_au AFTER UPDATE ON recipes BEGIN {delete} {insert} END",
+    ]
+    for sql in triggers:
+        await conn.execute(text(sql))
+    await conn.execute(text(
+        "INSERT INTO recipes_fts (hash, title, instructions, ingredients) "
+        + row.format(ref="r", title=_fts_text("r.title"),
+                     instructions=_fts_text("r.instructions"),
+                     ingredients=_fts_ingredients("r"))
+        + " FROM recipes r"
+    ))
+
+
+async def _m006_users_blocked(conn: AsyncConnection):
+    """Флаг «заблокировал бота» для рассылок"""
+    if "is_blocked" not in await _columns(conn, "users"):
+        await conn.execute(text(
+            "ALTER TABLE users ADD COLUMN is_blocked BOOLEAN NOT NULL DEFAULT FALSE"
+        ))
+
+
+async def _m007_meal_plans_unique_week(conn: AsyncConnection):
+    """Один план на пользователя и неделю — дубли от двойных нажатий убираются"""
+    # Уникальный индекс покрывает (user_id, week_start) — обычный из 001 лишний в любом случае
+    await conn.execute(text("DROP INDEX IF EXISTS ix_meal_plans_user_week"))
+    unique = await conn.run_sync(
+        lambda sync_conn: {c["name"] for c in
+                           inspect(sync_conn).get_unique_constraints("meal_plans")}
+    )
+    if "uq_meal_plans_user_week" in unique:
+        return
+    await conn.execute(text(
+        "DELETE FROM meal_plans WHERE id NOT IN "
+        "(SELECT MAX(id) FROM meal_plans GROUP BY user_id, week_start)"
+    ))
+    await conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_meal_plans_user_week "
+        "ON meal_plans (user_id, week_start)"
+    ))
+
+
+async def _m008_pantry_exact_keys(conn: AsyncConnection):
+    """
+    Ключи запасов раньше склеивали группы (укроп → «зелень»): пересчитываем
+    их по сохранённому названию, из совпавших строк остаётся самая свежая
+    """
+    # pantry импортирует database — к моменту миграций он уже загружен
+    from pantry import pantry_key
+
+    rows = await conn.execute(text(
+        "SELECT id, user_id, key, name, added_at, updated_at, expires_at "
+        "FROM pantry_items ORDER BY updated_at DESC, id DESC"
+    ).columns(added_at=DateTime, updated_at=DateTime, expires_at=DateTime))
+    seen, drop, moved = set(), [], []
+    for row in rows.mappings():
+        key = pantry_key(row["name"]) or row["key"]
+        if (row["user_id"], key) in seen:
+            drop.append({"id": row["id"]})
+            continue
+        seen.add((row["user_id"], key))
+        if key != row["key"]:
+            drop.append({"id": row["id"]})
+            moved.append({**row, "key": key})
+    if drop:
+        await conn.execute(text("DELETE FROM pantry_items WHERE id = :id"), drop)
+    if moved:
+        await conn.execute(insert_ignore(conn.dialect.name, PantryItem.__table__), moved)
+    if drop:
+        logger.info(f"Re-keyed {len(moved)} pantry items, merged {len(drop) - len(moved)}")
+
+
+_RECIPE_COLUMNS = ("title", "ingredients", "instructions", "calories", "proteins", "fats",
+                   "carbs", "estimated_cost", "cooking_time")
+
+
+async def _m009_recipes_canonical_hash(conn: AsyncConnection):
+    """
+    Ключ recipes — хэш общей части рецепта (canonical_recipe). Раньше
+    сохранение хэшировало весь JSON с флагами «есть/нет» пользователя, и
+    одно блюдо лежало в нескольких строках: переключаем ссылки на строку
+    с новым ключом, старые строки удаляем
+    """
+    rows = await conn.execute(text(
+        "SELECT hash, data, created_at, " + ", ".join(_RECIPE_COLUMNS) + " FROM recipes"
+    ).columns(ingredients=JSON, data=JSON, created_at=DateTime))
+    existing, inserts, remap = set(), {}, []
+    for row in rows.mappings():
+        existing.add(row["hash"])
+        shared = canonical_recipe(row["data"] or {name: row[name] for name in _RECIPE_COLUMNS})
+        h = recipe_hash(shared)
+        if h == row["hash"]:
+            continue
+        remap.append({"old": row["hash"], "new": h})
+        inserts.setdefault(h, {"hash": h, **shared, "data": row["data"],
+                               "created_at": row["created_at"]})
+    inserts = [values for h, values in inserts.items() if h not in existing]
+    if inserts:
+        await conn.execute(insert_ignore(conn.dialect.name, Recipe.__table__), inserts)
+    for pair in remap:
+        # Пользователь уже ссылается на новую строку — вторая ссылка не нужна
+        await conn.execute(text(
+            "DELETE FROM saved_recipes WHERE recipe_hash = :old AND user_id IN "
+            "(SELECT user_id FROM saved_recipes WHERE recipe_hash = :new)"
+        ), pair)
+        await conn.execute(
+            text("UPDATE saved_recipes SET recipe_hash = :new WHERE recipe_hash = :old"), pair
+        )
+    if remap:
+        await conn.execute(text("DELETE FROM recipes WHERE hash = :old"), remap)
+        logger.info(f"Re-hashed {len(remap)} recipes into {len(inserts)} new shared rows")
+
+
+async def _m010_drop_meal_plans_week_index(conn: AsyncConnection):
+    """
+    Базы, созданные с уникальным ограничением сразу, прошли 007 без удаления
+    ix_meal_plans_user_week — дублирующий индекс только замедлял запись
+    """
+    await conn.execute(text("DROP INDEX IF EXISTS ix_meal_plans_user_week"))
+
+
+# (номер, название, функция) — только дописывать в конец
+MIGRATIONS = [
+    (1, "hot_fk_indexes", _m001_indexes),
+    (2, "saved_recipes_fts", _m002_saved_recipes_fts),
+    (3, "shared_recipes", _m003_shared_recipes),
+    (4, "premium_expiry_index", _m004_premium_index),
+    (5, "recipes_fts_hash", _m005_recipes_fts_hash),
+    (6, "users_blocked", _m006_users_blocked),
+    (7, "meal_plans_unique_week", _m007_meal_plans_unique_week),
+    (8, "pantry_exact_keys", _m008_pantry_exact_keys),
+    (9, "recipes_canonical_hash", _m009_recipes_canonical_hash),
+    (10, "drop_meal_plans_week_index", _m010_drop_meal_plans_week_index),
+]
+
+
+async def run_migrations(conn: AsyncConnection):
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "name VARCHAR(255) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+    result = await conn.execute(text("SELECT version FROM schema_migrations"))
+    applied = {row[0] for row in result}
+
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"Applying migration {version:03d}_{name}")
+        await migrate(conn)
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version, name, applied_at) "
+                 "VALUES (:version, :name, :applied_at)"),
+            {"version": version, "name": name, "applied_at": datetime.utcnow()}
+        )
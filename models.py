@@ -1,9 +1,14 @@
 # models.py
+import json
+import hashlib
 from datetime import datetime, date
 from sqlalchemy import (
     Column, Integer, BigInteger, String, Boolean,
-    DateTime, Date, Text, Float, ForeignKey, JSON
+    DateTime, Date, Text, Float, ForeignKey, JSON, Index, UniqueConstraint,
+    LargeBinary
 )
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import DeclarativeBase, relationship
 
 
@@ -34,6 +39,9 @@ class User(Base):
     last_recipe_date = Column(Date, nullable=True)
     total_recipes = Column(Integer, default=0)
 
+    # Заблокировал бота — рассылки его пропускают, пока он снова не напишет
+    is_blocked = Column(Boolean, default=False, nullable=False)
+
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -41,6 +49,12 @@ class User(Base):
     recipes = relationship("SavedRecipe", back_populates="user", cascade="all, delete")
     meal_plans = relationship("MealPlan", back_populates="user", cascade="all, delete")
     payments = relationship("Payment", back_populates="user", cascade="all, delete")
+    pantry_items = relationship("PantryItem", back_populates="user", cascade="all, delete")
+
+    __table_args__ = (
+        # Фоновое снятие истёкшего Premium
+        Index("ix_users_premium_until", "is_premium", "premium_until"),
+    )
 
     @property
     def has_active_premium(self) -> bool:
@@ -68,13 +82,77 @@ class User(Base):
         self.total_recipes += 1
 
 
-class SavedRecipe(Base):
-    __tablename__ = "saved_recipes"
+# Поля ингредиента, которые зависят от холодильника пользователя, а не от блюда
+PER_USER_INGREDIENT_FIELDS = ("have", "substitute")
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+def recipe_instructions(recipe_data: dict) -> str:
+    """Новый формат GigaChat отдаёт steps — сохраняем их текстом"""
+    instructions = recipe_data.get("instructions", "")
+    if instructions:
+        return instructions
+    steps = recipe_data.get("steps") or []
+    return "\n\n".join(
+        f"{s.get('step', i)}. {s.get('text', '')}"
+        for i, s in enumerate(steps, 1) if isinstance(s, dict)
+    )
+
+
+def canonical_recipe(recipe_data: dict) -> dict:
+    """
+    Общая часть рецепта — одинаковая у всех пользователей: по ней считается
+    ключ в таблице recipes. Флаги «есть/нет» и замены, описание и советы
+    в ключ не входят — полный JSON хранится только в recipes.data.
+    """
+    ingredients = []
+    for ing in recipe_data.get("ingredients") or []:
+        if isinstance(ing, dict):
+            ing = {k: v for k, v in ing.items() if k not in PER_USER_INGREDIENT_FIELDS}
+        ingredients.append(ing)
+    return {
+        "title": recipe_data.get("title", ""),
+        "ingredients": ingredients,
+        "instructions": recipe_instructions(recipe_data),
+        "calories": recipe_data.get("calories"),
+        "proteins": recipe_data.get("proteins"),
+        "fats": recipe_data.get("fats"),
+        "carbs": recipe_data.get("carbs"),
+        "estimated_cost": recipe_data.get("estimated_cost"),
+        "cooking_time": recipe_data.get("cooking_time"),
+    }
+
+
+def recipe_hash(recipe_data: dict) -> str:
+    """Стабильный хэш канонического JSON рецепта — ключ в таблице recipes"""
+    canonical = json.dumps(
+        recipe_data, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def insert_ignore(dialect_name: str, table):
+    """INSERT ... ON CONFLICT DO NOTHING для SQLite и Postgres"""
+    if dialect_name == "postgresql":
+        return pg_insert(table).on_conflict_do_nothing()
+    return sqlite_insert(table).on_conflict_do_nothing()
+
+
+def upsert(dialect_name: str, table, key: list[str], values: dict, update: list[str]):
+    """INSERT ... ON CONFLICT (key) DO UPDATE SET <update> = excluded.<update>"""
+    insert = pg_insert if dialect_name == "postgresql" else sqlite_insert
+    stmt = insert(table).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=key, set_={name: stmt.excluded[name] for name in update}
+    )
+
+
+class Recipe(Base):
+    """Общее хранилище рецептов: один экземпляр на уникальное содержимое"""
+    __tablename__ = "recipes"
+
+    hash = Column(String(64), primary_key=True)
     title = Column(String(500), nullable=False)
-    ingredients = Column(JSON, nullable=False)  # [{"name": "...", "amount": "...", "have": True}]
+    ingredients = Column(JSON, nullable=False)  # [{"name": "...", "amount": "..."}] — без флагов пользователя
     instructions = Column(Text, nullable=False)
     calories = Column(Integer, nullable=True)
     proteins = Column(Float, nullable=True)
@@ -82,9 +160,46 @@ class SavedRecipe(Base):
     carbs = Column(Float, nullable=True)
     estimated_cost = Column(Float, nullable=True)  # рублей
     cooking_time = Column(Integer, nullable=True)  # минут
+    data = Column(JSON, nullable=True)  # полный JSON от GigaChat (шаги, советы)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def as_dict(self) -> dict:
+        """Рецепт в формате GigaChat — для recipe_render"""
+        if self.data:
+            return self.data
+        return {
+            "title": self.title,
+            "ingredients": self.ingredients or [],
+            "instructions": self.instructions,
+            "calories": self.calories,
+            "proteins": self.proteins,
+            "fats": self.fats,
+            "carbs": self.carbs,
+            "estimated_cost": self.estimated_cost,
+            "cooking_time": self.cooking_time,
+        }
+
+
+class SavedRecipe(Base):
+    """Ссылка пользователя на рецепт из общего хранилища"""
+    __tablename__ = "saved_recipes"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    recipe_hash = Column(String(64), ForeignKey("recipes.hash"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", back_populates="recipes")
+    recipe = relationship("Recipe", lazy="joined")
+
+    __table_args__ = (
+        # «Мои рецепты» — выборка по пользователю, свежие сверху
+        Index("ix_saved_recipes_user_created", "user_id", "created_at", "id"),
+        UniqueConstraint("user_id", "recipe_hash", name="uq_saved_recipes_user_recipe"),
+    )
+
+    def as_dict(self) -> dict:
+        return self.recipe.as_dict()
 
 
 class MealPlan(Base):
@@ -105,6 +220,11 @@ class MealPlan(Base):
 
     user = relationship("User", back_populates="meal_plans")
 
+    __table_args__ = (
+        # Один план на неделю — повторное сохранение обновляет строку (MealPlanDB.save)
+        UniqueConstraint("user_id", "week_start", name="uq_meal_plans_user_week"),
+    )
+
 
 class Payment(Base):
     __tablename__ = "payments"
@@ -119,4 +239,97 @@ class Payment(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     confirmed_at = Column(DateTime, nullable=True)
 
-    user = relationship("User", back_populates="payments")
\ No newline at end of file
+    user = relationship("User", back_populates="payments")
+
+    __table_args__ = (
+        Index("ix_payments_user_created", "user_id", "created_at"),
+        Index("ix_payments_status_created", "status", "created_at"),
+    )
+
+
+class PaymentEvent(Base):
+    """Сырые уведомления ЮKassa: event_key уникален, повторная доставка не вставится"""
+    __tablename__ = "payment_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event_key = Column(String(255), unique=True, nullable=False)  # "payment.succeeded:<id>"
+    event = Column(String(50), nullable=False)
+    payment_id = Column(String(255), nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), default="new")  # new, done, failed
+    attempts = Column(Integer, default=0)
+    error = Column(String(500), nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_payment_events_status", "status", "id"),
+    )
+
+
+class PantryItem(Base):
+    """Запасы пользователя: один продукт — одна строка по каноничному имени (см. pantry)"""
+    __tablename__ = "pantry_items"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)  # food_lexicon.canonical
+    name = Column(String(255), nullable=False)  # как написал пользователь
+    added_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=True)  # только для скоропортящихся
+
+    user = relationship("User", back_populates="pantry_items")
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_pantry_items_user_key"),
+        Index("ix_pantry_items_expires", "expires_at"),
+    )
+
+
+class DailyUsage(Base):
+    """Дневная сводка использования — пишется ночной задачей"""
+    __tablename__ = "daily_usage"
+
+    date = Column(Date, primary_key=True)
+    active_users = Column(Integer, default=0)
+    recipes = Column(Integer, default=0)
+    new_users = Column(Integer, default=0)
+    premium_users = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class FsmSession(Base):
+    """Состояние FSM одного чата (см. fsm_storage.DBStorage)"""
+    __tablename__ = "fsm_sessions"
+
+    key = Column(String(255), primary_key=True)
+    state = Column(String(255), nullable=True)
+    data = Column(LargeBinary, nullable=True)  # serialization.pack
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class RecipeBlob(Base):
+    """Сгенерированные, но ещё не сохранённые рецепты (см. recipe_store)"""
+    __tablename__ = "recipe_blobs"
+
+    id = Column(String(64), primary_key=True)  # recipe_hash
+    data = Column(LargeBinary, nullable=False)  # serialization.pack
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class Campaign(Base):
+    """Рассылка с чекпоинтом: после рестарта продолжается с last_user_id (см. broadcast)"""
+    __tablename__ = "campaigns"
+
+    key = Column(String(100), primary_key=True)  # "premium_expiry:2026-10-18"
+    kind = Column(String(50), nullable=False)
+    day = Column(Date, nullable=False)
+    status = Column(String(20), default="running", index=True)  # running, done, abandoned
+    total = Column(Integer, default=0)  # оценка аудитории на старте
+    last_user_id = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
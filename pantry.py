@@ -0,0 +1,90 @@
+# pantry.py
+"""
+Запасы пользователя — то, что лежит в холодильнике между сессиями.
+
+Подтверждённый список продуктов дописывается в запасы (одна строка на
+каноничное имя food_lexicon, повтор продлевает срок), убрать можно
+текстом или голосом без запроса к GigaChat — упомянутые продукты ищутся
+по тому же каноничному имени. У скоропортящихся есть срок
+(SHELF_LIFE_DAYS): просроченные не показываются и вычищаются фоновой
+задачей.
+
+С непустыми запасами сессия начинается одной кнопкой «Из моих продуктов»:
+распознавание текста, голоса и фото не нужно.
+"""
+from datetime import datetime, timedelta
+from html import escape
+
+from database import PantryDB
+from food_lexicon import canonical, categories, concepts
+from product_matcher import normalize
+
+# Столько продуктов уходит в запрос рецептов — свежие первыми
+MAX_ITEMS = 50
+
+# Сколько дней продукт считается свежим; остальные хранятся без срока
+SHELF_LIFE_DAYS = {
+    "курица": 3, "индейка": 3, "говядина": 4, "свинина": 4, "баранина": 4, "фарш": 2,
+    "рыба": 2, "лосось": 3, "креветки": 3, "колбаса": 10, "ветчина": 7, "бекон": 10,
+    "молоко": 5, "кефир": 7, "ряженка": 7, "сметана": 7, "сливки": 5, "творог": 5, "йогурт": 10,
+    "сыр": 21, "яйцо": 21, "сливочное масло": 30, "майонез": 30,
+    "зелень": 5, "салат": 4, "зеленый лук": 5, "грибы": 4, "брокколи": 5,
+    "помидор": 7, "огурец": 7, "кабачок": 10, "баклажан": 10, "перец болгарский": 10,
+    "цветная капуста": 7, "капуста": 30, "морковь": 30, "свекла": 30,
+    "банан": 5, "яблоко": 30, "лимон": 21, "хлеб": 4,
+}
+
+
+def pantry_key(name: str) -> str:
+    """Точное каноничное имя продукта, без групп: укроп и петрушка — разные строки"""
+    normalized = normalize(name)
+    return canonical(normalized) or normalized
+
+
+def pantry_preview(names: list[str], limit: int = 15) -> str:
+    """Для HTML-сообщения: первые limit названий и «ещё N»"""
+    text = ", ".join(escape(n) for n in names[:limit])
+    if len(names) > limit:
+        text += f" и ещё {len(names) - limit}"
+    return text
+
+
+def _expires_at(name: str, now: datetime):
+    # Срок самого продукта, а если его нет в таблице — группы (укроп → зелень)
+    days = ([SHELF_LIFE_DAYS[c] for c in concepts(name) if c in SHELF_LIFE_DAYS]
+            or [SHELF_LIFE_DAYS[c] for c in categories(name) if c in SHELF_LIFE_DAYS])
+    return now + timedelta(days=min(days)) if days else None
+
+
+class PantryService:
+    async def products(self, user_id: int) -> list[str]:
+        items = await PantryDB.get(user_id, datetime.utcnow(), MAX_ITEMS)
+        return [item.name for item in items]
+
+    async def add(self, user_id: int, names: list[str]) -> int:
+        now = datetime.utcnow()
+        items = {}
+        for name in names:
+            key = pantry_key(name)
+            if key and key not in items:
+                items[key] = {"key": key, "name": name.strip().lower(),
+                              "expires_at": _expires_at(normalize(name), now)}
+        if items:
+            await PantryDB.add(user_id, list(items.values()))
+        return len(items)
+
+    async def remove_mentioned(self, user_id: int, text: str) -> int:
+        """«молоко и яйца закончились» — убирает запасы, все слова которых есть в тексте"""
+        words = set(pantry_key(text).split())
+        items = await PantryDB.get(user_id, datetime.min, limit=1000)
+        keys = [item.key for item in items if set(item.key.split()) <= words]
+        return await PantryDB.remove(user_id, keys) if keys else 0
+
+    async def clear(self, user_id: int) -> int:
+        return await PantryDB.remove(user_id)
+
+    async def purge_expired(self) -> int:
+        return await PantryDB.purge_expired(datetime.utcnow())
+
+
+pantry = PantryService()
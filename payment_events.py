@@ -0,0 +1,125 @@
+# payment_events.py
+"""
+Приём уведомлений ЮKassa.
+
+ЮKassa повторяет уведомление, пока не получит 200, и может прислать одно
+и то же несколько раз. Поэтому webhook только записывает сырое событие
+в payment_events (event_key уникален — повтор не вставится) и сразу
+отвечает 200, а применяет события фоновая задача: статус платежа,
+начисление Premium и отметка события — одной транзакцией
+(PaymentDB.apply_status), так что каждое событие срабатывает ровно один раз.
+
+Недавние ключи держатся в памяти: повторная доставка отсекается без
+запроса к БД. Событие с ошибкой повторяется до MAX_ATTEMPTS раз.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from database import PaymentEventDB
+from metrics import registry
+from payment_service import payment_service
+from send_queue import outbox
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+BATCH_SIZE = 50
+
+
+def event_key(body: dict) -> Optional[str]:
+    """payment.succeeded:<id платежа> — или None, если это не уведомление"""
+    event = body.get("event")
+    obj = body.get("object")
+    if body.get("type") != "notification" or not event or not isinstance(obj, dict) \
+            or not obj.get("id"):
+        return None
+    return f"{event}:{obj['id']}"
+
+
+class PaymentEventQueue:
+    def __init__(self, seen_size: int = 10000):
+        self.seen_size = seen_size
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.failed = 0
+
+    def _remember(self, key: str):
+        self._seen[key] = None
+        if len(self._seen) > self.seen_size:
+            self._seen.popitem(last=False)
+
+    async def ingest(self, body: dict) -> bool:
+        """Записывает событие до ответа ЮKassa. False — некорректное тело"""
+        key = event_key(body)
+        if key is None:
+            return False
+        self.received += 1
+        if key in self._seen:
+            self.duplicates += 1
+            return True
+        obj = body["object"]
+        if await PaymentEventDB.add(key, body["event"], obj["id"], body):
+            self._wakeup.set()
+        else:
+            self.duplicates += 1
+        self._remember(key)
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="payment-events")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        # Первый проход подбирает то, что не успели применить до рестарта
+        while True:
+            try:
+                while await self._process_batch() == BATCH_SIZE:
+                    pass
+            except Exception as e:
+                logger.error(f"Payment events loop failed: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=30)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _process_batch(self) -> int:
+        events = await PaymentEventDB.get_new(BATCH_SIZE)
+        for event in events:
+            try:
+                result = await payment_service.process_webhook(event.payload, event_id=event.id)
+            except Exception as e:
+                give_up = event.attempts + 1 >= MAX_ATTEMPTS
+                self.failed += give_up
+                # Платёж без локальной строки: после give_up восстанавливается вручную по payload
+                logger.error(f"Payment event {event.event_key} failed "
+                             f"(attempt {event.attempts + 1}"
+                             f"{', giving up' if give_up else ''}): {e}")
+                await PaymentEventDB.mark_failed(event.id, str(e), give_up)
+                continue
+            self.processed += 1
+            if result["activated"]:
+                outbox.enqueue(result["telegram_id"], "🎉 Premium активирован!")
+        return len(events)
+
+    def stats(self) -> dict:
+        return {"received": self.received, "duplicates": self.duplicates,
+                "processed": self.processed, "failed": self.failed}
+
+
+payment_events = PaymentEventQueue()
+
+registry.callback("bot_payment_events_total", "YooKassa notifications by outcome", "counter",
+                  payment_events.stats, ("outcome",))
@@ -1,28 +1,31 @@
 # payment_service.py
+import asyncio
+import logging
 import uuid
-from yookassa import Configuration, Payment as YooPayment
+from datetime import datetime, timedelta
 from yookassa.domain.notification import WebhookNotificationEventType, WebhookNotification
 
-from config import config
-from database import UserDB, PaymentDB
+from database import PaymentDB
+from entitlements import PLANS, entitlements
+from metrics import track
+from yookassa_client import yookassa
 
-# Настройка ЮKassa
-Configuration.account_id = config.YUKASSA_SHOP_ID
-Configuration.secret_key = config.YUKASSA_SECRET_KEY
+logger = logging.getLogger(__name__)
 
 
 class PaymentService:
     """Сервис оплаты через ЮKassa"""
 
     @staticmethod
+    @track("yookassa", "create_payment")
     async def create_premium_payment(telegram_id: int, months: int = 1) -> dict:
         """Создание платежа за Premium подписку"""
-        amount = config.PREMIUM_PRICE_RUB * months
+        amount = PLANS[months]
         description = f"WhatToEat Premium — {months} мес."
 
         idempotence_key = str(uuid.uuid4())
 
-        payment = YooPayment.create({
+        payment = await yookassa.create_payment({
             "amount": {
                 "value": f"{amount}.00",
                 "currency": "RUB"
@@ -43,48 +46,96 @@ class PaymentService:
         # Сохраняем в БД
         await PaymentDB.create(
             user_telegram_id=telegram_id,
-            yukassa_payment_id=payment.id,
+            yukassa_payment_id=payment["id"],
             amount=amount,
             description=description
         )
 
         return {
-            "payment_id": payment.id,
-            "confirmation_url": payment.confirmation.confirmation_url,
+            "payment_id": payment["id"],
+            "confirmation_url": payment["confirmation"]["confirmation_url"],
             "amount": amount
         }
 
     @staticmethod
-    async def process_webhook(event_json: dict) -> dict:
-        """Обработка вебхука от ЮKassa"""
+    async def process_webhook(event_json: dict, event_id: int = None) -> dict:
+        """
+        Обработка вебхука от ЮKassa. Идемпотентна: повторное уведомление
+        о том же платеже Premium не продлевает (result["activated"] = False).
+        """
         notification = WebhookNotification(event_json)
         payment = notification.object
+        return await _apply(payment.id, payment.status, payment.metadata, event_id)
 
-        payment_id = payment.id
-        status = payment.status
-
-        # Обновляем статус в БД
-        await PaymentDB.update_status(payment_id, status)
-
-        result = {"payment_id": payment_id, "status": status}
-
-        if status == "succeeded":
-            metadata = payment.metadata or {}
-            telegram_id = int(metadata.get("telegram_id", 0))
-            months = int(metadata.get("months", 1))
-
-            if telegram_id:
-                await UserDB.activate_premium(telegram_id, months)
-                result["telegram_id"] = telegram_id
-                result["months"] = months
+    @staticmethod
+    @track("yookassa", "find_payment")
+    async def check_payment(payment_id: str) -> dict:
+        """Платёж из ЮKassa (объект API)"""
+        return await yookassa.get_payment(payment_id)
 
-        return result
+    @staticmethod
+    async def sync_payment(payment_id: str) -> dict:
+        """
+        Один запрос статуса в ЮKassa и применение его тем же путём, что и
+        вебхук. Пустой dict — платёж в ЮKassa всё ещё не завершён.
+        """
+        payment = await PaymentService.check_payment(payment_id)
+        if payment["status"] == "pending":
+            return {}
+        return await _apply(payment_id, payment["status"], payment.get("metadata"))
 
     @staticmethod
-    async def check_payment_status(payment_id: str) -> str:
-        """Проверка статуса платежа"""
-        payment = YooPayment.find_one(payment_id)
-        return payment.status
+    async def reconcile_pending(older_than: timedelta, max_age: timedelta = timedelta(days=7),
+                                batch_size: int = 50, concurrency: int = 5) -> list[dict]:
+        """
+        Сверка зависших pending-платежей с ЮKassa — на случай потерянного
+        вебхука. Пачками, не больше concurrency запросов одновременно;
+        применяется тем же идемпотентным путём, что и вебхук.
+        Возвращает изменившиеся платежи.
+        """
+        now = datetime.utcnow()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def reconcile(payment_id: str) -> dict:
+            async with semaphore:
+                return await PaymentService.sync_payment(payment_id)
+
+        changed = []
+        after_id = 0
+        while True:
+            batch = await PaymentDB.get_pending(now - older_than, now - max_age, after_id, batch_size)
+            if not batch:
+                return changed
+            results = await asyncio.gather(
+                *(reconcile(p.yukassa_payment_id) for p in batch), return_exceptions=True
+            )
+            for payment, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"Reconcile {payment.yukassa_payment_id} failed: {result}")
+                elif result:
+                    changed.append(result)
+            if len(batch) < batch_size:
+                return changed
+            after_id = batch[-1].id
+
+
+async def _apply(payment_id: str, status: str, metadata: dict = None,
+                 event_id: int = None) -> dict:
+    """Статус из вебхука или сверки → БД; повтор Premium не продлевает"""
+    metadata = metadata or {}
+    telegram_id = int(metadata.get("telegram_id", 0))
+    months = int(metadata.get("months", 1))
+
+    activated = await PaymentDB.apply_status(
+        payment_id, status, telegram_id=telegram_id, months=months, event_id=event_id
+    )
+
+    result = {"payment_id": payment_id, "status": status, "activated": activated}
+    if activated:
+        entitlements.invalidate(telegram_id)
+        result["telegram_id"] = telegram_id
+        result["months"] = months
+    return result
 
 
 # Вспомогательная функция
@@ -0,0 +1,165 @@
+# product_matcher.py
+"""
+Сопоставление ингредиентов рецепта с продуктами пользователя.
+
+Продукты нормализуются один раз при построении ProductMatcher, дальше
+каждый ингредиент проверяется за время, не зависящее от числа пар
+«ингредиент × продукт»:
+
+  - точное совпадение — поиск в множестве;
+  - продукт внутри ингредиента — одна регулярка-альтернатива из всех
+    продуктов; ингредиент внутри продукта — поиск в склейке продуктов;
+  - совпадение по корню слова — проход по префиксному дереву слов
+    продуктов (в узле — минимальная длина слова под ним);
+  - синонимы — общее каноничное имя food_lexicon («куриное филе» и
+    «курица»);
+  - группы — только в одну сторону: в рецепте «зелень», у пользователя
+    укроп. Укроп базилик не заменяет.
+
+Матчер зависит только от набора продуктов, поэтому кэшируется по нему
+(matcher_for, порядок и повторы не важны) и переиспользуется для всех
+рецептов сессии.
+"""
+import re
+from collections import OrderedDict
+from typing import Optional
+
+from food_lexicon import canonical, categories, concepts
+from metrics import cache_metrics
+
+_STRIP_RE = re.compile(r"[^а-яёa-z\s]")
+_SPACES_RE = re.compile(r"\s+")
+
+# Короче корень не сравнивается
+MIN_ROOT = 4
+
+# Базовые продукты, которые есть у всех
+BASIC_PRODUCTS = frozenset({
+    "соль", "перец", "вода", "сахар", "масло растительное",
+    "масло подсолнечное", "масло оливковое", "чёрный перец",
+    "перец чёрный молотый", "лавровый лист", "уксус",
+    "растительное масло", "подсолнечное масло"
+})
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр, только буквы и одиночные пробелы"""
+    text = _STRIP_RE.sub("", text.lower())
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+class _Node:
+    __slots__ = ("children", "min_len")
+
+    def __init__(self):
+        self.children: dict[str, "_Node"] = {}
+        self.min_len = 1 << 30
+
+
+class ProductMatcher:
+    def __init__(self, products: list[str]):
+        normalized = {p for p in map(normalize, products) if p}
+        self.exact = frozenset(normalized)
+        self.canonical = frozenset(canonical(p) for p in normalized)
+        self.concepts = frozenset().union(*map(concepts, normalized))
+        self.categories = frozenset().union(*map(categories, normalized))
+        # \n в нормализованном тексте не встречается — склейка не даёт ложных подстрок
+        self._joined = "\n".join(sorted(normalized))
+        self._contained: Optional[re.Pattern] = None
+        if normalized:
+            alternatives = sorted(normalized, key=len, reverse=True)
+            self._contained = re.compile("|".join(map(re.escape, alternatives)))
+        self._root = _Node()
+        for product in normalized:
+            for word in product.split():
+                if len(word) >= MIN_ROOT:
+                    self._add_word(word)
+
+    def _add_word(self, word: str):
+        node = self._root
+        length = len(word)
+        for ch in word:
+            node = node.children.setdefault(ch, _Node())
+            node.min_len = min(node.min_len, length)
+
+    def _root_match(self, word: str) -> bool:
+        """
+        Слово ингредиента iw и слово продукта pw совпадают по корню, если
+        общий префикс не короче max(4, min(len) - 2) и оба слова от 4 букв.
+        На глубине d это значит: min(len(iw), len(pw)) <= d + 2.
+        """
+        if len(word) < MIN_ROOT:
+            return False
+        node = self._root
+        for depth, ch in enumerate(word, 1):
+            node = node.children.get(ch)
+            if node is None:
+                return False
+            if depth >= MIN_ROOT and (len(word) <= depth + 2 or node.min_len <= depth + 2):
+                return True
+        return False
+
+    def has(self, ingredient: str, normalized: bool = False) -> bool:
+        """
+        Есть ли ингредиент у пользователя.
+        Умное сравнение: 'куриная грудка' найдётся, если у пользователя 'курица'
+        """
+        ing = ingredient if normalized else normalize(ingredient)
+        if not ing or self._contained is None:
+            return False
+        if ing in self.exact or ing in self._joined or self._contained.search(ing):
+            return True
+        found = concepts(ing)
+        if canonical(ing) in self.canonical or not found.isdisjoint(self.concepts):
+            return True
+        if not found.isdisjoint(self.categories):
+            return True
+        return any(self._root_match(word) for word in ing.split())
+
+    def missing(self, ingredients: list[dict]) -> list[dict]:
+        """Ингредиенты, которых нет ни у пользователя, ни среди базовых"""
+        result = []
+        for ing in ingredients:
+            name = ing.get("name", "")
+            if not name:
+                continue
+            normalized = normalize(name)
+            if normalized in BASIC_PRODUCTS or self.has(normalized, normalized=True):
+                continue
+            result.append({
+                "name": name,
+                "amount": ing.get("amount", ""),
+                "substitute": ing.get("substitute", "")
+            })
+        return result
+
+
+class _MatcherCache:
+    def __init__(self, size: int):
+        self.size = size
+        self._cache: OrderedDict[tuple[str, ...], ProductMatcher] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, products: list[str]) -> ProductMatcher:
+        key = tuple(sorted({normalize(p) for p in products}))
+        matcher = self._cache.get(key)
+        if matcher is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return matcher
+        self.misses += 1
+        matcher = self._cache[key] = ProductMatcher(products)
+        if len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+        return matcher
+
+
+_matchers = _MatcherCache(size=1024)
+
+cache_metrics("product_matchers", lambda: (_matchers.hits, _matchers.misses))
+
+
+def matcher_for(products: list[str]) -> ProductMatcher:
+    """Матчер для списка продуктов сессии — строится один раз"""
+    return _matchers.get(products)
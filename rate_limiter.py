@@ -0,0 +1,104 @@
+# rate_limiter.py
+"""
+Token bucket лимитеры.
+
+Ведро ёмкостью capacity пополняется со скоростью rate токенов/сек.
+consume() возвращает 0, если токен списан, иначе — сколько секунд ждать.
+MemoryTokenBuckets — шардированная таблица в процессе с вытеснением
+простаивающих вёдер, RedisTokenBuckets — общая для нескольких процессов.
+"""
+import logging
+import time
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryTokenBuckets:
+    def __init__(self, shards: int = 64, idle_ttl: float = 600.0):
+        self._shards: list[dict] = [{} for _ in range(shards)]
+        self.idle_ttl = idle_ttl
+
+    async def consume(self, key, capacity: float, rate: float, cost: float = 1.0) -> float:
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        bucket = shard.get(key)
+        if bucket is None:
+            bucket = shard[key] = [capacity, now]
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / rate
+
+    def evict_idle(self) -> int:
+        """Выкидывает вёдра, к которым не обращались idle_ttl секунд (они уже полные)"""
+        threshold = time.monotonic() - self.idle_ttl
+        evicted = 0
+        for shard in self._shards:
+            stale = [key for key, bucket in shard.items() if bucket[1] < threshold]
+            for key in stale:
+                del shard[key]
+            evicted += len(stale)
+        return evicted
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+
+class RedisTokenBuckets:
+    """То же ведро, но атомарно в Redis — для нескольких процессов"""
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 't', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - ts) * rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str, prefix: str = "rl"):
+        from redis.asyncio import Redis
+        self.redis = Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.redis.register_script(self.SCRIPT)
+
+    async def consume(self, key, capacity: float, rate: float, cost: float = 1.0) -> float:
+        redis_key = f"{self.prefix}:" + ":".join(map(str, key))
+        wait = await self._script(keys=[redis_key], args=[capacity, rate, cost, time.time()])
+        return float(wait)
+
+    def evict_idle(self) -> int:
+        # В Redis вёдра истекают сами (EXPIRE)
+        return 0
+
+    def __len__(self) -> int:
+        return 0
+
+
+def build_token_buckets():
+    if config.RATE_LIMIT_BACKEND == "redis":
+        try:
+            return RedisTokenBuckets(config.REDIS_URL)
+        except ImportError:
+            logger.error("RATE_LIMIT_BACKEND=redis, but redis is not installed — using memory")
+    return MemoryTokenBuckets()
+
+
+token_buckets = build_token_buckets()
@@ -0,0 +1,235 @@
+# recipe_render.py
+"""
+Отрисовка рецепта в HTML-страницы для Telegram.
+
+Рецепт собирается из блоков (заголовок, КБЖУ, ингредиенты, шаги...) через
+join, весь текст от GigaChat экранируется. Страницы набираются из целых
+блоков, так что разрез никогда не попадает внутрь тега; слишком длинный
+блок режется по пробелам с закрытием и переоткрытием тегов.
+
+Готовые страницы кэшируются по (хэш рецепта, номер): повторный показ —
+поиск в кэше и один edit_text.
+"""
+import re
+from collections import OrderedDict
+from html import escape
+from typing import Optional
+
+from config import config
+from metrics import cache_metrics
+from models import recipe_hash
+
+# Лимит Telegram — 4096 UTF-16 символов; запас под подпись вроде «Найдено 3!»
+PAGE_LIMIT = 3900
+
+_TAG_RE = re.compile(r"(<[^>]+>)")
+_DIFFICULTY = {"легко": "🟢", "средне": "🟡", "сложно": "🔴"}
+
+
+def tg_len(text: str) -> int:
+    """Длина так, как её считает Telegram (UTF-16)"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _e(value) -> str:
+    return escape(str(value), quote=False)
+
+
+def recipe_blocks(recipe: dict, index: int) -> list[str]:
+    """Рецепт → список самостоятельных HTML-блоков"""
+    blocks = [
+        f"{'═' * 30}\n🍽 <b>Рецепт #{index + 1}: {_e(recipe.get('title', 'Без названия'))}</b>\n"
+        f"{'═' * 30}"
+    ]
+
+    desc = recipe.get("description", "")
+    if desc:
+        blocks.append(f"📖 <i>{_e(desc)}</i>")
+
+    difficulty = recipe.get("difficulty", "средне")
+    blocks.append("\n".join([
+        f"⏱ <b>Время:</b> {_e(recipe.get('cooking_time', '?'))} мин",
+        f"{_DIFFICULTY.get(difficulty, '🟡')} <b>Сложность:</b> {_e(difficulty)}",
+        f"🍽 <b>Порций:</b> {_e(recipe.get('portions', 1))}",
+        f"💰 <b>Стоимость:</b> ~{_e(recipe.get('estimated_cost', '?'))} ₽",
+    ]))
+    blocks.append("\n".join([
+        "📊 <b>Пищевая ценность (1 порция):</b>",
+        f"  🔥 Калории: {_e(recipe.get('calories', '?'))} ккал",
+        f"  🥩 Белки: {_e(recipe.get('proteins', '?'))} г",
+        f"  🧈 Жиры: {_e(recipe.get('fats', '?'))} г",
+        f"  🍞 Углеводы: {_e(recipe.get('carbs', '?'))} г",
+    ]))
+
+    have, need = [], []
+    for ing in recipe.get("ingredients", []):
+        if not isinstance(ing, dict):
+            have.append(f"  ✅ {_e(ing)}")
+            continue
+        line = f"{_e(ing.get('name', ''))} — {_e(ing.get('amount', ''))}"
+        if ing.get("have", True):
+            have.append(f"  ✅ {line}")
+        else:
+            substitute = ing.get("substitute", "")
+            if substitute:
+                line += f" (замена: {_e(substitute)})"
+            need.append(f"  ❌ {line}")
+    blocks.append("\n".join(["📝 <b>Ингредиенты:</b>", *have, *need]))
+    if need:
+        blocks.append(f"🛒 <b>Нужно докупить: {len(need)} продукт(ов)</b>")
+
+    steps = recipe.get("steps") or []
+    if steps:
+        blocks.append("👨‍🍳 <b>Приготовление:</b>")
+        for s in steps:
+            if not isinstance(s, dict):
+                continue
+            step_time = s.get("time", "")
+            time_str = f" ⏱ {_e(step_time)}" if step_time else ""
+            blocks.append(f"<b>{_e(s.get('step', ''))}.</b> {_e(s.get('text', ''))}{time_str}")
+    elif recipe.get("instructions"):
+        # Старый формат — одним текстом
+        blocks.append("👨‍🍳 <b>Приготовление:</b>")
+        blocks.extend(_e(p) for p in recipe["instructions"].split("\n\n") if p.strip())
+
+    tips = recipe.get("tips", "")
+    if tips:
+        blocks.append(f"💡 <b>Совет:</b> {_e(tips)}")
+    return blocks
+
+
+def split_html(block: str, limit: int) -> list[str]:
+    """
+    Режет HTML по пробелам/переносам вне тегов; открытые теги закрываются и
+    переоткрываются. В limit входит вся разметка куска, вместе с закрывающими тегами.
+    """
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+    closing = 0  # длина закрывающих тегов, которые допишет flush
+    has_text = False
+    open_tags: list[str] = []
+
+    def flush():
+        nonlocal current, size, has_text
+        tail = "".join(f"</{_tag_name(t)}>" for t in reversed(open_tags))
+        chunks.append("".join(current).rstrip() + tail)
+        current = list(open_tags)
+        size = sum(tg_len(t) for t in open_tags)
+        has_text = False
+
+    for token in _TAG_RE.split(block):
+        if not token:
+            continue
+        if token.startswith("<"):
+            if token.startswith("</"):
+                if not open_tags:
+                    continue
+                tag = open_tags.pop()
+                closing -= tg_len(f"</{_tag_name(tag)}>")
+                if not has_text and current and current[-1] == tag:
+                    # Тег переоткрыт после flush и сразу закрыт — пустой пары не нужно
+                    current.pop()
+                    size -= tg_len(tag)
+                    continue
+            else:
+                end = tg_len(f"</{_tag_name(token)}>")
+                if has_text and size + tg_len(token) + end + closing > limit:
+                    flush()
+                open_tags.append(token)
+                closing += end
+            current.append(token)
+            size += tg_len(token)
+            continue
+        for word in re.split(r"(?<=\s)", token):
+            length = tg_len(word)
+            if has_text and size + length + closing > limit:
+                flush()
+            while word and size + length + closing > limit:
+                # Слово длиннее страницы — режем, но не посреди &amp;-сущности
+                head = _cut(word, limit - size - closing)
+                current.append(head)
+                word = word[len(head):]
+                length = tg_len(word)
+                has_text = True
+                flush()
+            if word:
+                current.append(word)
+                size += length
+                has_text = True
+    if has_text or not chunks:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _cut(word: str, room: int) -> str:
+    """Самое длинное начало word не длиннее room (UTF-16), не обрывающее сущность"""
+    n = used = 0
+    for ch in word:
+        used += tg_len(ch)
+        if used > room:
+            break
+        n += 1
+    amp = word.rfind("&", 0, n)
+    if amp > 0 and ";" not in word[amp:n] and ";" in word[n:n + 8]:
+        n = amp
+    return word[:max(n, 1)]
+
+
+def _tag_name(tag: str) -> str:
+    return tag[1:-1].split()[0]
+
+
+def paginate(blocks: list[str], limit: int = PAGE_LIMIT) -> list[str]:
+    """Целые блоки в страницы ≤ limit; блоки разделяются пустой строкой"""
+    pages: list[str] = []
+    current: list[str] = []
+    size = 0
+    for block in blocks:
+        length = tg_len(block)
+        if length > limit:
+            parts = split_html(block, limit)
+        else:
+            parts = [block]
+        for part in parts:
+            length = tg_len(part)
+            if current and size + 2 + length > limit:
+                pages.append("\n\n".join(current))
+                current, size = [], 0
+            size += length + (2 if current else 0)
+            current.append(part)
+    if current:
+        pages.append("\n\n".join(current))
+    return pages
+
+
+class RecipeRenderer:
+    def __init__(self, size: int):
+        self.size = size
+        self._cache: OrderedDict[tuple[str, int], tuple[str, ...]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, recipe_id: str, index: int) -> Optional[tuple[str, ...]]:
+        pages = self._cache.get((recipe_id, index))
+        if pages is not None:
+            self._cache.move_to_end((recipe_id, index))
+            self.hits += 1
+        return pages
+
+    def pages(self, recipe: dict, index: int, recipe_id: str = None) -> tuple[str, ...]:
+        """Страницы рецепта; recipe_id — его хэш, если уже известен"""
+        key = (recipe_id or recipe_hash(recipe), index)
+        pages = self.cached(*key)
+        if pages is None:
+            self.misses += 1
+            pages = tuple(paginate(recipe_blocks(recipe, index)))
+            self._cache[key] = pages
+            if len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+        return pages
+
+
+renderer = RecipeRenderer(size=config.RECIPE_CACHE_SIZE)
+
+cache_metrics("recipe_pages", lambda: (renderer.hits, renderer.misses))
@@ -0,0 +1,100 @@
+# recipe_store.py
+"""
+Хранилище сгенерированных рецептов.
+
+Рецепты от GigaChat записываются один раз (ключ — recipe_hash), в FSM
+остаются только их id и курсор. Хэндлеры достают ровно тот рецепт,
+который нужен, — сначала из LRU-кэша, потом из таблицы recipe_blobs.
+Кэш хранит упакованные данные и срок: каждый get отдаёт свежую копию,
+так что правка рецепта в хэндлере не портит кэш, а просроченный рецепт
+не возвращается ни из кэша, ни из таблицы.
+"""
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, delete
+
+from config import config
+from database import async_session, engine
+from metrics import cache_metrics
+from models import RecipeBlob, recipe_hash, upsert
+from serialization import pack, unpack
+
+logger = logging.getLogger(__name__)
+
+
+class RecipeBlobStore:
+    def __init__(self, ttl: int, cache_size: int):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, tuple[bytes, datetime]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, recipe_id: str, blob: bytes, expires_at: datetime):
+        self._cache[recipe_id] = (blob, expires_at)
+        self._cache.move_to_end(recipe_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def put_many(self, recipes: list[dict]) -> list[str]:
+        """Сохраняет рецепты и возвращает их id в том же порядке"""
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        ids = []
+        async with async_session() as session:
+            for recipe in recipes:
+                recipe_id = recipe_hash(recipe)
+                ids.append(recipe_id)
+                blob = pack(recipe)
+                await session.execute(upsert(
+                    engine.dialect.name, RecipeBlob.__table__, ["id"],
+                    {"id": recipe_id, "data": blob, "expires_at": expires_at},
+                    ["expires_at"]
+                ))
+                self._remember(recipe_id, blob, expires_at)
+            await session.commit()
+        return ids
+
+    async def get(self, recipe_id: str) -> Optional[dict]:
+        """Копия рецепта или None, если его нет или срок истёк"""
+        now = datetime.utcnow()
+        cached = self._cache.get(recipe_id)
+        if cached is not None:
+            blob, expires_at = cached
+            if expires_at > now:
+                self.hits += 1
+                self._cache.move_to_end(recipe_id)
+                return unpack(blob)
+            del self._cache[recipe_id]
+
+        self.misses += 1
+        async with async_session() as session:
+            result = await session.execute(
+                select(RecipeBlob.data, RecipeBlob.expires_at)
+                .where(RecipeBlob.id == recipe_id, RecipeBlob.expires_at > now)
+            )
+            row = result.one_or_none()
+        if row is None:
+            return None
+        self._remember(recipe_id, row.data, row.expires_at)
+        return unpack(row.data)
+
+    async def get_at(self, recipe_ids: list[str], index: int) -> Optional[dict]:
+        """Рецепт по номеру из списка id в FSM"""
+        if not 0 <= index < len(recipe_ids):
+            return None
+        return await self.get(recipe_ids[index])
+
+    async def purge_expired(self) -> int:
+        async with async_session() as session:
+            result = await session.execute(
+                delete(RecipeBlob).where(RecipeBlob.expires_at < datetime.utcnow())
+            )
+            await session.commit()
+        return result.rowcount or 0
+
+
+recipe_store = RecipeBlobStore(ttl=config.FSM_SESSION_TTL, cache_size=config.RECIPE_CACHE_SIZE)
+cache_metrics("recipes", lambda: (recipe_store.hits, recipe_store.misses))
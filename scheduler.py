@@ -0,0 +1,175 @@
+# scheduler.py
+"""
+Фоновый планировщик периодических задач.
+
+Задачи бывают интервальные (каждые N секунд) и cron-подобные
+(минута/час). Задача не запускается повторно, пока идёт предыдущий
+запуск, а время выполнения копится в статистике по каждой задаче.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[], Awaitable[object]]
+
+
+def _parse_cron_field(value: str, lo: int, hi: int) -> frozenset[int]:
+    """'*', '5', '0,30', '*/15' → множество допустимых значений"""
+    allowed = set()
+    for part in value.split(","):
+        step = 1
+        if "/" in part:
+            part, step_str = part.split("/")
+            step = int(step_str)
+        if part == "*":
+            start, end = lo, hi
+        else:
+            start = end = int(part)
+        allowed.update(range(start, end + 1, step))
+    if not allowed or min(allowed) < lo or max(allowed) > hi:
+        raise ValueError(f"Bad cron field: {value!r}")
+    return frozenset(allowed)
+
+
+class Job:
+    def __init__(self, name: str, func: JobFunc, interval: float = None,
+                 minute: str = None, hour: str = "*", jitter: float = 0.0):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.minutes = _parse_cron_field(minute, 0, 59) if minute is not None else None
+        self.hours = _parse_cron_field(hour, 0, 23) if minute is not None else None
+        self.jitter = jitter
+
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.last_run: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def delay_until_next(self) -> float:
+        if self.interval is not None:
+            delay = self.interval
+        else:
+            now = datetime.utcnow()
+            candidate = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+            # Не больше двух суток перебора — хватает для любых minute/hour
+            for _ in range(2 * 24 * 60):
+                if candidate.minute in self.minutes and candidate.hour in self.hours:
+                    break
+                candidate += timedelta(minutes=1)
+            delay = (candidate - now).total_seconds()
+        if self.jitter:
+            delay += random.uniform(0, self.jitter)
+        return delay
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "running": self.running,
+            "last_duration": round(self.last_duration, 3),
+            "max_duration": round(self.max_duration, 3),
+            "avg_duration": round(self.total_duration / self.runs, 3) if self.runs else 0.0,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_error": self.last_error,
+        }
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs: dict[str, Job] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._runs: set[asyncio.Task] = set()
+
+    def every(self, name: str, seconds: float, func: JobFunc, jitter: float = 0.0):
+        """Интервальная задача"""
+        self.jobs[name] = Job(name, func, interval=seconds, jitter=jitter)
+
+    def cron(self, name: str, func: JobFunc, minute: str = "0", hour: str = "*",
+             jitter: float = 0.0):
+        """Задача по расписанию (UTC): cron(..., minute="5", hour="0") — в 00:05"""
+        self.jobs[name] = Job(name, func, minute=minute, hour=hour, jitter=jitter)
+
+    def start(self):
+        if self._tasks:
+            return
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"job:{job.name}"))
+        logger.info(f"Scheduler started: {', '.join(self.jobs)}")
+
+    async def stop(self, timeout: float = 10.0):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        # Даём текущим запускам доработать
+        if self._runs:
+            await asyncio.wait(self._runs, timeout=timeout)
+
+    async def run_now(self, name: str):
+        await self._run(self.jobs[name])
+
+    async def _loop(self, job: Job):
+        while True:
+            await asyncio.sleep(job.delay_until_next())
+            if job.running:
+                job.skipped += 1
+                logger.warning(f"Job {job.name} still running, skipping this tick")
+                continue
+            task = asyncio.create_task(self._run(job))
+            self._runs.add(task)
+            task.add_done_callback(self._runs.discard)
+
+    async def _run(self, job: Job):
+        job.running = True
+        started = time.perf_counter()
+        try:
+            result = await job.func()
+            job.last_error = None
+            if result:
+                logger.info(f"Job {job.name}: {result}")
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            logger.error(f"Job {job.name} failed: {e}", exc_info=True)
+        finally:
+            duration = time.perf_counter() - started
+            job.running = False
+            job.runs += 1
+            job.last_run = datetime.utcnow()
+            job.last_duration = duration
+            job.total_duration += duration
+            job.max_duration = max(job.max_duration, duration)
+
+    def stats(self) -> dict:
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+
+scheduler = Scheduler()
+
+
+def _job_field(field: str):
+    return lambda: {name: getattr(job, field) for name, job in scheduler.jobs.items()}
+
+
+registry.callback("bot_job_runs_total", "Scheduler job runs", "counter", _job_field("runs"), ("job",))
+registry.callback("bot_job_failures_total", "Scheduler job failures", "counter",
+                  _job_field("failures"), ("job",))
+registry.callback("bot_job_skipped_total", "Runs skipped because the previous one was running",
+                  "counter", _job_field("skipped"), ("job",))
+registry.callback("bot_job_running", "Job is running now", "gauge", _job_field("running"), ("job",))
+registry.callback("bot_job_last_duration_seconds", "Duration of the last run", "gauge",
+                  _job_field("last_duration"), ("job",))
@@ -0,0 +1,351 @@
+# send_queue.py
+"""
+Очередь исходящих сообщений.
+
+Telegram ограничивает ботов ~30 сообщениями/сек в целом и ~1/сек в один
+чат, превышение — 429 с retry_after. Массовые и многосообщенческие
+отправки идут через outbox:
+
+  - у каждого чата своя полоса: сообщения уходят строго по порядку,
+    темп — по token bucket чата;
+  - общий bucket выдаёт токены сначала интерактивным ответам, рассылки
+    (bulk=True) получают не больше BULK_SHARE общего темпа и только
+    когда интерактивные не ждут;
+  - 429 ставит на паузу только свою полосу на retry_after;
+  - подряд идущие короткие тексты в один чат склеиваются в одно
+    сообщение (до 4096 символов).
+
+Остальные отправки (message.answer, send_photo, ...) идут мимо полос, но
+берут токен из того же общего bucket — через OutboxGate в сессии бота.
+В многопроцессном режиме общий темп делится между процессами: число
+процессов передаётся явно через outbox.scale() при старте.
+"""
+import contextvars
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage, ForwardMessage, SendAudio, SendDocument, SendInvoice, SendMediaGroup,
+    SendMessage, SendPhoto, SendVideo, SendVoice
+)
+from aiogram.types import Message
+
+from config import config
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+MAX_TEXT = 4096
+MERGE_SEPARATOR = "\n\n"
+MAX_RETRIES = 3
+
+# Методы, которые отправляют сообщение в чат и тратят общий лимит
+SEND_METHODS = (
+    SendMessage, SendPhoto, SendVoice, SendAudio, SendVideo, SendDocument,
+    SendMediaGroup, SendInvoice, CopyMessage, ForwardMessage
+)
+
+# Отправка из полосы outbox уже получила токен — шлюз её пропускает
+_from_outbox = contextvars.ContextVar("from_outbox", default=False)
+
+
+class PriorityBucket:
+    """Общий token bucket: интерактивные ждущие обслуживаются раньше рассылок"""
+
+    def __init__(self, rate: float, burst: float, bulk_share: float):
+        self.bulk_share = bulk_share
+        self.tokens = burst
+        self.bulk_tokens = burst * bulk_share
+        self.set_rate(rate, burst)
+        self.updated = time.monotonic()
+        self._interactive: deque[asyncio.Future] = deque()
+        self._bulk: deque[asyncio.Future] = deque()
+        self._pump_task: Optional[asyncio.Task] = None
+
+    def set_rate(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.bulk_rate = rate * self.bulk_share
+        self.bulk_burst = burst * self.bulk_share
+        self.tokens = min(self.tokens, burst)
+        self.bulk_tokens = min(self.bulk_tokens, self.bulk_burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.bulk_tokens = min(self.bulk_burst, self.bulk_tokens + elapsed * self.bulk_rate)
+
+    async def acquire(self, bulk: bool):
+        self._refill()
+        if not self._interactive and self.tokens >= 1:
+            if not bulk:
+                self.tokens -= 1
+                return
+            if not self._bulk and self.bulk_tokens >= 1:
+                self.tokens -= 1
+                self.bulk_tokens -= 1
+                return
+
+        waiter = asyncio.get_running_loop().create_future()
+        (self._bulk if bulk else self._interactive).append(waiter)
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await waiter
+
+    async def _pump(self):
+        while self._interactive or self._bulk:
+            self._refill()
+            if self.tokens >= 1:
+                if self._interactive:
+                    if _grant(self._interactive.popleft()):
+                        self.tokens -= 1
+                    continue
+                if self.bulk_tokens >= 1:
+                    if _grant(self._bulk.popleft()):
+                        self.tokens -= 1
+                        self.bulk_tokens -= 1
+                    continue
+                wait = (1 - self.bulk_tokens) / self.bulk_rate
+            else:
+                wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._interactive) + len(self._bulk)
+
+
+def _grant(waiter: asyncio.Future) -> bool:
+    if waiter.done():  # ожидающий отменён
+        return False
+    waiter.set_result(None)
+    return True
+
+
+class _Pending:
+    __slots__ = ("text", "kwargs", "bulk", "future")
+
+    def __init__(self, text: str, kwargs: dict, bulk: bool, future: asyncio.Future):
+        self.text = text
+        self.kwargs = kwargs
+        self.bulk = bulk
+        self.future = future
+
+
+class _Lane:
+    """Полоса одного чата: очередь, свой bucket и пауза после 429"""
+    __slots__ = ("chat_id", "items", "tokens", "updated", "task")
+
+    def __init__(self, chat_id: int, burst: float):
+        self.chat_id = chat_id
+        self.items: deque[_Pending] = deque()
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SendQueue:
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float,
+                 bulk_share: float, idle_ttl: float = 60.0):
+        self.bot: Optional[Bot] = None
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.idle_ttl = idle_ttl
+        self.limiter = PriorityBucket(global_rate, burst=global_rate, bulk_share=bulk_share)
+        self._lanes: dict[int, _Lane] = {}
+        self.pending = 0
+        self.sent = 0
+        self.merged = 0
+        self.retried = 0
+        self.failed = 0
+
+    def bind(self, bot: Bot):
+        """Бот для отправки; его прямые отправки тоже проходят общий bucket"""
+        self.bot = bot
+        bot.session.middleware(OutboxGate(self))
+
+    def scale(self, processes: int):
+        """Общий темп делится между процессами, отправляющими от имени бота"""
+        rate = self.global_rate / max(1, processes)
+        self.limiter.set_rate(rate, burst=rate)
+
+    def enqueue(self, chat_id: int, text: str, *, bulk: bool = False,
+                **kwargs: Any) -> asyncio.Future:
+        """Ставит сообщение в очередь; future завершится отправленным Message"""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve)
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            lane = self._lanes[chat_id] = _Lane(chat_id, self.chat_burst)
+        lane.items.append(_Pending(text, kwargs, bulk, future))
+        self.pending += 1
+        if lane.task is None:
+            lane.task = asyncio.create_task(self._drain(lane), name=f"send-lane-{chat_id}")
+        return future
+
+    async def send_message(self, chat_id: int, text: str, *, bulk: bool = False,
+                           **kwargs: Any) -> Message:
+        """Как bot.send_message, но через очередь"""
+        return await self.enqueue(chat_id, text, bulk=bulk, **kwargs)
+
+    # ─── Полоса чата ───
+
+    def _chat_wait(self, lane: _Lane) -> float:
+        now = time.monotonic()
+        lane.tokens = min(self.chat_burst, lane.tokens + (now - lane.updated) * self.chat_rate)
+        lane.updated = now
+        if lane.tokens >= 1:
+            lane.tokens -= 1
+            return 0.0
+        return (1 - lane.tokens) / self.chat_rate
+
+    def _take_batch(self, lane: _Lane) -> list[_Pending]:
+        """Первое сообщение полосы и следующие за ним, которые можно склеить"""
+        batch = [lane.items.popleft()]
+        length = len(batch[0].text)
+        while lane.items and not lane.items[0].future.cancelled() \
+                and _mergeable(batch[-1], lane.items[0], length):
+            item = lane.items.popleft()
+            length += len(MERGE_SEPARATOR) + len(item.text)
+            batch.append(item)
+        return batch
+
+    async def _drain(self, lane: _Lane):
+        try:
+            while lane.items:
+                if lane.items[0].future.cancelled():  # отправитель передумал
+                    lane.items.popleft()
+                    self.pending -= 1
+                    continue
+                wait = self._chat_wait(lane)
+                if wait:
+                    await asyncio.sleep(wait)
+                    continue
+                batch = self._take_batch(lane)
+                await self.limiter.acquire(all(item.bulk for item in batch))
+                live = [item for item in batch if not item.future.cancelled()]
+                self.pending -= len(batch) - len(live)
+                if live:
+                    await self._deliver(lane, live)
+        finally:
+            lane.task = None
+
+    async def _deliver(self, lane: _Lane, batch: list[_Pending]):
+        text = MERGE_SEPARATOR.join(item.text for item in batch)
+        kwargs = batch[-1].kwargs
+        for attempt in range(MAX_RETRIES + 1):
+            token = _from_outbox.set(True)
+            try:
+                message = await self.bot.send_message(lane.chat_id, text, **kwargs)
+                break
+            except TelegramRetryAfter as e:
+                if attempt == MAX_RETRIES:
+                    _resolve(batch, error=e)
+                    self.failed += len(batch)
+                    self.pending -= len(batch)
+                    return
+                self.retried += 1
+                logger.warning(f"429 for chat {lane.chat_id}, retry in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                # В рассылках заблокировавшие бота — обычное дело: DEBUG, итог пишет кампания
+                logger.log(logging.DEBUG if batch[0].bulk else logging.WARNING,
+                           f"Send to chat {lane.chat_id} failed: {e}")
+                _resolve(batch, error=e)
+                self.failed += len(batch)
+                self.pending -= len(batch)
+                return
+            finally:
+                _from_outbox.reset(token)
+        _resolve(batch, result=message)
+        self.sent += 1
+        self.merged += len(batch) - 1
+        self.pending -= len(batch)
+
+    def evict_idle(self) -> int:
+        """Выкидывает простаивающие полосы — их bucket всё равно уже полон"""
+        threshold = time.monotonic() - self.idle_ttl
+        stale = [chat_id for chat_id, lane in self._lanes.items()
+                 if lane.task is None and not lane.items and lane.updated < threshold]
+        for chat_id in stale:
+            del self._lanes[chat_id]
+        return len(stale)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "lanes": len(self._lanes),
+            "waiting_tokens": self.limiter.waiting,
+            "sent": self.sent,
+            "merged": self.merged,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+class OutboxGate(BaseRequestMiddleware):
+    """Прямые отправки мимо полос ждут токен общего bucket как интерактивные"""
+
+    def __init__(self, queue: SendQueue):
+        self.queue = queue
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, SEND_METHODS) and not _from_outbox.get():
+            await self.queue.limiter.acquire(bulk=False)
+        return await make_request(bot, method)
+
+
+def _mergeable(prev: _Pending, item: _Pending, length: int) -> bool:
+    """Склеиваем тексты с одинаковыми параметрами; клавиатура — только у последнего"""
+    if prev.kwargs.get("reply_markup") is not None or prev.bulk != item.bulk:
+        return False
+    if prev.kwargs.get("parse_mode") != item.kwargs.get("parse_mode"):
+        return False
+    if set(item.kwargs) - {"parse_mode", "reply_markup"}:
+        return False
+    return length + len(MERGE_SEPARATOR) + len(item.text) <= MAX_TEXT
+
+
+def _retrieve(future: asyncio.Future):
+    # Ошибку уже залогировали; без этого asyncio ругается на неполученное исключение,
+    # если отправку поставили «выстрелил и забыл»
+    if not future.cancelled():
+        future.exception()
+
+
+def _resolve(batch: list[_Pending], result: Message = None, error: BaseException = None):
+    for item in batch:
+        if item.future.done():
+            continue
+        if error is not None:
+            item.future.set_exception(error)
+        else:
+            item.future.set_result(result)
+
+
+outbox = SendQueue(
+    global_rate=config.SEND_GLOBAL_RATE,
+    chat_rate=config.SEND_CHAT_RATE,
+    chat_burst=config.SEND_CHAT_BURST,
+    bulk_share=config.SEND_BULK_SHARE
+)
+
+registry.callback("bot_outbox_pending", "Messages waiting in the send queue", "gauge",
+                  lambda: outbox.pending)
+registry.callback("bot_outbox_sent_total", "Messages sent through the queue", "counter",
+                  lambda: outbox.sent)
+registry.callback("bot_outbox_merged_total", "Messages merged into a previous one", "counter",
+                  lambda: outbox.merged)
+registry.callback("bot_outbox_retried_total", "Sends retried after 429", "counter",
+                  lambda: outbox.retried)
+registry.callback("bot_outbox_failed_total", "Messages that could not be sent", "counter",
+                  lambda: outbox.failed)
@@ -0,0 +1,36 @@
+# serialization.py
+"""
+Компактная сериализация состояний и блобов.
+
+Формат: 1 байт заголовка + тело. Короткие записи хранятся как UTF-8 JSON
+без пробелов, длинные — дополнительно сжимаются zlib (рецепты с шагами
+ужимаются в 3-4 раза).
+"""
+import json
+import zlib
+
+_RAW = b"j"
+_ZLIB = b"z"
+COMPRESS_FROM = 512  # байт
+
+
+def dumps_json(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def pack(obj) -> bytes:
+    body = dumps_json(obj).encode("utf-8")
+    if len(body) >= COMPRESS_FROM:
+        return _ZLIB + zlib.compress(body, 6)
+    return _RAW + body
+
+
+def unpack(blob: bytes):
+    if not blob:
+        return None
+    header, body = blob[:1], blob[1:]
+    if header == _ZLIB:
+        body = zlib.decompress(body)
+    elif header != _RAW:
+        raise ValueError(f"Unknown blob header: {header!r}")
+    return json.loads(body)
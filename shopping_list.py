@@ -0,0 +1,286 @@
+# shopping_list.py
+"""
+Сводный список покупок для плана питания — без запроса к GigaChat.
+
+Количество ингредиента («200 г», «1,5 кг», «2 ст. л.», «3 шт») разбирается
+в каноничные единицы: граммы, миллилитры, штуки; пучки, щепотки и
+упаковки остаются как есть. Ингредиенты всех 21 приёма пищи сводятся за
+один проход по каноничному имени food_lexicon («куриное филе» и
+«курица» — одна строка; укроп и петрушка — разные, группы не
+склеиваются), цена считается по таблице PRICES — по продукту или его
+группе.
+"""
+import math
+import re
+from html import escape
+from typing import NamedTuple, Optional
+
+from food_lexicon import SYNONYMS, canonical, categories, concepts
+from product_matcher import BASIC_PRODUCTS, normalize
+from recipe_render import PAGE_LIMIT, tg_len
+
+
+class Quantity(NamedTuple):
+    value: float
+    unit: str
+
+
+# Единица → (каноничная единица, множитель); порядок — от длинных написаний к коротким
+_UNITS = [
+    (r"столов\w*\s+ложк\w*|ст\.?\s*л\.?", "мл", 15),
+    (r"чайн\w*\s+ложк\w*|ч\.?\s*л\.?", "мл", 5),
+    (r"килограмм\w*|кг", "г", 1000),
+    (r"миллиграмм\w*|мг", "г", 0.001),
+    (r"грамм\w*|гр\.?|г\.?", "г", 1),
+    (r"миллилитр\w*|мл", "мл", 1),
+    (r"литр\w*|л\.?", "мл", 1000),
+    (r"стакан\w*", "мл", 250),
+    (r"штук\w*|шт\.?|зубч\w*|головк\w*|клубн\w*", "шт", 1),
+    (r"пуч\w*", "пуч.", 1),
+    (r"щепот\w*", "щеп.", 1),
+    (r"банк\w*|бан\.?", "бан.", 1),
+    (r"упаковк\w*|уп\.?|пачк\w*", "уп.", 1),
+]
+_UNIT_RE = [(re.compile(rf"(?:{pattern})(?![а-яё])"), unit, factor)
+            for pattern, unit, factor in _UNITS]
+
+_FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75, "⅓": 1 / 3, "⅔": 2 / 3}
+_NUMBER = r"\d+(?:[.,]\d+)?(?:\s*/\s*\d+)?|[½¼¾⅓⅔]"
+_AMOUNT_RE = re.compile(
+    rf"(?<![\w.,])({_NUMBER})(?:\s*[-–—]\s*({_NUMBER}))?\s*"
+    rf"((?:[а-яё]+\.?\s*){{0,2}})",
+    re.IGNORECASE
+)
+_SEPARATOR_RE = re.compile(r"\s+[—–-]\s+|:\s*")
+_TRIM = " \t—–-:,;()."
+# «соль по вкусу», «зелень (для подачи)» — хвост не часть названия
+_SERVING_RE = re.compile(r"[\s,(]+(?:по\s+вкусу|для\s+подачи)[\s).]*$", re.IGNORECASE)
+
+# Примерные цены: продукт или группа → (единица, за сколько единиц, ₽).
+# Миллилитры и граммы считаются один к одному — для продуктов это близко к правде.
+PRICES: dict[str, tuple[str, float, int]] = {
+    "курица": ("г", 1000, 330),
+    "индейка": ("г", 1000, 520),
+    "говядина": ("г", 1000, 750),
+    "свинина": ("г", 1000, 450),
+    "баранина": ("г", 1000, 900),
+    "фарш": ("г", 1000, 450),
+    "колбаса": ("г", 1000, 700),
+    "ветчина": ("г", 1000, 750),
+    "бекон": ("г", 1000, 900),
+    "сосиски": ("г", 1000, 550),
+    "рыба": ("г", 1000, 450),
+    "лосось": ("г", 1000, 1700),
+    "креветки": ("г", 1000, 1200),
+    "яйцо": ("шт", 10, 120),
+    "молоко": ("мл", 1000, 95),
+    "кефир": ("мл", 1000, 110),
+    "ряженка": ("мл", 1000, 120),
+    "сметана": ("г", 1000, 320),
+    "сливки": ("мл", 1000, 450),
+    "творог": ("г", 1000, 500),
+    "сыр": ("г", 1000, 900),
+    "йогурт": ("г", 1000, 300),
+    "сливочное масло": ("г", 1000, 1100),
+    "маргарин": ("г", 1000, 400),
+    "растительное масло": ("мл", 1000, 180),
+    "оливковое масло": ("мл", 1000, 900),
+    "картофель": ("г", 1000, 50),
+    "морковь": ("г", 1000, 55),
+    "лук": ("г", 1000, 45),
+    "зеленый лук": ("пуч.", 1, 60),
+    "чеснок": ("шт", 1, 15),
+    "помидор": ("г", 1000, 250),
+    "томатная паста": ("г", 1000, 350),
+    "кетчуп": ("г", 1000, 250),
+    "огурец": ("г", 1000, 200),
+    "капуста": ("г", 1000, 45),
+    "брокколи": ("г", 1000, 450),
+    "цветная капуста": ("г", 1000, 300),
+    "перец болгарский": ("г", 1000, 350),
+    "кабачок": ("г", 1000, 120),
+    "баклажан": ("г", 1000, 200),
+    "тыква": ("г", 1000, 80),
+    "свекла": ("г", 1000, 50),
+    "грибы": ("г", 1000, 400),
+    "зелень": ("пуч.", 1, 60),
+    "салат": ("г", 1000, 600),
+    "яблоко": ("г", 1000, 150),
+    "банан": ("г", 1000, 140),
+    "лимон": ("шт", 1, 40),
+    "рис": ("г", 1000, 130),
+    "гречка": ("г", 1000, 110),
+    "овсянка": ("г", 1000, 120),
+    "макароны": ("г", 1000, 160),
+    "мука": ("г", 1000, 70),
+    "хлеб": ("г", 1000, 150),
+    "фасоль": ("г", 1000, 220),
+    "горох": ("г", 1000, 120),
+    "зеленый горошек": ("г", 1000, 300),
+    "нут": ("г", 1000, 250),
+    "кукуруза": ("г", 1000, 300),
+    "мед": ("г", 1000, 700),
+    "орехи": ("г", 1000, 1200),
+    "майонез": ("г", 1000, 300),
+    "соевый соус": ("мл", 1000, 400),
+}
+
+# Средний вес штуки — чтобы посчитать цену «2 шт» по цене за килограмм
+PIECE_GRAMS = {
+    "картофель": 120, "морковь": 100, "лук": 100, "помидор": 120, "огурец": 120,
+    "перец болгарский": 150, "кабачок": 300, "баклажан": 250, "яблоко": 180,
+    "банан": 150, "капуста": 1500, "свекла": 250, "курица": 1500,
+}
+
+
+def _number(text: str) -> float:
+    text = text.replace(" ", "")
+    if text in _FRACTIONS:
+        return _FRACTIONS[text]
+    if "/" in text:
+        num, den = text.split("/")
+        return float(num.replace(",", ".")) / float(den) if float(den) else 0.0
+    return float(text.replace(",", "."))
+
+
+def _unit(text: str) -> tuple[str, float, int]:
+    """Единица в начале text → (каноничная единица, множитель, сколько символов занято)"""
+    text = text.lower()
+    for pattern, unit, factor in _UNIT_RE:
+        match = pattern.match(text)
+        if match:
+            return unit, factor, match.end()
+    return "шт", 1, 0
+
+
+def parse_amount(text: str) -> Optional[Quantity]:
+    """«1,5 кг» → (1500, г), «2 ст. л.» → (30, мл), «3» → (3, шт); «по вкусу» → None"""
+    match = _AMOUNT_RE.search(text or "")
+    if not match:
+        return None
+    # Диапазон «2-3 шт» — берём верхнюю границу
+    value = _number(match.group(2) or match.group(1))
+    unit, factor, _ = _unit(match.group(3))
+    return Quantity(value * factor, unit)
+
+
+def split_ingredient(item) -> tuple[str, Optional[Quantity]]:
+    """«курица — 200 г», «200 г курицы», {"name": ..., "amount": ...} → (название, количество)"""
+    if isinstance(item, dict):
+        name = _SERVING_RE.sub("", str(item.get("name", ""))).strip()
+        return name, parse_amount(str(item.get("amount", "")))
+    text = _SERVING_RE.sub("", str(item))
+    parts = _SEPARATOR_RE.split(text, maxsplit=1)
+    if len(parts) == 2:
+        return parts[0].strip(_TRIM), parse_amount(parts[1])
+    match = _AMOUNT_RE.search(text)
+    if not match:
+        return text.strip(_TRIM), None
+    unit, factor, used = _unit(match.group(3))
+    end = match.start(3) + used
+    value = _number(match.group(2) or match.group(1))
+    name = (text[:match.start()] + " " + text[end:]).strip(_TRIM)
+    return " ".join(name.split()), Quantity(value * factor, unit)
+
+
+def format_quantity(value: float, unit: str) -> str:
+    if unit == "г" and value >= 1000:
+        value, unit = value / 1000, "кг"
+    elif unit == "мл" and value >= 1000:
+        value, unit = value / 1000, "л"
+    elif unit == "шт":
+        value = math.ceil(value - 1e-9)
+    text = f"{round(value, 1):g}".replace(".", ",")
+    return f"{text} {unit}"
+
+
+def _price(concept: Optional[str], totals: dict[str, float]) -> int:
+    if concept not in PRICES:
+        return 0
+    unit, per, rub = PRICES[concept]
+    mass_volume = {"г", "мл"}
+    amount = 0.0
+    for u, v in totals.items():
+        if u == unit or (u in mass_volume and unit in mass_volume):
+            amount += v
+        elif u == "шт" and unit == "г" and concept in PIECE_GRAMS:
+            amount += v * PIECE_GRAMS[concept]
+    if unit == "шт":
+        amount = math.ceil(amount - 1e-9)
+    return round(amount / per * rub)
+
+
+# Базовые продукты в каноничной форме: «перец чёрный молотый» и «перец черный молотый» — одно
+_BASIC_KEYS = frozenset(canonical(normalize(p)) or normalize(p) for p in BASIC_PRODUCTS)
+
+
+def aggregate(plan: dict) -> list[dict]:
+    """
+    Все ингредиенты плана (день → приём пищи → ingredients) — одним проходом
+    в сводный список: название, количество, примерная цена
+    """
+    lines: dict[str, dict] = {}
+    for day in plan.values():
+        if not isinstance(day, dict):
+            continue
+        for meal in day.values():
+            if not isinstance(meal, dict):
+                continue
+            for item in meal.get("ingredients") or []:
+                name, quantity = split_ingredient(item)
+                normalized = normalize(name)
+                key = canonical(normalized) or normalized
+                if not normalized or normalized in BASIC_PRODUCTS or key in _BASIC_KEYS:
+                    continue
+                line = lines.get(key)
+                if line is None:
+                    # Цена — по самому продукту, а если его нет в таблице — по группе
+                    priced = (sorted(c for c in concepts(normalized) if c in PRICES)
+                              or sorted(c for c in categories(normalized) if c in PRICES))
+                    line = lines[key] = {
+                        "name": key if key in SYNONYMS else name.lower(),
+                        "concept": key if key in PRICES else (priced[-1] if priced else None),
+                        "totals": {}
+                    }
+                if quantity:
+                    totals = line["totals"]
+                    totals[quantity.unit] = totals.get(quantity.unit, 0) + quantity.value
+
+    result = []
+    for line in lines.values():
+        totals = line["totals"]
+        amount = " + ".join(format_quantity(v, u) for u, v in totals.items()) or "по вкусу"
+        result.append({
+            "name": line["name"],
+            "amount": amount,
+            "estimated_price": _price(line["concept"], totals)
+        })
+    result.sort(key=lambda i: i["name"])
+    return result
+
+
+def format_pages(items: list[dict], title: str = "🛒 <b>Список покупок на неделю</b>") -> list[str]:
+    """Список → HTML-страницы в лимите Telegram, итог — в конце последней"""
+    lines = [f"{title}\n"]
+    total = 0
+    for i, item in enumerate(items, 1):
+        price = item.get("estimated_price", 0)
+        total += price
+        line = f"<b>{i}.</b> {escape(item['name'])} — {escape(item['amount'])}"
+        if price:
+            line += f" (~{price} ₽)"
+        lines.append(line)
+    if total:
+        lines.append(f"\n💰 <b>Итого: ~{total} ₽</b>")
+    lines.append("<i>Цены приблизительные</i>")
+
+    pages, current, size = [], [], 0
+    for line in lines:
+        length = tg_len(line) + 1
+        if current and size + length > PAGE_LIMIT:
+            pages.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += length
+    pages.append("\n".join(current))
+    return pages
@@ -7,6 +7,8 @@ import httpx
 from typing import Optional
 
 from config import config
+from metrics import track
+from tracing import TracingTransport
 
 logger = logging.getLogger(__name__)
 
@@ -31,13 +33,14 @@ class SaluteSpeechService:
         ctx.verify_mode = ssl.CERT_NONE
         return ctx
 
+    @track("salutespeech", "token")
     async def _get_token(self) -> str:
         if self.access_token and time.time() < self.token_expires:
             return self.access_token
 
         logger.info("Getting SaluteSpeech token...")
 
-        async with httpx.AsyncClient(verify=self._ssl(), timeout=15.0) as client:
+        async with httpx.AsyncClient(transport=TracingTransport(verify=self._ssl()), timeout=15.0) as client:
             response = await client.post(
                 self.AUTH_URL,
                 headers={
@@ -61,6 +64,7 @@ class SaluteSpeechService:
             logger.info("SaluteSpeech token OK")
             return self.access_token
 
+    @track("salutespeech", "voice")
     async def recognize_from_telegram_voice(self, voice_bytes: bytes) -> str:
         """
         Распознавание голосового сообщения Telegram (OGG Opus).
@@ -80,7 +84,7 @@ class SaluteSpeechService:
             return ""
 
         try:
-            async with httpx.AsyncClient(verify=self._ssl(), timeout=30.0) as client:
+            async with httpx.AsyncClient(transport=TracingTransport(verify=self._ssl()), timeout=30.0) as client:
                 response = await client.post(
                     self.RECOGNIZE_URL,
                     headers={
@@ -90,14 +94,14 @@ class SaluteSpeechService:
                     content=voice_bytes
                 )
 
-                logger.info(f"Recognize response: {response.status_code}")
+                logger.debug("Recognize response: %s", response.status_code)
 
                 if response.status_code != 200:
                     logger.error(f"Recognize error: {response.text}")
                     return ""
 
                 data = response.json()
-                logger.info(f"Recognize result: {data}")
+                logger.debug("Recognize result: %s", data)
 
                 # Извлекаем текст
                 results = data.get("result", [])
@@ -126,6 +130,7 @@ class SaluteSpeechService:
             logger.error(f"SaluteSpeech error: {e}", exc_info=True)
             return ""
 
+    @track("salutespeech", "audio")
     async def recognize_from_telegram_audio(self, audio_bytes: bytes,
                                              mime_type: str = "audio/mpeg") -> str:
         """Распознавание аудиофайлов (mp3, wav)"""
@@ -148,7 +153,7 @@ class SaluteSpeechService:
             return ""
 
         try:
-            async with httpx.AsyncClient(verify=self._ssl(), timeout=30.0) as client:
+            async with httpx.AsyncClient(transport=TracingTransport(verify=self._ssl()), timeout=30.0) as client:
                 response = await client.post(
                     self.RECOGNIZE_URL,
                     headers={
@@ -0,0 +1,29 @@
+# tests/conftest.py
+"""
+Модули читают config при импорте — задаём окружение до первого импорта.
+База — отдельный SQLite-файл на прогон.
+"""
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-token")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///" + os.path.join(
+    tempfile.mkdtemp(prefix="whattoeat-tests-"), "test.db"))
+os.environ.setdefault("LOG_FORMAT", "text")
+
+
+@pytest.fixture(scope="session")
+def run():
+    """Один event loop на прогон: пул соединений aiosqlite к нему привязан"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def db(run):
+    from database import init_db
+    run(init_db())
@@ -0,0 +1,50 @@
+import itertools
+
+import pytest
+
+from food_lexicon import CATEGORIES, SYNONYMS, canonical, categories, concepts, unique_products
+
+
+@pytest.mark.parametrize("variant, product", [
+    ("куриное филе", "курица"),
+    ("куриные грудки", "курица"),
+    ("томаты", "помидор"),
+    ("картошка", "картофель"),
+])
+def test_synonyms_share_canonical_name(variant, product):
+    assert canonical(variant) == canonical(product) == product
+
+
+@pytest.mark.parametrize("group, member", [
+    (group, member) for group, members in CATEGORIES.items() for member in members
+])
+def test_group_member_is_not_a_synonym(group, member):
+    """Продукт группы — свой продукт, а не вариант названия группы"""
+    assert canonical(member) != canonical(group)
+    assert group in categories(member)
+    assert group not in concepts(member)
+
+
+@pytest.mark.parametrize("group", sorted(CATEGORIES))
+def test_group_members_stay_apart(group):
+    for a, b in itertools.combinations(CATEGORIES[group], 2):
+        assert canonical(a) != canonical(b), (a, b)
+        assert concepts(a).isdisjoint(concepts(b)), (a, b)
+
+
+def test_categories_members_are_known_products():
+    for members in CATEGORIES.values():
+        for member in members:
+            assert member in SYNONYMS, member
+
+
+def test_categories_examples():
+    assert categories("моцарелла") == {"сыр"}
+    assert categories("свежий укроп") == {"зелень"}
+    assert categories("зелень") == frozenset()
+    assert categories("курица") == frozenset()
+
+
+def test_unique_products_merges_synonyms_only():
+    assert unique_products(["курица", "Куриное филе", "лук"]) == ["курица", "лук"]
+    assert unique_products(["укроп", "петрушка", "зелень"]) == ["укроп", "петрушка", "зелень"]
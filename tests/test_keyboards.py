@@ -0,0 +1,39 @@
+# tests/test_keyboards.py
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import SendMessage
+
+from keyboards import MarkupCacheSession, main_menu_keyboard
+
+
+def _fields(form) -> dict:
+    return {options["name"]: value for options, _, value in form._fields}
+
+
+def test_markup_json_is_cached_by_object():
+    session = MarkupCacheSession()
+    bot = Bot("123456:TEST-token", session=session)
+    markup = main_menu_keyboard()
+
+    first = session.build_form_data(bot, SendMessage(chat_id=1, text="a", reply_markup=markup))
+    second = session.build_form_data(bot, SendMessage(chat_id=2, text="b", reply_markup=markup))
+
+    assert (session.misses, session.hits) == (1, 1)
+    assert _fields(first)["reply_markup"] == _fields(second)["reply_markup"]
+
+
+def test_form_matches_plain_session():
+    markup = main_menu_keyboard()
+    method = SendMessage(chat_id=1, text="a", reply_markup=markup)
+    cached = MarkupCacheSession()
+    plain = AiohttpSession()
+    bot = Bot("123456:TEST-token", session=cached)
+
+    assert _fields(cached.build_form_data(bot, method)) == _fields(plain.build_form_data(bot, method))
+
+
+def test_methods_without_markup_are_not_cached():
+    session = MarkupCacheSession()
+    bot = Bot("123456:TEST-token", session=session)
+    session.build_form_data(bot, SendMessage(chat_id=1, text="a"))
+    assert (session.misses, session.hits) == (0, 0)
@@ -0,0 +1,78 @@
+import asyncio
+import itertools
+
+import pytest
+from sqlalchemy import select
+
+from database import PaymentDB, PaymentEventDB, UserDB, async_session
+from models import PaymentEvent
+
+_ids = itertools.count(2000)
+
+
+def _payment(run) -> tuple[int, str]:
+    telegram_id = next(_ids)
+    payment_id = f"pay-{telegram_id}"
+    run(UserDB.get_or_create(telegram_id))
+    run(PaymentDB.create(telegram_id, payment_id, 299.0))
+    return telegram_id, payment_id
+
+
+def _event(run, payment_id: str) -> PaymentEvent:
+    run(PaymentEventDB.add(f"payment.succeeded:{payment_id}", "payment.succeeded",
+                           payment_id, {"object": {"id": payment_id}}))
+
+    async def load():
+        async with async_session() as session:
+            return (await session.execute(
+                select(PaymentEvent).where(PaymentEvent.payment_id == payment_id)
+            )).scalar_one()
+    return run(load())
+
+
+def test_concurrent_success_applies_once(run, db):
+    telegram_id, payment_id = _payment(run)
+
+    async def race():
+        return await asyncio.gather(*(
+            PaymentDB.apply_status(payment_id, "succeeded", telegram_id=telegram_id)
+            for _ in range(5)
+        ))
+    assert sorted(run(race())) == [False] * 4 + [True]
+
+    user = run(UserDB.get_or_create(telegram_id))
+    assert user.is_premium
+
+
+def test_repeat_marks_event_done_without_extending(run, db):
+    telegram_id, payment_id = _payment(run)
+    run(PaymentDB.apply_status(payment_id, "succeeded", telegram_id=telegram_id))
+    until = run(UserDB.get_or_create(telegram_id)).premium_until
+
+    event = _event(run, payment_id)
+    assert not run(PaymentDB.apply_status(payment_id, "succeeded", telegram_id=telegram_id,
+                                          event_id=event.id))
+    assert run(UserDB.get_or_create(telegram_id)).premium_until == until
+    assert _event(run, payment_id).status == "done"
+
+
+def test_missing_payment_keeps_event_for_retry(run, db):
+    event = _event(run, "pay-unknown")
+    with pytest.raises(LookupError):
+        run(PaymentDB.apply_status("pay-unknown", "succeeded", telegram_id=next(_ids),
+                                   event_id=event.id))
+    assert _event(run, "pay-unknown").status == "new"
+
+
+def test_sync_applies_status_from_yookassa(run, db, monkeypatch):
+    from payment_service import PaymentService
+    telegram_id, payment_id = _payment(run)
+
+    async def check_payment(pid):
+        return {"id": pid, "status": "succeeded",
+                "metadata": {"telegram_id": str(telegram_id), "months": "1"}}
+    monkeypatch.setattr(PaymentService, "check_payment", staticmethod(check_payment))
+
+    assert run(PaymentService.sync_payment(payment_id))["activated"]
+    assert not run(PaymentService.sync_payment(payment_id))["activated"]
+    assert run(PaymentDB.get_by_yukassa_id(payment_id)).status == "succeeded"
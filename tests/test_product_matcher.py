@@ -0,0 +1,56 @@
+import pytest
+
+from product_matcher import ProductMatcher, matcher_for, normalize
+
+# (продукты пользователя, ингредиент рецепта, есть ли)
+MATRIX = [
+    # точное совпадение и регистр
+    (["Курица"], "курица", True),
+    (["молоко"], "Молоко!", True),
+    # продукт внутри ингредиента и наоборот
+    (["сыр"], "сыр твердый", True),
+    (["сливочное масло"], "масло", True),
+    # корень слова
+    (["картошка"], "картошку", True),
+    (["помидоры"], "помидор", True),
+    (["морковь"], "морковка", True),
+    (["рис"], "редис", False),
+    # синонимы
+    (["курица"], "куриное филе", True),
+    (["куриное филе"], "курица", True),
+    (["картофель"], "картошка", True),
+    # группы — только от группы в рецепте к продукту пользователя
+    (["укроп"], "зелень", True),
+    (["зелень"], "укроп", False),
+    (["укроп"], "базилик", False),
+    (["укроп"], "петрушка", False),
+    # ничего общего
+    (["курица"], "говядина", False),
+    ([], "курица", False),
+    (["курица"], "", False),
+]
+
+
+@pytest.mark.parametrize("products, ingredient, expected", MATRIX)
+def test_has(products, ingredient, expected):
+    assert ProductMatcher(products).has(ingredient) is expected
+
+
+def test_has_normalized_input():
+    matcher = ProductMatcher(["Куриное филе"])
+    assert matcher.has(normalize("КУРИЦА"), normalized=True)
+
+
+def test_missing_skips_basic_and_owned():
+    matcher = ProductMatcher(["курица", "лук"])
+    missing = matcher.missing([
+        {"name": "курица", "amount": "500 г"},
+        {"name": "соль", "amount": "по вкусу"},
+        {"name": "сметана", "amount": "200 г", "substitute": "йогурт"},
+        {"name": ""},
+    ])
+    assert missing == [{"name": "сметана", "amount": "200 г", "substitute": "йогурт"}]
+
+
+def test_matcher_for_ignores_order_and_repeats():
+    assert matcher_for(["лук", "курица"]) is matcher_for(["курица", "лук", "лук"])
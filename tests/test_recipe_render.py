@@ -0,0 +1,76 @@
+import random
+import re
+
+import pytest
+
+from recipe_render import paginate, recipe_blocks, split_html, tg_len
+
+_TAG = re.compile(r"<[^>]*>")
+_WORDS = ["курица", "лук", "&amp;", "&lt;3", "🍅", "соус-терияки-по-домашнему" * 3, "\n", "2 ст. л."]
+
+
+def _block(rng: random.Random) -> str:
+    words = []
+    for _ in range(rng.randint(5, 80)):
+        word = rng.choice(_WORDS)
+        roll = rng.random()
+        if roll < 0.15:
+            word = f"<b>{word}</b>"
+        elif roll < 0.25:
+            word = f'<a href="https://example.com/r?id=1">{word} <i>{word}</i></a>'
+        words.append(word)
+    return " ".join(words)
+
+
+def _balanced(html: str) -> bool:
+    stack = []
+    for tag in _TAG.findall(html):
+        if tag.startswith("</"):
+            if not stack or stack.pop() != tag[2:-1]:
+                return False
+        else:
+            stack.append(tag[1:-1].split()[0])
+    return not stack
+
+
+def _text(html: str) -> str:
+    return "".join(_TAG.sub("", html).split())
+
+
+@pytest.mark.parametrize("limit", [60, 100, 400])
+def test_split_html_respects_limit_and_tags(limit):
+    rng = random.Random(limit)
+    for _ in range(200):
+        block = _block(rng)
+        parts = split_html(block, limit)
+        for part in parts:
+            assert tg_len(part) <= limit
+            assert _balanced(part), part
+            # Кусок не обрывается посреди тега или сущности
+            assert "<" not in _TAG.sub("", part)
+            assert not re.search(r"&\w*$|^\w*;", _TAG.sub("", part))
+        assert _text("".join(parts)) == _text(block)
+
+
+def test_split_html_counts_emoji_as_two():
+    parts = split_html("🍅" * 30, 10)
+    assert all(tg_len(part) <= 10 for part in parts)
+    assert "".join(parts) == "🍅" * 30
+
+
+def test_split_html_short_block_unchanged():
+    assert split_html("<b>Омлет</b> за 5 минут", 100) == ["<b>Омлет</b> за 5 минут"]
+
+
+def test_paginate_keeps_pages_under_limit():
+    recipe = {
+        "title": "Суп",
+        "ingredients": [{"name": f"продукт {i}", "amount": "100 г"} for i in range(40)],
+        "steps": [{"step": i, "text": "<Помешивать> & ждать " * 30} for i in range(1, 15)],
+    }
+    blocks = recipe_blocks(recipe, 1)
+    for limit in (300, 1000, 3900):
+        pages = paginate(blocks, limit)
+        assert all(tg_len(page) <= limit for page in pages)
+        assert all(_balanced(page) for page in pages)
+        assert _text("".join(pages)) == _text("".join(blocks))
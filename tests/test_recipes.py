@@ -0,0 +1,62 @@
+# tests/test_recipes.py
+import itertools
+
+from sqlalchemy import func, select
+
+from database import RecipeDB, UserDB, async_session
+from models import Recipe, canonical_recipe, recipe_hash
+
+_ids = itertools.count(1000)
+
+DISH = {
+    "title": "Омлет",
+    "description": "Быстрый завтрак",
+    "ingredients": [
+        {"name": "яйцо", "amount": "3 шт", "have": True},
+        {"name": "молоко", "amount": "50 мл", "have": False, "substitute": "вода"},
+    ],
+    "steps": [{"step": 1, "text": "Взбить"}, {"step": 2, "text": "Пожарить"}],
+    "calories": 300,
+    "tips": "Подавать горячим",
+}
+
+
+def _other_fridge(recipe: dict) -> dict:
+    copy = dict(recipe, description="Другое описание")
+    copy["ingredients"] = [dict(i, have=True, substitute="") for i in recipe["ingredients"]]
+    return copy
+
+
+def test_hash_ignores_per_user_fields():
+    assert recipe_hash(canonical_recipe(DISH)) == recipe_hash(canonical_recipe(_other_fridge(DISH)))
+
+
+def test_hash_matches_legacy_projection():
+    """Строка, собранная миграцией из старых колонок, и новое сохранение — один ключ"""
+    legacy = canonical_recipe({
+        "title": "Омлет",
+        "ingredients": [{"name": "яйцо", "amount": "3 шт", "have": False},
+                        {"name": "молоко", "amount": "50 мл"}],
+        "instructions": "1. Взбить\n\n2. Пожарить",
+        "calories": 300,
+    })
+    assert recipe_hash(legacy) == recipe_hash(canonical_recipe(DISH))
+
+
+def test_same_dish_saved_by_two_users_is_one_row(run, db):
+    first, second = next(_ids), next(_ids)
+    run(UserDB.get_or_create(first))
+    run(UserDB.get_or_create(second))
+    a = run(RecipeDB.save(first, DISH))
+    b = run(RecipeDB.save(second, _other_fridge(DISH)))
+    again = run(RecipeDB.save(first, _other_fridge(DISH)))
+
+    assert a.recipe_hash == b.recipe_hash == again.recipe_hash
+    assert a.id == again.id
+
+    async def count():
+        async with async_session() as session:
+            return (await session.execute(
+                select(func.count()).select_from(Recipe).where(Recipe.hash == a.recipe_hash)
+            )).scalar_one()
+    assert run(count()) == 1
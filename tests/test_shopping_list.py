@@ -0,0 +1,65 @@
+import pytest
+
+from shopping_list import Quantity, aggregate, format_quantity, parse_amount, split_ingredient
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("200 г", Quantity(200, "г")),
+    ("1,5 кг", Quantity(1500, "г")),
+    ("2 ст. л.", Quantity(30, "мл")),
+    ("1 ч.л.", Quantity(5, "мл")),
+    ("0.5 л", Quantity(500, "мл")),
+    ("1 стакан", Quantity(250, "мл")),
+    ("2-3 шт", Quantity(3, "шт")),
+    ("½ пачки", Quantity(0.5, "уп.")),
+    ("3", Quantity(3, "шт")),
+    ("2 зубчика", Quantity(2, "шт")),
+    ("1 пучок", Quantity(1, "пуч.")),
+])
+def test_parse_amount_units(text, expected):
+    assert parse_amount(text) == expected
+
+
+def test_parse_amount_without_number():
+    assert parse_amount("по вкусу") is None
+    assert parse_amount("") is None
+
+
+@pytest.mark.parametrize("item, name, quantity", [
+    ("курица — 200 г", "курица", Quantity(200, "г")),
+    ("молоко: 1 стакан", "молоко", Quantity(250, "мл")),
+    ({"name": "рис", "amount": "1 кг"}, "рис", Quantity(1000, "г")),
+    ("соль по вкусу", "соль", None),
+    ("зелень (для подачи)", "зелень", None),
+    ({"name": "перец по вкусу", "amount": ""}, "перец", None),
+])
+def test_split_ingredient(item, name, quantity):
+    assert split_ingredient(item) == (name, quantity)
+
+
+def test_format_quantity():
+    assert format_quantity(1500, "г") == "1,5 кг"
+    assert format_quantity(250, "мл") == "250 мл"
+    assert format_quantity(2.2, "шт") == "3 шт"
+
+
+def _plan(*ingredients) -> dict:
+    return {"day_1": {"breakfast": {"ingredients": list(ingredients[:2])},
+                      "dinner": {"ingredients": list(ingredients[2:])}}}
+
+
+def test_aggregate_sums_units_across_meals():
+    items = aggregate(_plan("молоко — 200 мл", "яйцо — 2 шт", "молоко — 1 л", "яйцо — 3 шт"))
+    amounts = {item["name"]: item["amount"] for item in items}
+    assert amounts == {"молоко": "1,2 л", "яйцо": "5 шт"}
+
+
+def test_aggregate_keeps_different_units_apart():
+    items = aggregate(_plan("морковь — 2 шт", "морковь — 300 г"))
+    assert [item["amount"] for item in items] == ["2 шт + 300 г"]
+
+
+def test_aggregate_skips_seasonings():
+    items = aggregate(_plan("соль по вкусу", "перец по вкусу",
+                            "перец черный молотый — по вкусу", "курица — 500 г"))
+    assert [item["name"] for item in items] == ["курица"]
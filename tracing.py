@@ -0,0 +1,346 @@
+# tracing.py
+"""
+Трассировка апдейтов.
+
+На каждый апдейт — корневой span, под ним middleware, хэндлер, запросы
+к БД, HTTP-запросы к GigaChat/SaluteSpeech и вызовы Bot API. Текущий
+span живёт в contextvars и сам переходит в дочерние задачи.
+Решение о записи принимается один раз на апдейт (TRACE_SAMPLE_RATE):
+у несэмплированного апдейта span() возвращает пустышку без аллокаций.
+
+Готовые трассы:
+  - самые медленные держатся в памяти — /admin/traces;
+  - при TRACE_EXPORT=file пишутся JSON-строками в TRACE_FILE;
+  - при TRACE_EXPORT=otlp отправляются пачками в OTLP/HTTP JSON на TRACE_OTLP_URL.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Optional
+
+import httpx
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attrs",
+                 "error", "_token")
+
+    def __init__(self, trace: "Trace", parent_id: Optional[str], name: str, attrs: dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attrs = attrs
+        self.error: Optional[str] = None
+        self._token = None
+        trace.spans.append(self)
+
+    def set(self, key: str, value: Any):
+        self.attrs[key] = value
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc)
+        _current.reset(self._token)
+        if self.parent_id is None:
+            tracer.finish_trace(self.trace)
+
+    def as_dict(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start_ns - self.trace.root.start_ns) / 1e6, 2),
+            "duration_ms": round(self.duration_ms, 2),
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class _NullSpan:
+    """Пустышка для несэмплированных апдейтов"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def finish(self, error: Optional[BaseException] = None):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "root")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: list[Span] = []
+        self.root: Optional[Span] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def summary(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.root.start_ns / 1e9)),
+            "duration_ms": round(self.duration_ms, 2),
+            "spans": len(self.spans),
+            "error": any(span.error for span in self.spans),
+            "attrs": self.root.attrs,
+        }
+
+    def as_dict(self) -> dict:
+        return {**self.summary(), "spans": [span.as_dict() for span in self.spans]}
+
+
+class Tracer:
+    def __init__(self, sample_rate: float, keep_slowest: int, exporter: Optional[str]):
+        self.sample_rate = sample_rate
+        self.keep_slowest = keep_slowest
+        self.exporter = exporter
+        self._slowest: list[tuple[float, str, Trace]] = []  # min-heap по длительности
+        self._pending: deque[Trace] = deque(maxlen=10000)
+        self._task: Optional[asyncio.Task] = None
+        self.started = 0
+        self.exported = 0
+
+    # ─── Создание span'ов ───
+
+    def start_trace(self, name: str, **attrs):
+        """Корневой span апдейта — или пустышка, если апдейт не попал в выборку"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return NULL_SPAN
+        self.started += 1
+        trace = Trace()
+        trace.root = Span(trace, None, name, attrs)
+        return trace.root
+
+    @staticmethod
+    def child(name: str, **attrs):
+        """Дочерний span без смены текущего — для колбэков, которые сами закроют его"""
+        parent = _current.get()
+        if parent is None:
+            return None
+        return Span(parent.trace, parent.span_id, name, attrs)
+
+    def finish_trace(self, trace: Trace):
+        entry = (trace.duration_ms, trace.trace_id, trace)
+        if len(self._slowest) < self.keep_slowest:
+            heapq.heappush(self._slowest, entry)
+        elif entry[0] > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+        if self.exporter:
+            self._pending.append(trace)
+
+    # ─── Просмотр ───
+
+    def slowest(self, limit: int = 20) -> list[dict]:
+        traces = sorted(self._slowest, key=lambda e: e[0], reverse=True)[:limit]
+        return [trace.summary() for _, _, trace in traces]
+
+    def get(self, trace_id: str) -> Optional[dict]:
+        for _, tid, trace in self._slowest:
+            if tid == trace_id:
+                return trace.as_dict()
+        return None
+
+    # ─── Экспорт ───
+
+    def start(self):
+        if self.exporter and self._task is None:
+            self._task = asyncio.create_task(self._export_loop(), name="trace-exporter")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self._flush()
+        except Exception as e:
+            logger.warning(f"Trace export failed: {e}")
+
+    async def _export_loop(self):
+        while True:
+            await asyncio.sleep(5)
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.warning(f"Trace export failed: {e}")
+
+    async def _flush(self):
+        batch = []
+        while self._pending:
+            batch.append(self._pending.popleft())
+        if not batch:
+            return
+        if self.exporter == "file":
+            lines = "".join(json.dumps(t.as_dict(), ensure_ascii=False, default=str) + "\n"
+                            for t in batch)
+            await asyncio.to_thread(_append, config.TRACE_FILE, lines)
+        elif self.exporter == "otlp":
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.post(config.TRACE_OTLP_URL, json=_otlp(batch))
+                response.raise_for_status()
+        self.exported += len(batch)
+
+
+def _append(path: str, text: str):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp(traces: list[Trace]) -> dict:
+    """Пачка трасс в формате OTLP/HTTP JSON (ExportTraceServiceRequest)"""
+    spans = []
+    for trace in traces:
+        for span in trace.spans:
+            item = {
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attrs.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                item["parentSpanId"] = span.parent_id
+            spans.append(item)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "whattoeat-bot"}}]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+    }]}
+
+
+tracer = Tracer(
+    sample_rate=config.TRACE_SAMPLE_RATE,
+    keep_slowest=config.TRACE_KEEP_SLOWEST,
+    exporter=config.TRACE_EXPORT or None
+)
+
+
+async def traces_view(request):
+    """/admin/traces — самые медленные трассы, /admin/traces/{trace_id} — span'ы одной"""
+    from aiohttp import web
+    trace_id = request.match_info.get("trace_id")
+    if trace_id:
+        trace = tracer.get(trace_id)
+        return web.json_response(trace, dumps=_dumps) if trace else web.Response(status=404)
+    limit = int(request.query.get("limit", 20))
+    return web.json_response(tracer.slowest(limit), dumps=_dumps)
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+def span(name: str, **attrs):
+    """with span("gigachat.parse"): ... — дочерний span текущего апдейта"""
+    parent = _current.get()
+    if parent is None:
+        return NULL_SPAN
+    return Span(parent.trace, parent.span_id, name, attrs)
+
+
+def traced(name: str):
+    """Декоратор: span на каждый вызов функции (sync и async)"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracingTransport(httpx.AsyncHTTPTransport):
+    """Транспорт httpx со span'ом на каждый запрос"""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with span("http " + request.method, host=request.url.host, path=request.url.path) as s:
+            response = await super().handle_async_request(request)
+            s.set("status", response.status_code)
+            return response
+
+
+def trace_queries(engine):
+    """Span на каждый SQL-запрос через события SQLAlchemy"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("trace_spans", []).append(
+            tracer.child("db", statement=statement[:120])
+        )
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        db_span = conn.info["trace_spans"].pop()
+        if db_span is not None:
+            db_span.finish()
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def on_error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("trace_spans") if conn is not None else None
+        if spans:
+            db_span = spans.pop()
+            if db_span is not None:
+                db_span.finish(exception_context.original_exception)
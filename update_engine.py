@@ -0,0 +1,170 @@
+# update_engine.py
+"""
+Фоновая обработка апдейтов из webhook.
+
+Webhook сразу отвечает Telegram 200, апдейт кладётся в очередь и
+обрабатывается пулом воркеров. Сообщения одного чата идут строго по
+порядку, разные чаты — параллельно. Нажатия кнопок не упорядочиваются:
+это независимые действия, дубли гасит SingleFlightMiddleware.
+При переполнении общей очереди webhook отвечает 503 — Telegram повторит
+позже. Переполнение очереди одного чата (пользователь шлёт сообщения
+быстрее, чем они обрабатываются) — не повод тормозить всех: такой апдейт
+отбрасывается, а Telegram получает 200.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+logger = logging.getLogger(__name__)
+
+_MESSAGE_FIELDS = ("message", "edited_message", "channel_post", "edited_channel_post",
+                   "business_message", "edited_business_message")
+
+
+def ordering_key(update: Dict[str, Any]) -> Hashable:
+    """Ключ очереди: чат для сообщений, уникальный — для всего остального"""
+    for field in _MESSAGE_FIELDS:
+        message = update.get(field)
+        if message:
+            return message["chat"]["id"]
+    return ("unordered", update.get("update_id"))
+
+
+class UpdateEngine:
+    def __init__(self, process: Callable[[Dict[str, Any]], Awaitable[Any]],
+                 workers: int, max_pending: int, max_per_chat: int):
+        self.process = process
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_per_chat = max_per_chat
+
+        self._chats: Dict[Hashable, deque] = {}
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.accepting = False
+
+        self.pending = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    def submit(self, update: Dict[str, Any], key: Optional[Hashable] = None) -> bool:
+        """
+        Кладёт апдейт в очередь. False — общая очередь переполнена, апдейт
+        надо повторить. Апдейт сверх очереди чата отбрасывается (True).
+        """
+        if not self.accepting or self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+
+        key = ordering_key(update) if key is None else key
+        queue = self._chats.get(key)
+        if queue is None:
+            queue = self._chats[key] = deque()
+            self._ready.put_nowait(key)
+        elif len(queue) >= self.max_per_chat:
+            self.dropped += 1
+            logger.warning(f"Chat {key} queue full, update {update.get('update_id')} dropped")
+            return True
+
+        queue.append(update)
+        self.pending += 1
+        self._idle.clear()
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._chats[key]
+            update = queue[0]
+            try:
+                await self.process(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Update {update.get('update_id')} failed: {e}", exc_info=True)
+            finally:
+                queue.popleft()
+                self.pending -= 1
+                # Чат остаётся «занятым», пока в его очереди что-то есть:
+                # следующий апдейт возьмёт любой воркер, но только после этого
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                if not self.pending:
+                    self._idle.set()
+
+    def start(self):
+        self.accepting = True
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker(), name=f"update-worker-{i}")
+                for i in range(self.workers)
+            ]
+        logger.info(f"Update engine started: {self.workers} workers")
+
+    async def stop(self, drain_timeout: float):
+        """Перестаёт принимать апдейты и дорабатывает очередь"""
+        self.accepting = False
+        if self.pending:
+            logger.info(f"Draining {self.pending} pending updates...")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Drain timeout, dropping {self.pending} updates")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "active_chats": len(self._chats),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+        }
+
+
+def dispatcher_processor(dispatcher: Dispatcher, bot: Bot, **data: Any):
+    """Обработка сырого апдейта диспетчером — как в aiogram handle_in_background"""
+    async def process(update: Dict[str, Any]):
+        result = await dispatcher.feed_raw_update(bot=bot, update=update, **data)
+        if isinstance(result, TelegramMethod):
+            await dispatcher.silent_call_request(bot=bot, result=result)
+    return process
+
+
+class EngineRequestHandler(SimpleRequestHandler):
+    """Webhook-хэндлер aiogram, который отдаёт апдейты в UpdateEngine"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, engine: UpdateEngine,
+                 drain_timeout: float, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, **kwargs)
+        self.engine = engine
+        self.drain_timeout = drain_timeout
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        update = await request.json(loads=bot.session.json_loads)
+        if not self.engine.submit(update):
+            return web.Response(status=503, text="Busy")
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        await self.engine.stop(self.drain_timeout)
+        await super().close()
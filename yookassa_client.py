@@ -0,0 +1,142 @@
+# yookassa_client.py
+"""
+Клиенты API ЮKassa (https://api.yookassa.ru/v3).
+
+SDK yookassa синхронный: вызов из корутины останавливает весь event loop
+на время запроса. Здесь два варианта с одним интерфейсом:
+
+  - AsyncYooKassaClient — httpx с пулом соединений, таймаутами и
+    повторами. POST повторяется с тем же Idempotence-Key, поэтому
+    повтор не создаёт второй платёж;
+  - ThreadedYooKassaClient — тот же SDK, но в пуле потоков
+    (YUKASSA_CLIENT=thread) — запасной путь на время перехода.
+
+Оба возвращают объект платежа как dict в формате API.
+"""
+import asyncio
+import json
+import logging
+import random
+import uuid
+from typing import Optional
+
+import httpx
+
+from config import config
+from tracing import TracingTransport
+
+logger = logging.getLogger(__name__)
+
+API_URL = "https://api.yookassa.ru/v3"
+RETRY_STATUSES = {202, 429, 500, 502, 503, 504}
+
+
+class YooKassaError(Exception):
+    def __init__(self, status: int, body: dict):
+        self.status = status
+        self.code = body.get("code", "")
+        super().__init__(f"YooKassa {status}: {body.get('description') or body}")
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    # 202 — запрос с этим ключом ещё обрабатывается, retry_after в миллисекундах
+    if response is not None and response.status_code == 202:
+        try:
+            return min(float(response.json().get("retry_after", 1000)) / 1000, 5.0)
+        except ValueError:
+            pass
+    return min(0.5 * 2 ** attempt, 5.0) * random.uniform(0.5, 1.0)
+
+
+class AsyncYooKassaClient:
+    def __init__(self, shop_id: str, secret_key: str, timeout: float, retries: int):
+        self.shop_id = shop_id
+        self.secret_key = secret_key
+        self.timeout = timeout
+        self.retries = retries
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=API_URL,
+                auth=(self.shop_id, self.secret_key),
+                transport=TracingTransport(
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=5.0)
+            )
+        return self._client
+
+    async def _request(self, method: str, path: str, body: dict = None,
+                       idempotence_key: str = None) -> dict:
+        headers = {"Idempotence-Key": idempotence_key} if idempotence_key else None
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                response = await self._http().request(method, path, json=body, headers=headers)
+                if response.status_code not in RETRY_STATUSES:
+                    if response.status_code >= 400:
+                        raise YooKassaError(response.status_code, _safe_json(response))
+                    return response.json()
+                error = YooKassaError(response.status_code, _safe_json(response))
+            except httpx.TransportError as e:
+                error = e
+            if attempt == self.retries:
+                raise error
+            delay = _retry_delay(attempt, response)
+            logger.warning(f"YooKassa {method} {path} failed ({error}), retry in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def create_payment(self, payload: dict, idempotence_key: str = None) -> dict:
+        return await self._request("POST", "/payments", payload,
+                                   idempotence_key or str(uuid.uuid4()))
+
+    async def get_payment(self, payment_id: str) -> dict:
+        return await self._request("GET", f"/payments/{payment_id}")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class ThreadedYooKassaClient:
+    """SDK yookassa в пуле потоков: loop не блокируется, но на запрос занят поток"""
+
+    def __init__(self, shop_id: str, secret_key: str):
+        from yookassa import Configuration
+        Configuration.configure(shop_id, secret_key)
+
+    async def create_payment(self, payload: dict, idempotence_key: str = None) -> dict:
+        from yookassa import Payment
+        payment = await asyncio.to_thread(Payment.create, payload,
+                                          idempotence_key or str(uuid.uuid4()))
+        return json.loads(payment.json())
+
+    async def get_payment(self, payment_id: str) -> dict:
+        from yookassa import Payment
+        payment = await asyncio.to_thread(Payment.find_one, payment_id)
+        return json.loads(payment.json())
+
+    async def close(self):
+        pass
+
+
+def _safe_json(response: httpx.Response) -> dict:
+    try:
+        return response.json()
+    except ValueError:
+        return {"description": response.text[:200]}
+
+
+def build_yookassa_client():
+    if config.YUKASSA_CLIENT == "thread":
+        return ThreadedYooKassaClient(config.YUKASSA_SHOP_ID, config.YUKASSA_SECRET_KEY)
+    return AsyncYooKassaClient(
+        config.YUKASSA_SHOP_ID, config.YUKASSA_SECRET_KEY,
+        timeout=config.YUKASSA_TIMEOUT, retries=config.YUKASSA_RETRIES
+    )
+
+
+yookassa = build_yookassa_client()